@@ -2,20 +2,28 @@
 基于IPython的Pandas Agent
 使用IPythonExecutor执行pandas代码操作数据文件
 """
+import keyword
 import os
+import re
 import sys
+import threading
 from typing import Optional, List, Dict, Any
 from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from dotenv import load_dotenv
 from tools import IPythonCodeTool, IPythonNotebookTool
-import pandas as pd
+from tools.file_probe import probe_file, profile_files, DEFAULT_PROFILE_TIMEOUT
+from tools.columnar_store import get_columnar_store
+from tools.stats_catalog import lookup_profile
 from pathlib import Path
 import ipykernel
 # 加载环境变量
 load_dotenv()
 
+# 项目根目录，kernel中导入tools模块时加入sys.path
+_REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+
 
 def _ensure_ipykernel_installed():
     """确保 ipykernel 已安装并注册"""
@@ -59,7 +67,11 @@ class PandasAgent:
                  temperature: Optional[float] = None,
                  api_key: Optional[str] = None, 
                  base_url: Optional[str] = None,
-                 notebook_path: str = "pandas_execution_history.ipynb"):
+                 notebook_path: str = "pandas_execution_history.ipynb",
+                 profile_timeout: Optional[float] = DEFAULT_PROFILE_TIMEOUT,
+                 compact_dtypes: bool = False,
+                 preload_data: bool = True,
+                 profile_data: bool = True):
         """
         初始化Pandas Agent
         
@@ -72,6 +84,11 @@ class PandasAgent:
             api_key: API密钥（默认从环境变量读取）
             base_url: API基础URL（默认从环境变量读取）
             notebook_path: notebook保存路径
+            profile_timeout: 每个数据文件画像的超时时间（秒），超时的文件只保留探测信息
+            compact_dtypes: 是否在kernel中使用类型压缩加载数据，以减少内存占用
+            preload_data: 是否在后台把数据文件预加载到kernel的变量中
+            profile_data: 是否在后台进程池中并行计算完整的文件画像（准确的类型、空值数），完成后更新prompt；
+                画像写入统计目录，内容不变的文件下次启动时探测即可得到画像
         """
         # 从环境变量读取配置
         model_name = model_name or os.getenv("OPENAI_MODEL", "gpt-4")
@@ -103,34 +120,67 @@ class PandasAgent:
         
         # 存储字段描述
         self.column_descriptions = column_descriptions or {}
+        self.compact_dtypes = compact_dtypes
+        
+        # 只读取表头、样本行并扫描行数，启动耗时与文件内容无关；prompt和初始化输出共用
+        self.file_infos = [probe_file(path) for path in self.data_files]
+        self.profile_timeout = profile_timeout
+        self._profile_thread: Optional[threading.Thread] = None
+        # 预加载和画像的后台线程都可能重新创建agent
+        self._agent_lock = threading.Lock()
+        
+        # 每个数据文件在kernel中对应的变量名
+        self.preload_data = preload_data
+        self.dataset_variables = self._dataset_variable_names(
+            [info["path"] for info in self.file_infos if info["exists"]]
+        ) if preload_data else {}
+        self.preload_errors: Dict[str, str] = {}
+        self._preload_thread: Optional[threading.Thread] = None
         
         # 初始化工具
         self.ipython_tool = IPythonCodeTool(notebook_path=notebook_path)
         self.notebook_tool = IPythonNotebookTool()
         self.tools = [self.ipython_tool, self.notebook_tool]
         
-        # 创建prompt模板
-        self.prompt = self._create_prompt()
-        
-        # 创建agent
-        self.agent = create_openai_tools_agent(
-            llm=self.llm,
-            tools=self.tools,
-            prompt=self.prompt
-        )
-        
-        # 创建agent执行器
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            verbose=True,
-            handle_parsing_errors=True,
-            max_iterations=15
-        )
+        # 创建prompt和agent；数据信息变化（例如预加载失败）时重新创建
+        self._build_agent()
         
         # 如果提供了数据文件，加载并查看基本信息
         if self.data_files:
             self._initialize_data()
+        
+        # 完整画像（分块扫描全文件）在后台计算，不阻塞启动
+        if profile_data and self.data_files:
+            self._profile_thread = threading.Thread(target=self._profile_datasets, daemon=True)
+            self._profile_thread.start()
+        
+        # 在用户输入第一个问题的同时把数据读入kernel
+        if self.dataset_variables:
+            self._preload_thread = threading.Thread(target=self._preload_datasets, daemon=True)
+            self._preload_thread.start()
+    
+    def _build_agent(self):
+        """根据当前的数据信息创建prompt、agent和agent执行器"""
+        with self._agent_lock:
+            # 创建prompt模板
+            prompt = self._create_prompt()
+            
+            # 创建agent
+            agent = create_openai_tools_agent(
+                llm=self.llm,
+                tools=self.tools,
+                prompt=prompt
+            )
+            
+            # 创建agent执行器
+            self.prompt, self.agent = prompt, agent
+            self.agent_executor = AgentExecutor(
+                agent=agent,
+                tools=self.tools,
+                verbose=True,
+                handle_parsing_errors=True,
+                max_iterations=15
+            )
     
     def _create_prompt(self) -> ChatPromptTemplate:
         """创建prompt模板"""
@@ -139,32 +189,53 @@ class PandasAgent:
         # 处理多个文件
         if self.data_files:
             file_infos = []
-            for i, file_path in enumerate(self.data_files, 1):
-                if Path(file_path).exists():
-                    try:
-                        df = pd.read_csv(file_path)
-                        columns = df.columns.tolist()
-                        
-                        # 如果有字段描述，添加到列信息中
-                        column_list = []
-                        for col in columns:
-                            if col in self.column_descriptions:
-                                column_list.append(f"{col} ({self.column_descriptions[col]})")
-                            else:
-                                column_list.append(col)
-                        
-                        file_infos.append(f"""
-文件{i}: {file_path}
-  - 数据行数: {len(df)}
-  - 数据列: {', '.join(column_list)}
+            # 探测之后其他工具（例如PandasTool的describe）可能已把完整画像写入统计目录
+            self.file_infos = [self._with_catalog_profile(info) for info in self.file_infos]
+            for i, info in enumerate(self.file_infos, 1):
+                file_path = info["path"]
+                variable = self.dataset_variables.get(file_path)
+                variable_info = f"\n  - kernel变量: `{variable}`（已预加载的DataFrame）" if variable else ""
+                if not info["exists"]:
+                    file_infos.append(f"文件{i}: {file_path} (文件不存在)")
+                elif info.get("partial") and info["columns"]:
+                    row_info = f"\n  - 数据行数: {info['row_count']}" if info.get("row_count") is not None else ""
+                    file_infos.append(f"""
+文件{i}: {file_path} (仅部分信息: {info['error']}){variable_info}{row_info}
+  - 数据列: {', '.join(self._describe_columns(info['columns']))}
 """)
-                    except Exception as e:
-                        file_infos.append(f"文件{i}: {file_path} (读取出错: {str(e)})")
+                elif info["error"]:
+                    file_infos.append(f"文件{i}: {file_path} (读取出错: {info['error']})")
                 else:
-                    file_infos.append(f"文件{i}: {file_path} (文件不存在)")
+                    # 探测信息的类型由样本行推断，完整画像才有空值统计
+                    profiled = "null_counts" in info
+                    type_label = "字段类型" if profiled else "字段类型（按样本行推断）"
+                    null_info = f"\n  - 缺失值: {self._describe_nulls(info)}" if profiled else ""
+                    file_infos.append(f"""
+文件{i}: {file_path}{variable_info}
+  - 数据行数: {info['row_count']}
+  - 数据列: {', '.join(self._describe_columns(info['columns']))}
+  - {type_label}: {', '.join(f'{col}: {dtype}' for col, dtype in info['dtypes'].items())}{null_info}
+""")
             
             data_info = "可用的数据文件:\n" + "\n".join(file_infos)
         
+        compact_hint = ""
+        if self.compact_dtypes:
+            compact_hint = (
+                f"\n- 读取数据后先执行 `import sys; sys.path.insert(0, {_REPO_ROOT!r})`，再使用 "
+                "`from tools.dtype_compaction import compact_dataframe` 和 "
+                "`df, report = compact_dataframe(df)` 压缩列类型以减少内存占用"
+            )
+        
+        if self.dataset_variables:
+            variables = ', '.join(f"`{name}`" for name in self.dataset_variables.values())
+            load_hint = (
+                f"数据文件已经预加载到kernel变量 {variables} 中（pandas已导入为pd），直接使用这些变量，"
+                f"不要重复读取文件；只有变量不存在时才通过 `pd.read_csv('文件路径')` 读取"
+            )
+        else:
+            load_hint = f"如果提供了数据文件，可以通过 `pd.read_csv('文件路径')` 来读取{compact_hint}"
+        
         prompt_content = f"""你是一个专门使用pandas进行数据分析的AI助手。
 
 {data_info}
@@ -178,13 +249,13 @@ class PandasAgent:
 重要提示：
 - 使用 `ipython_execute` 工具来执行Python代码
 - 代码执行的第一个cell应该导入必要的库（如 pandas, matplotlib, seaborn 等）
-- 如果提供了数据文件，可以通过 `pd.read_csv('文件路径')` 来读取
+- {load_hint}
 - 所有执行的代码都会自动保存到notebook中
 - 使用 `ipython_notebook` 工具的 `summary` 操作可以查看执行历史
 
 代码编写规范：
 1. 导入所有需要的库
-2. 读取数据文件
+2. {"使用预加载的数据变量" if self.dataset_variables else "读取数据文件"}
 3. 进行数据操作
 4. 显示结果（使用print或直接返回结果）
 
@@ -205,29 +276,185 @@ class PandasAgent:
         print(f"正在加载 {len(self.data_files)} 个数据文件...")
         
         # 遍历所有文件
-        for i, file_path in enumerate(self.data_files, 1):
-            print(f"\n文件 {i}: {file_path}")
+        for i, info in enumerate(self.file_infos, 1):
+            print(f"\n文件 {i}: {info['path']}")
             
-            # 尝试读取数据基本信息
-            try:
-                if Path(file_path).exists():
-                    df = pd.read_csv(file_path)
-                    print(f"  ✓ 成功加载: {len(df)} 行, {len(df.columns)} 列")
-                    
-                    # 显示列信息（如果有描述，显示描述）
-                    columns = df.columns.tolist()
-                    column_info = []
-                    for col in columns:
-                        if col in self.column_descriptions:
-                            column_info.append(f"{col} ({self.column_descriptions[col]})")
-                        else:
-                            column_info.append(col)
-                    
-                    print(f"  列名: {', '.join(column_info)}")
-                else:
-                    print(f"  ⚠ 文件不存在")
-            except Exception as e:
-                print(f"  ⚠ 读取数据文件时出错: {str(e)}")
+            if not info["exists"]:
+                print(f"  ⚠ 文件不存在")
+            elif info.get("partial") and info["columns"]:
+                print(f"  ⚠ {info['error']}，仅获取到 {len(info['columns'])} 列的表头")
+            elif info["error"]:
+                print(f"  ⚠ 读取数据文件时出错: {info['error']}")
+            else:
+                print(f"  ✓ 成功加载: {info['row_count']} 行, {len(info['columns'])} 列")
+                # 显示列信息（如果有描述，显示描述）
+                print(f"  列名: {', '.join(self._describe_columns(info['columns']))}")
+            if info["path"] in self.dataset_variables:
+                print(f"  kernel变量: {self.dataset_variables[info['path']]}（后台加载中）")
+    
+    @staticmethod
+    def _dataset_variable_names(file_paths: List[str]) -> Dict[str, str]:
+        """
+        为数据文件生成kernel中的变量名
+        
+        单个文件使用 df，多个文件使用 df_文件名，重名时追加序号。
+        
+        Args:
+            file_paths: 数据文件路径列表
+            
+        Returns:
+            {文件路径: 变量名}
+        """
+        if len(file_paths) == 1:
+            return {file_paths[0]: "df"}
+        names: Dict[str, str] = {}
+        used = set()
+        for file_path in file_paths:
+            stem = re.sub(r'\W', '_', Path(file_path).stem).strip('_').lower() or "data"
+            base = f"df_{stem}"
+            name, n = base, 2
+            while name in used or not name.isidentifier() or keyword.iskeyword(name):
+                name, n = f"{base}_{n}", n + 1
+            used.add(name)
+            names[file_path] = name
+        return names
+    
+    def _preload_code(self, file_path: str, variable: str) -> str:
+        """
+        生成把数据文件读入变量的代码
+
+        CSV已有与当前内容一致的列式副本（Feather）时在kernel中内存映射读取副本，不再解析CSV；
+        没有副本时经由列式存储读取CSV，较大的文件同时写入副本，下次预加载直接读取
+        """
+        suffix = Path(file_path).suffix.lower()
+        lines = ["import pandas as pd"]
+        uses_tools = self.compact_dtypes
+        if suffix in ('.xls', '.xlsx'):
+            lines.append(f"{variable} = pd.read_excel({file_path!r})")
+        elif suffix == '.parquet':
+            lines.append(f"{variable} = pd.read_parquet({file_path!r})")
+        elif suffix == '.json':
+            lines.append(f"{variable} = pd.read_json({file_path!r})")
+        else:
+            replica = self._feather_replica(file_path)
+            if replica is not None:
+                # 副本可能由pyarrow后端写入，与ColumnarStore一样忽略其中记录的pandas类型
+                lines += [
+                    "import pyarrow.feather as _feather",
+                    f"{variable} = _feather.read_table({replica!r}, memory_map=True).to_pandas(ignore_metadata=True)",
+                    "del _feather",
+                ]
+            elif suffix == '.csv':
+                uses_tools = True
+                lines += [
+                    "from tools.columnar_store import get_columnar_store as _get_columnar_store",
+                    f"{variable} = _get_columnar_store().load({file_path!r})",
+                    "del _get_columnar_store",
+                ]
+            else:
+                lines.append(f"{variable} = pd.read_csv({file_path!r})")
+        if uses_tools:
+            # kernel的工作目录不一定是项目根目录，先把项目根目录加入sys.path（不在命名空间中留下变量）
+            lines.insert(0, f"__import__('sys').path.insert(0, {_REPO_ROOT!r}) "
+                            f"if {_REPO_ROOT!r} not in __import__('sys').path else None")
+        if self.compact_dtypes:
+            lines += [
+                "from tools.dtype_compaction import compact_dataframe",
+                f"{variable}, _ = compact_dataframe({variable})",
+            ]
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _feather_replica(file_path: str) -> Optional[str]:
+        """CSV的Feather副本路径，副本不存在、不完整或与源文件内容不一致时返回None"""
+        try:
+            store = get_columnar_store()
+            entry = store.find(file_path)
+            if entry is None or entry["format"] != "feather":
+                return None
+            return str(store.data_path(entry))
+        except Exception as e:
+            print(f"警告：查找 {file_path} 的列式副本失败: {e}")
+            return None
+    
+    def _preload_datasets(self):
+        """在kernel中依次读取数据文件，执行器的锁保证Agent的代码在预加载之后执行"""
+        executor = self.ipython_tool.executor
+        with executor.lock:
+            for file_path, variable in self.dataset_variables.items():
+                try:
+                    result = executor.execute_code(
+                        self._preload_code(file_path, variable),
+                        metadata={"preload": True, "source_file": file_path},
+                    )
+                    if result.get("error"):
+                        error = result["error"]
+                        self.preload_errors[file_path] = f"{error['ename']}: {error['evalue']}"
+                except Exception as e:
+                    self.preload_errors[file_path] = str(e)
+                if file_path in self.preload_errors:
+                    print(f"警告：预加载 {file_path} 失败: {self.preload_errors[file_path]}")
+        if self.preload_errors:
+            # prompt中不再声称加载失败的文件已预加载，Agent改为自己读取文件
+            self.dataset_variables = {
+                path: name for path, name in self.dataset_variables.items() if path not in self.preload_errors
+            }
+            self._build_agent()
+    
+    def _profile_datasets(self):
+        """在后台并行计算完整画像，完成后用画像重新创建prompt；探测时已从统计目录得到画像的文件不再计算"""
+        pending = [i for i, info in enumerate(self.file_infos) if info["exists"] and "null_counts" not in info]
+        if not pending:
+            return
+        try:
+            infos = profile_files([self.file_infos[i]["path"] for i in pending], timeout=self.profile_timeout)
+        except Exception as e:
+            print(f"警告：计算文件画像失败: {e}")
+            return
+        # 超时的文件保留已有的探测信息
+        file_infos = list(self.file_infos)
+        for i, info in zip(pending, infos):
+            probe = file_infos[i]
+            file_infos[i] = probe if info.get("partial") and not probe.get("error") else info
+        self.file_infos = file_infos
+        self._build_agent()
+    
+    def wait_for_preload(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待后台预加载完成
+        
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+            
+        Returns:
+            预加载是否已结束
+        """
+        if self._preload_thread is None:
+            return True
+        self._preload_thread.join(timeout)
+        return not self._preload_thread.is_alive()
+    
+    @staticmethod
+    def _with_catalog_profile(info: Dict[str, Any]) -> Dict[str, Any]:
+        """探测信息没有完整画像时查询统计目录，有同样内容的画像时用画像代替"""
+        if not info["exists"] or "null_counts" in info:
+            return info
+        profile = lookup_profile(info["path"])
+        if profile is None:
+            return info
+        return dict(info, **profile, partial=False, error=None)
+    
+    def _describe_columns(self, columns: List[str]) -> List[str]:
+        """为列名附加字段描述（如果有）"""
+        return [
+            f"{col} ({self.column_descriptions[col]})" if col in self.column_descriptions else col
+            for col in columns
+        ]
+    
+    def _describe_nulls(self, info: Dict[str, Any]) -> str:
+        """描述含缺失值的列"""
+        nulls = [f"{col}({count})" for col, count in info.get("null_counts", {}).items() if count]
+        return ', '.join(nulls) if nulls else "无"
     
     def run(self, query: str) -> str:
         """
@@ -239,6 +466,8 @@ class PandasAgent:
         Returns:
             查询结果
         """
+        # 预加载结束后再调用模型，prompt中只列出加载成功的变量
+        self.wait_for_preload()
         return self.agent_executor.invoke({
             "input": query
         })["output"]
@@ -253,7 +482,11 @@ class PandasAgent:
         print("支持功能：数据分析、筛选、分组、聚合、统计等")
         print("输入 'exit' 或 'quit' 退出")
         print("输入 'summary' 查看执行历史摘要")
-        print("输入 'history' 查看完整执行历史\n")
+        print("输入 'history' 查看完整执行历史")
+        print("代码执行中按 Ctrl-C 取消当前查询（已产生的输出会保存到notebook）\n")
+        
+        # 长时间运行的cell边执行边显示输出
+        self.ipython_tool.output_callback = self._print_output
         
         while True:
             user_input = input("你: ").strip()
@@ -288,14 +521,37 @@ class PandasAgent:
             try:
                 response = self.run(user_input)
                 print(f"\n助手: {response}\n")
+            except KeyboardInterrupt:
+                print("\n已取消当前查询\n")
             except Exception as e:
                 print(f"\n错误: {str(e)}\n")
     
+    @staticmethod
+    def _print_output(output: Dict[str, Any]):
+        """实时显示cell的一个输出"""
+        output_type = output.get('output_type')
+        if output_type == 'stream':
+            text = output.get('text', '')
+        elif output_type in ('execute_result', 'display_data'):
+            data = output.get('data', {})
+            if 'text/plain' in data:
+                text = data['text/plain'] + "\n"
+            elif 'image/png' in data:
+                text = "[图像输出]\n"
+            else:
+                return
+        elif output_type == 'error':
+            text = f"{output.get('ename')}: {output.get('evalue')}\n"
+        else:
+            return
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    
     def __del__(self):
         """清理资源"""
+        # 执行器在同一notebook的工具之间共享，由工具释放，最后一个持有者释放时才停止kernel
         if hasattr(self, 'ipython_tool') and self.ipython_tool:
-            if hasattr(self.ipython_tool, 'executor') and self.ipython_tool.executor:
-                self.ipython_tool.executor.stop_kernel()
+            self.ipython_tool.close()
 
 
 def main():
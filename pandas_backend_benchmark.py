@@ -0,0 +1,119 @@
+"""
+PandasTool 后端对比
+分别用 pandas（C解析器）和 pyarrow（多线程Arrow解析器）后端解析同一个CSV并执行各个操作，
+输出耗时并检查两个后端的结果是否一致
+
+用法:
+    python pandas_backend_benchmark.py                 # 生成100万行的测试数据
+    python pandas_backend_benchmark.py --rows 5000000
+    python pandas_backend_benchmark.py --file data.csv --groupby 列名 --sort 列名
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# 只比较解析本身，不使用列式副本
+os.environ["PANDAS_COLUMNAR_MIN_BYTES"] = str(2 ** 62)
+
+from tools.csv_backend import BACKENDS, read_csv, resolve_backend
+from tools.dataset_cache import get_dataset_cache
+from tools.pandas_tool import PandasTool
+
+
+def generate_csv(path: str, rows: int, seed: int = 0):
+    """生成包含整数、浮点、字符串和日期列的测试数据"""
+    rng = np.random.default_rng(seed)
+    value = rng.random(rows)
+    value[rng.random(rows) < 0.01] = np.nan
+    df = pd.DataFrame({
+        "id": np.arange(rows),
+        "category": rng.choice([f"cat_{i}" for i in range(50)], rows),
+        "quantity": rng.integers(0, 1000, rows),
+        "value": value,
+        "created": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 86400 * 365, rows), unit="s"),
+    })
+    df.to_csv(path, index=False)
+
+
+def timed(func, repeat: int = 3):
+    """返回多次运行中的最短耗时和最后一次的结果"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmark(file_path: str, groupby_column: str, sort_column: str, repeat: int):
+    operations = [
+        ("describe", "", ""),
+        ("filter", f"`{sort_column}` > 0", ""),
+        ("groupby", groupby_column, sort_column),
+        ("sort", f"{sort_column},false", ""),
+        ("topk", sort_column, ""),
+    ]
+    backends = [b for b in BACKENDS if resolve_backend(b) == b]
+    timings = {}
+    outputs = {}
+
+    for backend in backends:
+        parse_time, df = timed(lambda: read_csv(file_path, backend=backend), repeat)
+        timings[(backend, "parse")] = parse_time
+        print(f"[{backend}] 解析: {parse_time:.3f}s（{len(df)}行，{df.memory_usage(deep=True).sum() / 1024 ** 2:.1f}MB）")
+
+        tool = PandasTool(backend=backend, streaming_threshold=2 ** 62,
+                          result_dir=os.path.join(tempfile.gettempdir(), "pandas_backend_benchmark"))
+        get_dataset_cache().invalidate()
+        tool._run("read_csv", file_path)
+        for operation, query, columns in operations:
+            elapsed, output = timed(lambda: tool._run(operation, file_path, query, columns=columns, limit=20), repeat)
+            timings[(backend, operation)] = elapsed
+            # 结果文件名每次不同，不参与比较
+            outputs[(backend, operation)] = re.sub(r"result_\w+", "result", output)
+            print(f"[{backend}] {operation}: {elapsed:.3f}s")
+        get_dataset_cache().invalidate()
+
+    print("\n" + "=" * 60)
+    print(f"{'操作':<12}" + "".join(f"{b:>12}" for b in backends) + f"{'加速比':>10}{'结果一致':>10}")
+    print("=" * 60)
+    for operation in ["parse"] + [op for op, _, _ in operations]:
+        row = f"{operation:<12}" + "".join(f"{timings[(b, operation)]:>11.3f}s" for b in backends)
+        if len(backends) == 2:
+            speedup = timings[(backends[0], operation)] / max(timings[(backends[1], operation)], 1e-9)
+            same = "-" if operation == "parse" else \
+                ("是" if outputs[(backends[0], operation)] == outputs[(backends[1], operation)] else "否")
+            row += f"{speedup:>9.2f}x{same:>10}"
+        print(row)
+
+    if len(backends) < 2:
+        print("\n未安装pyarrow，只运行了pandas后端")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比PandasTool的pandas和pyarrow后端")
+    parser.add_argument("--file", help="CSV文件路径，不指定时生成测试数据")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="生成测试数据的行数")
+    parser.add_argument("--groupby", default="category", help="groupby使用的分组列")
+    parser.add_argument("--sort", default="value", help="sort/topk/filter使用的数值列")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最短耗时）")
+    args = parser.parse_args()
+
+    if args.file:
+        run_benchmark(args.file, args.groupby, args.sort, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "benchmark.csv")
+        print(f"生成 {args.rows} 行测试数据...")
+        generate_csv(path, args.rows)
+        print(f"文件大小: {os.path.getsize(path) / 1024 ** 2:.1f}MB\n")
+        run_benchmark(path, args.groupby, args.sort, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+测试cell代码分析：变量依赖、输入文件和只读判断
+"""
+from tools.cell_analysis import analyze_cell, normalized_code
+
+
+def _assert_pure(code):
+    result = analyze_cell(code)
+    assert result["pure"], f"{code!r} 应为只读: {result['reason']}"
+
+
+def _assert_impure(code):
+    result = analyze_cell(code)
+    assert not result["pure"], f"{code!r} 不应为只读"
+    assert result["reason"]
+
+
+def test_pure_inspection_cells():
+    """测试查看和统计类cell是只读的"""
+    for code in (
+        "df.describe()",
+        "df.head(10)",
+        "df.groupby('city')['price'].mean().sort_values(ascending=False)",
+        "print(len(df), df['price'].max())",
+        "df[df['price'] > 100].shape",
+        "np.sqrt(df['price']).round(2)",
+        "df.sample(5, random_state=0)",
+        "df.sort_values('price', inplace=False)",
+        "[x * 2 for x in values]",
+    ):
+        _assert_pure(code)
+
+
+def test_random_calls_impure():
+    """测试随机数和时间相关的调用不是只读的"""
+    for code in (
+        "np.random.normal(size=3)",
+        "np.random.default_rng().normal()",
+        "rng.normal(size=3)",
+        "random.random()",
+        "import random\nrandom.choice(items)",
+        "datetime.now()",
+        "datetime.datetime.now()",
+        "time.time()",
+        "uuid.uuid4()",
+        "df.sample(5)",
+    ):
+        _assert_impure(code)
+
+
+def test_io_calls_impure():
+    """测试读写外部数据的调用不是只读的"""
+    for code in (
+        "pd.read_csv(path).describe()",
+        "json.load(open(path))",
+        "pd.read_sql('select * from t', conn)",
+        "conn.execute('delete from t')",
+        "cursor.fetchall()",
+        "requests.get(url)",
+        "open('out.txt', 'w')",
+        "df.to_csv('out.csv')",
+        "df.to_sql('t', con=engine)",
+        "os.remove(path)",
+        "plt.plot(df['price'])",
+    ):
+        _assert_impure(code)
+
+
+def test_constant_path_reads_pure():
+    """测试以常量路径读取文件的cell是只读的，文件记录为输入"""
+    for code, path in (
+        ("pd.read_csv('data.csv').describe()", "data.csv"),
+        ("open('data.txt').read()", "data.txt"),
+        ("np.load('arr.npy').sum()", "arr.npy"),
+    ):
+        result = analyze_cell(code)
+        assert result["pure"], result["reason"]
+        assert result["files"] == [path]
+
+
+def test_string_export_is_pure():
+    """测试不带路径的to_csv返回字符串，不算写文件"""
+    _assert_pure("df.head().to_csv()")
+
+
+def test_mutation_impure():
+    """测试定义变量或原地修改的cell不是只读的"""
+    for code in (
+        "x = 1",
+        "df['new'] = df['price'] * 2",
+        "items.append(1)",
+        "arr.fill(0)",
+        "arr.resize(10)",
+        "df.dropna(inplace=True)",
+        "del df['price']",
+        "user_function(df)",
+        "_ + 1",
+    ):
+        _assert_impure(code)
+
+
+def test_unparsable_cell():
+    """测试包含magic命令的cell无法解析"""
+    result = analyze_cell("%timeit df.describe()")
+    assert not result["parsed"]
+    assert not result["pure"]
+    assert normalized_code("%timeit df.describe()") is None
+
+
+def test_defines_uses_and_files():
+    """测试定义、读取的变量和常量路径的输入文件"""
+    result = analyze_cell("df = pd.read_csv('sales.csv')\nsummary = df.groupby(key).sum()\nprint(summary)")
+    assert result["defines"] == ["df", "summary"]
+    assert set(result["uses"]) == {"pd", "key"}
+    assert result["files"] == ["sales.csv"]
+
+    result = analyze_cell("for row in rows:\n    total = row + offset")
+    assert set(result["uses"]) == {"rows", "offset"}
+
+
+def test_normalized_code_ignores_formatting():
+    """测试注释和格式差异不影响规范化代码"""
+    assert normalized_code("df.describe()  # 统计") == normalized_code("df.describe( )")
+    assert normalized_code("df.describe()") != normalized_code("df.head()")
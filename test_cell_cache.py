@@ -0,0 +1,82 @@
+"""
+测试cell结果缓存的变量指纹和输入文件指纹
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+from tools.cell_cache import CellCache, file_fingerprints, fingerprint_variables, memo_key
+
+
+class FakeShell:
+    def __init__(self, **user_ns):
+        self.user_ns = user_ns
+
+
+def _fingerprint(value):
+    return json.loads(fingerprint_variables(FakeShell(value=value), ["value"]))["value"]
+
+
+def test_small_frame_full_hash():
+    """测试小DataFrame按全部内容哈希，任意位置的修改都会改变指纹"""
+    df = pd.DataFrame({"a": range(1000), "b": [f"s{i}" for i in range(1000)]})
+    before = _fingerprint(df)
+    assert _fingerprint(df.copy()) == before
+    df.loc[500, "a"] = -1
+    assert _fingerprint(df) != before
+
+
+def test_large_frame_sampled(monkeypatch):
+    """测试超过全量哈希字节数的DataFrame只哈希采样行块，替换列后指纹改变"""
+    monkeypatch.setenv("IPYTHON_CELL_HASH_FULL_BYTES", "1024")
+    df = pd.DataFrame({"a": np.arange(200_000, dtype=float), "b": np.ones(200_000)})
+    before = _fingerprint(df)
+    assert _fingerprint(df) == before
+    # 首行在采样块内
+    df.iloc[0, 0] = -1.0
+    assert _fingerprint(df) != before
+    changed = _fingerprint(df)
+    df["b"] = df["b"] * 2
+    assert _fingerprint(df) != changed
+
+
+def test_large_array_sampled(monkeypatch):
+    """测试大ndarray的采样指纹：形状不同或首尾修改时改变"""
+    monkeypatch.setenv("IPYTHON_CELL_HASH_FULL_BYTES", "1024")
+    arr = np.zeros(500_000)
+    before = _fingerprint(arr)
+    arr[-1] = 1
+    assert _fingerprint(arr) != before
+    assert _fingerprint(np.zeros(500_001)) != before
+
+
+def test_uncacheable_values():
+    """测试函数不可缓存，未定义的变量为null"""
+    shell = FakeShell(f=lambda x: x)
+    assert json.loads(fingerprint_variables(shell, ["f"])) is None
+    assert json.loads(fingerprint_variables(shell, ["missing"])) == {"missing": None}
+
+
+def test_file_fingerprints_change_key(tmp_path):
+    """测试输入文件的大小或修改时间变化后缓存键改变，文件不存在时不可缓存"""
+    path = tmp_path / "data.csv"
+    path.write_text("a\n1\n")
+    files = file_fingerprints([str(path)])
+    key = memo_key("code", {}, "python3", files)
+
+    path.write_text("a\n2\n")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+    assert memo_key("code", {}, "python3", file_fingerprints([str(path)])) != key
+    assert file_fingerprints([str(tmp_path / "missing.csv")]) is None
+
+
+def test_cache_roundtrip(tmp_path):
+    """测试缓存的保存、命中和统计"""
+    cache = CellCache(db_path=str(tmp_path / "cache.sqlite"))
+    outputs = [{"output_type": "stream", "name": "stdout", "text": "1\n"}]
+    assert cache.get("k") is None
+    assert cache.put("k", outputs, 1.5)
+    assert cache.get("k") == {"outputs": outputs, "duration": 1.5}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["saved_seconds"] == 1.5
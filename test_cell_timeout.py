@@ -0,0 +1,35 @@
+"""
+测试cell的默认超时
+"""
+import tools.ipython_executor as ipython_executor
+from tools.ipython_executor import DEFAULT_CELL_TIMEOUT, IPythonExecutor
+
+
+def test_default_timeout_is_finite(tmp_path, monkeypatch):
+    """测试未配置时使用有限的默认超时，环境变量和单次执行的参数可以覆盖"""
+    monkeypatch.delenv("IPYTHON_CELL_TIMEOUT", raising=False)
+    executor = IPythonExecutor(notebook_path=str(tmp_path / "nb.ipynb"))
+    assert 0 < DEFAULT_CELL_TIMEOUT
+    assert executor.cell_timeout == DEFAULT_CELL_TIMEOUT
+    assert executor._resolve_timeout(None) == DEFAULT_CELL_TIMEOUT
+    assert executor._resolve_timeout(5) == 5
+    assert executor._resolve_timeout(0) is None
+
+    monkeypatch.setenv("IPYTHON_CELL_TIMEOUT", "0")
+    assert IPythonExecutor(notebook_path=str(tmp_path / "nb2.ipynb"))._resolve_timeout(None) is None
+
+
+def test_default_timeout_interrupts_cell(tmp_path, monkeypatch):
+    """测试不指定超时的cell在超过默认超时后被中断，kernel中的变量保留"""
+    monkeypatch.delenv("IPYTHON_CELL_TIMEOUT", raising=False)
+    monkeypatch.setattr(ipython_executor, "DEFAULT_CELL_TIMEOUT", 2)
+    executor = IPythonExecutor(notebook_path=str(tmp_path / "nb.ipynb"))
+    try:
+        executor.execute_code("kept = 1")
+        result = executor.execute_code("import time\nwhile True: time.sleep(0.1)")
+
+        assert result["failure"] == {"reason": "timeout", "timeout": 2, "kernel_restarted": False}
+        assert result["error"]["ename"] == "CellTimeoutError"
+        assert executor.execute_code("print(kept)")["outputs"][0]["text"].strip() == "1"
+    finally:
+        executor.stop_kernel()
@@ -0,0 +1,101 @@
+"""
+测试列式副本的文件指纹和失效
+"""
+import os
+import pandas as pd
+import tools.columnar_store as columnar_store
+from tools.columnar_store import ColumnarStore, content_fingerprint
+from tools.stats_catalog import StatsCatalog
+
+
+def _edit_same_size(path, old, new):
+    """原地替换等长内容并推进修改时间，文件大小不变"""
+    assert len(old) == len(new)
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data.replace(old, new, 1))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert os.stat(path).st_size == stat.st_size
+
+
+def test_fingerprint_changes_after_same_size_edit(tmp_path, monkeypatch):
+    """测试采样块未覆盖的位置被等长修改后指纹改变"""
+    # 缩小采样块，使小文件也走采样路径
+    monkeypatch.setattr(columnar_store, "_SAMPLE_BLOCK", 16)
+    monkeypatch.setattr(columnar_store, "_SAMPLE_COUNT", 2)
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"value": range(2000)}).to_csv(path, index=False)
+    before = content_fingerprint(str(path))
+
+    _edit_same_size(path, b"\n1234\n", b"\n9999\n")
+
+    assert content_fingerprint(str(path)) != before
+
+
+def test_fingerprint_stable_for_unchanged_file(tmp_path):
+    """测试未修改的文件指纹不变"""
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"value": range(100)}).to_csv(path, index=False)
+    assert content_fingerprint(str(path)) == content_fingerprint(str(path))
+
+
+def test_sidecar_invalidated_after_same_size_edit(tmp_path):
+    """测试等长修改后不再读取旧的列式副本"""
+    store = ColumnarStore(cache_dir=str(tmp_path / "columnar"), min_bytes=0)
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"value": range(2000)}).to_csv(path, index=False)
+
+    assert store.load(str(path))["value"].max() == 1999
+    assert store.lookup(content_fingerprint(str(path))) is not None
+
+    _edit_same_size(path, b"\n1234\n", b"\n9999\n")
+
+    assert store.lookup(content_fingerprint(str(path))) is None
+    assert store.load(str(path))["value"].max() == 9999
+
+
+def test_stale_sidecars_removed_on_write(tmp_path):
+    """测试源文件修改后写入新副本时删除旧内容的副本和清单条目，其他文件的副本保留"""
+    cache = tmp_path / "columnar"
+    store = ColumnarStore(cache_dir=str(cache), min_bytes=0)
+    path = tmp_path / "data.csv"
+    other = tmp_path / "other.csv"
+    pd.DataFrame({"value": range(10)}).to_csv(other, index=False)
+    store.load(str(other))
+
+    for n in (100, 200, 300):
+        pd.DataFrame({"value": range(n)}).to_csv(path, index=False)
+        assert len(store.load(str(path))) == n
+
+    manifest = store._read_manifest()
+    assert sorted(manifest) == sorted([content_fingerprint(str(path)), content_fingerprint(str(other))])
+    assert sorted(p.name for p in cache.iterdir() if p.is_dir()) == sorted(manifest)
+
+
+def test_sidecar_projection(tmp_path):
+    """测试副本读取指定列的结果与直接解析一致"""
+    store = ColumnarStore(cache_dir=str(tmp_path / "columnar"), min_bytes=0)
+    path = tmp_path / "data.csv"
+    expected = pd.DataFrame({"a": range(50), "b": [f"s{i}" for i in range(50)]})
+    expected.to_csv(path, index=False)
+
+    store.load(str(path))
+    projected = store.load(str(path), columns=["a"])
+
+    assert list(projected.columns) == ["a"]
+    assert projected["a"].tolist() == expected["a"].tolist()
+
+
+def test_catalog_misses_after_same_size_edit(tmp_path):
+    """测试等长修改后统计目录不再返回旧画像"""
+    catalog = StatsCatalog(db_path=str(tmp_path / "catalog.sqlite"))
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"value": range(2000)}).to_csv(path, index=False)
+    catalog.store_file(str(path), {"rows": 2000})
+    assert catalog.lookup_file(str(path)) == {"rows": 2000}
+
+    _edit_same_size(path, b"\n1234\n", b"\n9999\n")
+
+    assert catalog.lookup_file(str(path)) is None
@@ -0,0 +1,118 @@
+"""
+测试数据集缓存的LRU淘汰和失效
+"""
+import os
+import pandas as pd
+from tools.dataset_cache import DatasetCache, dataframe_nbytes
+
+
+def _write_csv(path, rows, offset=0):
+    pd.DataFrame({"a": range(offset, offset + rows), "b": [float(i) for i in range(rows)]}).to_csv(path, index=False)
+    return str(path)
+
+
+def _counting_loader(calls):
+    def loader(file_path, columns):
+        calls.append((os.path.basename(file_path), None if columns is None else tuple(columns)))
+        return pd.read_csv(file_path, usecols=columns)
+    return loader
+
+
+def test_lru_eviction(tmp_path):
+    """测试超过预算时按最近最少使用的顺序淘汰"""
+    paths = [_write_csv(tmp_path / f"{name}.csv", 100) for name in "abc"]
+    size = dataframe_nbytes(pd.read_csv(paths[0]))
+    cache = DatasetCache(max_bytes=size * 2)
+    calls = []
+    loader = _counting_loader(calls)
+
+    cache.get(paths[0], loader=loader)
+    cache.get(paths[1], loader=loader)
+    # 访问a使其成为最近使用，再放入c时应淘汰b
+    cache.get(paths[0], loader=loader)
+    cache.get(paths[2], loader=loader)
+
+    assert cache.contains(paths[0])
+    assert not cache.contains(paths[1])
+    assert cache.contains(paths[2])
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert len(calls) == 3
+
+
+def test_projection_served_from_full_entry(tmp_path):
+    """测试已缓存完整数据时列投影直接命中"""
+    path = _write_csv(tmp_path / "data.csv", 50)
+    cache = DatasetCache()
+    calls = []
+    loader = _counting_loader(calls)
+
+    full = cache.get(path, loader=loader)
+    projected = cache.get(path, columns=["b"], loader=loader)
+
+    assert len(calls) == 1
+    assert list(projected.columns) == ["b"]
+    pd.testing.assert_series_equal(projected["b"], full["b"])
+
+
+def test_oversized_entry_not_cached(tmp_path):
+    """测试超过预算的单个数据集不进入缓存"""
+    path = _write_csv(tmp_path / "big.csv", 1000)
+    cache = DatasetCache(max_bytes=1)
+    cache.get(path, loader=_counting_loader([]))
+    assert not cache.contains(path)
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidation_on_file_change(tmp_path):
+    """测试文件内容变化后旧数据失效并重新加载"""
+    path = _write_csv(tmp_path / "data.csv", 10)
+    cache = DatasetCache()
+    calls = []
+    loader = _counting_loader(calls)
+
+    assert cache.get(path, loader=loader)["a"].iloc[0] == 0
+    _write_csv(path, 20, offset=100)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+
+    df = cache.get(path, loader=loader)
+    assert df["a"].iloc[0] == 100
+    assert len(df) == 20
+    assert len(calls) == 2
+    # 旧版本的条目已被清除
+    assert cache.stats()["entries"] == 1
+
+
+def test_explicit_invalidate(tmp_path):
+    """测试按路径失效和清空整个缓存"""
+    first = _write_csv(tmp_path / "first.csv", 10)
+    second = _write_csv(tmp_path / "second.csv", 10)
+    cache = DatasetCache()
+    loader = _counting_loader([])
+    cache.get(first, loader=loader)
+    cache.get(second, loader=loader)
+
+    cache.invalidate(first)
+    assert not cache.contains(first)
+    assert cache.contains(second)
+
+    cache.invalidate()
+    assert not cache.contains(second)
+    assert cache.stats()["bytes"] == 0
+
+
+def test_set_max_bytes_evicts(tmp_path):
+    """测试调小预算后立即淘汰"""
+    paths = [_write_csv(tmp_path / f"{name}.csv", 100) for name in "ab"]
+    cache = DatasetCache()
+    loader = _counting_loader([])
+    for path in paths:
+        cache.get(path, loader=loader)
+
+    cache.set_max_bytes(cache.stats()["bytes"] - 1)
+    assert not cache.contains(paths[0])
+    assert cache.contains(paths[1])
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,87 @@
+"""
+测试共享执行器的持有计数
+"""
+from tools.ipython_executor import IPythonExecutor, acquire_executor, get_executor, release_executor
+
+
+class RecordingExecutor(IPythonExecutor):
+    """记录stop_kernel调用次数的执行器（测试中不会启动kernel）"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.stopped = 0
+
+    def stop_kernel(self):
+        self.stopped += 1
+        super().stop_kernel()
+
+
+def test_shared_executor_released_by_last_holder(tmp_path):
+    """测试只有最后一个持有者释放时才停止执行器"""
+    path = str(tmp_path / "shared.ipynb")
+    first = acquire_executor(path, RecordingExecutor)
+    second = acquire_executor(path, RecordingExecutor)
+    assert first is second
+    assert get_executor(path) is first
+
+    release_executor(first)
+    assert first.stopped == 0
+    assert get_executor(path) is first
+
+    release_executor(second)
+    assert first.stopped == 1
+    # 释放后再获取会创建新的执行器
+    replacement = acquire_executor(path, RecordingExecutor)
+    assert replacement is not first
+    release_executor(replacement)
+    assert replacement.stopped == 1
+
+
+def test_release_unknown_executor_is_noop(tmp_path):
+    """测试释放未持有的执行器不做任何操作"""
+    path = str(tmp_path / "borrowed.ipynb")
+    borrowed = get_executor(path, RecordingExecutor)
+    release_executor(borrowed)
+    assert borrowed.stopped == 0
+    assert get_executor(path) is borrowed
+
+    held = acquire_executor(path, RecordingExecutor)
+    release_executor(held)
+    release_executor(held)
+    assert held.stopped == 1
+
+
+def test_executor_class_mismatch(tmp_path):
+    """测试同一notebook不能由另一种执行器使用"""
+    path = str(tmp_path / "typed.ipynb")
+    executor = acquire_executor(path, RecordingExecutor)
+    try:
+        class OtherExecutor(IPythonExecutor):
+            pass
+        try:
+            acquire_executor(path, OtherExecutor)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("应当拒绝不同类型的执行器")
+    finally:
+        release_executor(executor)
+
+
+def test_notebook_tool_releases_executor(tmp_path):
+    """测试notebook工具只在操作期间持有执行器，不释放其他持有者的执行器"""
+    from tools.ipython_executor import _executor_holders, _shared_executors
+    from tools.ipython_tool import IPythonNotebookTool
+    path = str(tmp_path / "tool.ipynb")
+    tool = IPythonNotebookTool()
+
+    assert "Notebook为空" in tool._run(action="history", notebook_path=path)
+    assert not any(key.endswith("tool.ipynb") for key in _shared_executors)
+
+    held = acquire_executor(path, RecordingExecutor)
+    held.add_markdown_cell("note")
+    assert "1 个cells" in tool._run(action="summary", notebook_path=path)
+    assert get_executor(path) is held and held.stopped == 0
+    assert sum(count for key, count in _executor_holders.items() if key.endswith("tool.ipynb")) == 1
+    release_executor(held)
+    assert held.stopped == 1
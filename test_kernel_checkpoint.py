@@ -0,0 +1,30 @@
+"""
+测试kernel中导入的检查点模块保持轻量
+"""
+import subprocess
+import sys
+
+
+def test_kernel_side_import_is_light():
+    """测试导入kernel中使用的模块不会加载langchain、jupyter_client和宿主进程的执行器"""
+    code = (
+        "import sys, tools.kernel_checkpoint, tools.cell_cache, tools.dtype_compaction, tools.columnar_store\n"
+        "heavy = ['langchain', 'jupyter_client', 'tools.kernel_pool', 'tools.ipython_executor']\n"
+        "print(','.join(m for m in heavy if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_lazy_exports():
+    """测试包的导出名按需导入"""
+    import tools
+    from tools.ipython_executor import IPythonExecutor
+    assert tools.IPythonExecutor is IPythonExecutor
+    assert "PandasTool" in tools.__all__
+    try:
+        tools.NoSuchTool
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("未知名字应抛出AttributeError")
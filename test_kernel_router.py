@@ -0,0 +1,280 @@
+"""
+测试kernel消息路由按msg_id分发消息
+"""
+import asyncio
+import queue
+import uuid
+import zmq
+import tools.kernel_router as kernel_router
+from tools.kernel_router import AsyncMessageRouter, Execution, KernelDiedError, MessageRouter
+
+
+class FakeChannel:
+    """用inproc的zmq socket模拟kernel通道，消息以pickle对象传递"""
+
+    def __init__(self, context):
+        address = f"inproc://{uuid.uuid4().hex}"
+        self.socket = context.socket(zmq.PULL)
+        self.socket.bind(address)
+        self._sender = context.socket(zmq.PUSH)
+        self._sender.connect(address)
+
+    def send(self, msg):
+        self._sender.send_pyobj(msg)
+
+    def get_msg(self, timeout=None):
+        try:
+            return self.socket.recv_pyobj(zmq.NOBLOCK)
+        except zmq.Again:
+            raise queue.Empty
+
+    def close(self):
+        self._sender.close(linger=0)
+        self.socket.close(linger=0)
+
+
+class FakeKernelClient:
+    """只记录execute请求的KernelClient，消息由测试手动发送"""
+
+    def __init__(self):
+        self.context = zmq.Context()
+        self.iopub_channel = FakeChannel(self.context)
+        self.shell_channel = FakeChannel(self.context)
+        self.requests = []
+
+    def execute(self, code, silent=False, store_history=True, user_expressions=None):
+        msg_id = uuid.uuid4().hex
+        self.requests.append((msg_id, code))
+        return msg_id
+
+    def stream(self, msg_id, text):
+        self.iopub_channel.send(_msg(msg_id, "stream", {"name": "stdout", "text": text}))
+
+    def finish(self, msg_id, status="ok", **content):
+        self.iopub_channel.send(_msg(msg_id, "status", {"execution_state": "idle"}))
+        self.shell_channel.send(_msg(msg_id, "execute_reply", dict(content, status=status)))
+
+    def close(self):
+        self.iopub_channel.close()
+        self.shell_channel.close()
+        self.context.term()
+
+
+def _msg(parent_id, msg_type, content):
+    return {"parent_header": {"msg_id": parent_id}, "msg_type": msg_type, "content": content}
+
+
+def _texts(execution):
+    return [output["text"] for output in execution.outputs if output["output_type"] == "stream"]
+
+
+def test_interleaved_messages_dispatched_by_msg_id():
+    """测试交错到达的消息按parent_header.msg_id分发，未知消息被丢弃"""
+    kc = FakeKernelClient()
+    try:
+        router = MessageRouter(kc)
+        first = router.execute("print('a')", execution_count=1)
+        second = router.execute("print('b')", execution_count=2)
+        kc.stream(second.msg_id, "b1\n")
+        kc.stream(first.msg_id, "a1\n")
+        kc.stream("unknown", "lost\n")
+        kc.iopub_channel.send(_msg(first.msg_id, "execute_result",
+                                   {"data": {"text/plain": "1"}, "metadata": {}}))
+        kc.finish(first.msg_id)
+
+        router.wait(first, timeout=5)
+
+        assert first.done
+        assert _texts(first) == ["a1\n"]
+        assert first.outputs[-1]["execution_count"] == 1
+        assert _texts(second) == ["b1\n"]
+        assert not second.done
+
+        kc.stream(second.msg_id, "b2\n")
+        kc.finish(second.msg_id)
+        router.wait(second, timeout=5)
+        assert _texts(second) == ["b1\n", "b2\n"]
+        assert router._pending == {}
+    finally:
+        kc.close()
+
+
+def test_discarded_execution_output_dropped():
+    """测试放弃的执行之后到达的输出不会混入下一个cell"""
+    kc = FakeKernelClient()
+    try:
+        router = MessageRouter(kc)
+        abandoned = router.execute("while True: pass")
+        router.discard(abandoned)
+        current = router.execute("print('next')")
+        kc.stream(abandoned.msg_id, "late\n")
+        kc.finish(abandoned.msg_id)
+        kc.stream(current.msg_id, "next\n")
+        kc.finish(current.msg_id)
+
+        router.wait(current, timeout=5)
+
+        assert _texts(current) == ["next\n"]
+        assert abandoned.outputs == []
+    finally:
+        kc.close()
+
+
+def test_stream_yields_outputs_in_order():
+    """测试stream逐个产出输出，并调用on_output回调"""
+    kc = FakeKernelClient()
+    try:
+        router = MessageRouter(kc)
+        seen = []
+        execution = router.execute("...", on_output=seen.append)
+        for i in range(3):
+            kc.stream(execution.msg_id, f"{i}\n")
+        kc.finish(execution.msg_id)
+
+        streamed = [output["text"] for output in router.stream(execution, timeout=5)]
+
+        assert streamed == ["0\n", "1\n", "2\n"]
+        assert [output["text"] for output in seen] == streamed
+    finally:
+        kc.close()
+
+
+def test_reply_only_error():
+    """测试只在execute_reply中报告的错误也会记录为error输出"""
+    kc = FakeKernelClient()
+    try:
+        router = MessageRouter(kc)
+        execution = router.execute("1/0")
+        kc.finish(execution.msg_id, status="error", ename="ZeroDivisionError", evalue="division by zero")
+
+        router.wait(execution, timeout=5)
+
+        assert execution.error["ename"] == "ZeroDivisionError"
+        assert execution.outputs == [execution.error]
+    finally:
+        kc.close()
+
+
+def test_timeout_keeps_execution_registered():
+    """测试超时后执行保持登记，之后的消息仍能完成它"""
+    kc = FakeKernelClient()
+    try:
+        router = MessageRouter(kc)
+        execution = router.execute("import time; time.sleep(10)")
+        try:
+            router.wait(execution, timeout=0.05)
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("应当超时")
+        assert execution.msg_id in router._pending
+
+        kc.finish(execution.msg_id)
+        assert router.wait(execution, timeout=5).done
+    finally:
+        kc.close()
+
+
+def test_kernel_death_detected(monkeypatch):
+    """测试没有消息且kernel已退出时抛出KernelDiedError"""
+    monkeypatch.setattr(kernel_router, "LIVENESS_INTERVAL", 0.01)
+    kc = FakeKernelClient()
+    try:
+        router = MessageRouter(kc, is_alive=lambda: False)
+        execution = router.execute("import os; os._exit(1)")
+        try:
+            router.wait(execution, timeout=5)
+        except KernelDiedError:
+            pass
+        else:
+            raise AssertionError("应当检测到kernel退出")
+        assert execution.msg_id not in router._pending
+    finally:
+        kc.close()
+
+
+def test_execution_waits_for_idle_and_reply():
+    """测试执行要同时收到idle状态和execute_reply才算完成"""
+    execution = Execution("m1")
+    execution.handle_reply({"content": {"status": "ok"}})
+    assert not execution.done
+    execution.handle_iopub(_msg("m1", "status", {"execution_state": "busy"}))
+    assert not execution.done
+    execution.handle_iopub(_msg("m1", "status", {"execution_state": "idle"}))
+    assert execution.done
+
+
+class FakeAsyncKernelClient:
+    """用asyncio队列模拟异步KernelClient的两个通道"""
+
+    def __init__(self):
+        self.iopub = asyncio.Queue()
+        self.shell = asyncio.Queue()
+
+    def execute(self, code, silent=False, store_history=True, user_expressions=None):
+        return uuid.uuid4().hex
+
+    async def get_iopub_msg(self):
+        return await self.iopub.get()
+
+    async def get_shell_msg(self):
+        return await self.shell.get()
+
+    def stream(self, msg_id, text):
+        self.iopub.put_nowait(_msg(msg_id, "stream", {"name": "stdout", "text": text}))
+
+    def finish(self, msg_id, status="ok", **content):
+        self.iopub.put_nowait(_msg(msg_id, "status", {"execution_state": "idle"}))
+        self.shell.put_nowait(_msg(msg_id, "execute_reply", dict(content, status=status)))
+
+
+def test_async_router_dispatches_by_msg_id():
+    """测试异步路由按msg_id分发消息：放弃的执行的迟到输出被丢弃，其他执行的消息交给对应的执行"""
+    async def scenario():
+        kc = FakeAsyncKernelClient()
+        router = AsyncMessageRouter(kc)
+        abandoned = router.execute("while True: pass")
+        router.discard(abandoned)
+        current = router.execute("print('next')", execution_count=2)
+        silent = router.execute("", silent=True)
+        kc.stream(abandoned.msg_id, "late\n")
+        kc.finish(abandoned.msg_id)
+        kc.stream(silent.msg_id, "other\n")
+        kc.stream(current.msg_id, "next\n")
+        kc.finish(current.msg_id)
+
+        await router.wait(current, timeout=5)
+        assert _texts(current) == ["next\n"]
+        assert _texts(silent) == ["other\n"]
+        assert list(router._pending) == [silent.msg_id]
+
+    asyncio.run(scenario())
+
+
+def test_async_router_timeout_and_kernel_death(monkeypatch):
+    """测试异步路由超时后执行保持登记，kernel退出时抛出KernelDiedError"""
+    monkeypatch.setattr(kernel_router, "LIVENESS_INTERVAL", 0.05)
+
+    async def scenario():
+        kc = FakeAsyncKernelClient()
+        router = AsyncMessageRouter(kc)
+        execution = router.execute("import time; time.sleep(10)")
+        try:
+            await router.wait(execution, timeout=0.1)
+        except TimeoutError:
+            pass
+        else:
+            raise AssertionError("应当超时")
+        assert execution.msg_id in router._pending
+
+        dead = AsyncMessageRouter(kc, is_alive=lambda: False)
+        execution = dead.execute("pass")
+        try:
+            await dead.wait(execution)
+        except KernelDiedError:
+            pass
+        else:
+            raise AssertionError("应当检测到kernel退出")
+        assert execution.msg_id not in dead._pending
+
+    asyncio.run(scenario())
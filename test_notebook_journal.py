@@ -0,0 +1,173 @@
+"""
+测试notebook追加式日志的重放、压缩和日志轮转
+"""
+import json
+import shutil
+from tools.notebook_journal import NotebookJournal
+
+
+def _empty_notebook():
+    return {"cells": [], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}
+
+
+def _cell(source):
+    return {"cell_type": "code", "source": source, "metadata": {}, "outputs": [], "execution_count": None}
+
+
+def _sources(notebook_data):
+    return [cell["source"] for cell in notebook_data["cells"]]
+
+
+def _journal_names(tmp_path):
+    return sorted(p.name for p in tmp_path.iterdir() if ".journal." in p.name)
+
+
+def test_replay_after_crash(tmp_path):
+    """测试未压缩就退出时，重新打开会从日志恢复cell"""
+    path = tmp_path / "nb.ipynb"
+    journal = NotebookJournal(str(path), fsync="never")
+    journal.load(_empty_notebook)
+    for i in range(3):
+        journal.append("cell", cell=_cell(f"x = {i}"))
+    # 模拟进程崩溃：不压缩直接丢弃
+    journal._file.close()
+
+    reopened = NotebookJournal(str(path), fsync="never")
+    notebook_data = reopened.load(_empty_notebook)
+
+    assert _sources(notebook_data) == ["x = 0", "x = 1", "x = 2"]
+    assert reopened.seq == 3
+    assert reopened.pending == 3
+    # 新记录的序号接在重放的记录之后
+    reopened.append("cell", cell=_cell("x = 3"))
+    reopened.close()
+    assert _sources(NotebookJournal(str(path)).load(_empty_notebook))[-1] == "x = 3"
+
+
+def test_compact_writes_notebook_and_removes_journal(tmp_path):
+    """测试压缩后 .ipynb 包含全部cell和序号，日志被删除"""
+    path = tmp_path / "nb.ipynb"
+    journal = NotebookJournal(str(path), fsync="never")
+    notebook_data = journal.load(_empty_notebook)
+    for i in range(2):
+        cell = _cell(f"y = {i}")
+        notebook_data["cells"].append(cell)
+        journal.append("cell", cell=cell)
+
+    journal.compact(notebook_data)
+
+    with open(path, encoding="utf-8") as f:
+        written = json.load(f)
+    assert _sources(written) == ["y = 0", "y = 1"]
+    assert written["metadata"]["journal_seq"] == 2
+    assert _journal_names(tmp_path) == []
+    assert journal.pending == 0
+
+
+def test_rotation_during_background_compaction(tmp_path):
+    """测试后台压缩期间追加的记录写入新日志，压缩后只删除已写入的日志"""
+    path = tmp_path / "nb.ipynb"
+    journal = NotebookJournal(str(path), fsync="never")
+    notebook_data = journal.load(_empty_notebook)
+    for i in range(3):
+        cell = _cell(f"z = {i}")
+        notebook_data["cells"].append(cell)
+        journal.append("cell", cell=cell)
+
+    journal.compact(notebook_data, background=True)
+    journal.append("cell", cell=_cell("z = 3"))
+    journal.wait()
+
+    assert _journal_names(tmp_path) == ["nb.ipynb.journal.jsonl"]
+    journal.close()
+    assert _sources(NotebookJournal(str(path)).load(_empty_notebook)) == ["z = 0", "z = 1", "z = 2", "z = 3"]
+
+
+def test_replay_skips_records_already_compacted(tmp_path):
+    """测试压缩写完notebook但没来得及删除日志时，重放不会重复添加cell"""
+    path = tmp_path / "nb.ipynb"
+    journal = NotebookJournal(str(path), fsync="never")
+    notebook_data = journal.load(_empty_notebook)
+    for i in range(2):
+        cell = _cell(f"w = {i}")
+        notebook_data["cells"].append(cell)
+        journal.append("cell", cell=cell)
+    journal._file.flush()
+    shutil.copy(journal.path, tmp_path / "saved.jsonl")
+
+    journal.compact(notebook_data)
+    # 模拟删除日志前崩溃：改名后的日志仍然存在
+    shutil.move(tmp_path / "saved.jsonl", tmp_path / "nb.ipynb.journal.2.jsonl")
+
+    reopened = NotebookJournal(str(path), fsync="never")
+    assert _sources(reopened.load(_empty_notebook)) == ["w = 0", "w = 1"]
+    assert reopened.pending == 0
+
+
+def test_torn_last_line(tmp_path):
+    """测试日志最后一行只写了一半时跳过它，新记录另起一行"""
+    path = tmp_path / "nb.ipynb"
+    journal = NotebookJournal(str(path), fsync="never")
+    journal.load(_empty_notebook)
+    journal.append("cell", cell=_cell("a = 1"))
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"op": "cell", "seq": 2, "cell": {"sou')
+
+    reopened = NotebookJournal(str(path), fsync="never")
+    assert _sources(reopened.load(_empty_notebook)) == ["a = 1"]
+    reopened.append("cell", cell=_cell("b = 2"))
+    reopened.close()
+
+    assert _sources(NotebookJournal(str(path)).load(_empty_notebook)) == ["a = 1", "b = 2"]
+
+
+def test_needs_compaction_threshold(tmp_path):
+    """测试按记录数触发压缩"""
+    journal = NotebookJournal(str(tmp_path / "nb.ipynb"), fsync="never", compact_records=3, compact_bytes=0)
+    notebook_data = journal.load(_empty_notebook)
+    for i in range(3):
+        assert not journal.needs_compaction()
+        journal.append("cell", cell=_cell(f"v = {i}"))
+    assert journal.needs_compaction()
+    journal.compact(notebook_data)
+    assert not journal.needs_compaction()
+    journal.close()
+
+
+def test_background_compaction_serializes_off_caller_thread(tmp_path, monkeypatch):
+    """测试后台压缩在后台线程序列化快照，之后追加的cell和元数据不写入本次压缩"""
+    import threading
+    from tools import notebook_journal
+
+    path = tmp_path / "nb.ipynb"
+    journal = NotebookJournal(str(path), fsync="never")
+    notebook_data = journal.load(_empty_notebook)
+    for i in range(2):
+        cell = _cell(f"u = {i}")
+        notebook_data["cells"].append(cell)
+        journal.append("cell", cell=cell)
+
+    threads = []
+    release = threading.Event()
+    dumps = notebook_journal.json.dumps
+
+    def slow_dumps(*args, **kwargs):
+        threads.append(threading.current_thread())
+        release.wait(5)
+        return dumps(*args, **kwargs)
+
+    monkeypatch.setattr(notebook_journal.json, "dumps", slow_dumps)
+    journal.compact(notebook_data, background=True)
+    # 压缩仍在进行时修改notebook
+    notebook_data["cells"].append(_cell("u = 2"))
+    notebook_data["metadata"]["checkpoints"] = [{"path": "ckpt"}]
+    release.set()
+    journal.wait()
+
+    assert threads and threading.current_thread() not in threads
+    with open(path, encoding="utf-8") as f:
+        written = json.load(f)
+    assert _sources(written) == ["u = 0", "u = 1"]
+    assert "checkpoints" not in written["metadata"]
+    journal.close()
@@ -0,0 +1,45 @@
+"""
+测试工具输出预算：省略标记和DataFrame摘要
+"""
+from tools.blob_store import BlobStore
+from tools.output_budget import FRAME_SUMMARY_MIME, compact_text, page_lines, render_outputs
+
+
+def _frame_output(text):
+    summary = {"kind": "DataFrame", "shape": [1000, 2], "dtypes": [["a", "int64"], ["b", "float64"]],
+               "head": "   a    b\n0  1  1.0", "tail": "     a    b\n999  1  1.0"}
+    return {"output_type": "execute_result", "execution_count": 1, "metadata": {},
+            "data": {"text/plain": text, FRAME_SUMMARY_MIME: summary}}
+
+
+def test_frame_summary_keeps_full_text_in_blob(tmp_path):
+    """测试DataFrame改用摘要时完整文本存入blob，摘要中给出引用"""
+    store = BlobStore(str(tmp_path / "blobs"))
+    text = "\n".join(f"{i}  1  1.0" for i in range(1000))
+
+    rendered = render_outputs([_frame_output(text)], frame_tokens=100, blob_store=store, reference="按引用读取")
+
+    assert "DataFrame（1000行 × 2列）" in rendered
+    assert "按引用读取" in rendered
+    digest = rendered.split("已存入blob ")[1].split("，")[0]
+    assert store.get(digest).decode("utf-8") == text
+
+
+def test_full_render_without_summary():
+    """测试不指定摘要阈值时返回完整文本"""
+    text = "\n".join(f"{i}  1  1.0" for i in range(1000))
+    assert render_outputs([_frame_output(text)]) == text
+
+
+def test_compact_and_page():
+    """测试超出预算时省略中间行，省略的行可以按行号分页读取"""
+    text = "\n".join(f"line {i}" for i in range(500))
+    compacted, omitted = compact_text(text, 100, "见notebook")
+    assert omitted
+    assert compacted.startswith("line 0")
+    assert compacted.endswith("line 499")
+    assert "见notebook" in compacted
+
+    page, start, end, total = page_lines(text, offset=100, limit=10)
+    assert (start, end, total) == (100, 110, 500)
+    assert page.split("\n")[0] == "line 100"
@@ -0,0 +1,118 @@
+"""
+测试Pandas Agent预加载数据文件的代码
+"""
+import pandas as pd
+import tools.columnar_store as columnar_store
+from agents.pandas_agent import PandasAgent
+from tools.columnar_store import ColumnarStore
+
+
+def _agent(compact_dtypes=False):
+    # 只测试生成代码，不创建LLM和kernel
+    agent = PandasAgent.__new__(PandasAgent)
+    agent.compact_dtypes = compact_dtypes
+    return agent
+
+
+def _run(code):
+    namespace = {}
+    exec(code, namespace)
+    return namespace
+
+
+def test_preload_reads_columnar_replica(tmp_path, monkeypatch):
+    """测试CSV没有副本时经由列式存储读取并写入副本，之后预加载直接读取Feather副本"""
+    monkeypatch.setattr(columnar_store, "_shared_store", ColumnarStore(str(tmp_path / "cache"), min_bytes=0))
+    path = tmp_path / "data.csv"
+    expected = pd.DataFrame({"a": range(50), "b": ["x", "y"] * 25})
+    expected.to_csv(path, index=False)
+    agent = _agent()
+
+    first = agent._preload_code(str(path), "df")
+    assert "read_table" not in first
+    pd.testing.assert_frame_equal(_run(first)["df"], expected)
+
+    second = agent._preload_code(str(path), "df")
+    assert "read_table" in second and "read_csv" not in second and "tools" not in second
+    namespace = _run(second)
+    # 与 ColumnarStore 读取副本一样，字符串列为object类型
+    pd.testing.assert_frame_equal(namespace["df"], expected, check_dtype=False)
+    assert "_feather" not in namespace
+
+    # 源文件修改后副本失效，重新读取CSV
+    pd.DataFrame({"a": [1], "b": ["z"]}).to_csv(path, index=False)
+    assert "read_table" not in agent._preload_code(str(path), "df")
+
+
+def test_preload_compacts_replica(tmp_path, monkeypatch):
+    """测试类型压缩加载同样从副本读取"""
+    monkeypatch.setattr(columnar_store, "_shared_store", ColumnarStore(str(tmp_path / "cache"), min_bytes=0))
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"a": range(50), "b": ["x", "y"] * 25}).to_csv(path, index=False)
+    agent = _agent(compact_dtypes=True)
+    _run(agent._preload_code(str(path), "df"))
+
+    code = agent._preload_code(str(path), "df")
+    assert "read_table" in code
+    df = _run(code)["df"]
+    assert df["b"].dtype == "category"
+    assert df["a"].dtype.itemsize < 8
+
+
+def test_probe_and_prompt_use_catalog_profile(tmp_path, monkeypatch):
+    """测试统计目录中有画像时探测直接返回画像，prompt中的探测信息同样被画像代替"""
+    import tools.file_probe as file_probe
+    import tools.stats_catalog as stats_catalog
+    monkeypatch.setattr(stats_catalog, "_shared_catalog",
+                        stats_catalog.StatsCatalog(db_path=str(tmp_path / "catalog.sqlite")))
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"a": [1, None, 3], "b": ["x", "y", "z"]}).to_csv(path, index=False)
+
+    probed = file_probe.probe_file(str(path))
+    assert "null_counts" not in probed
+    # 之后有其他工具写入了完整画像
+    stats_catalog.store_profile(str(path), file_probe._scan_chunks(str(path)))
+    upgraded = PandasAgent._with_catalog_profile(probed)
+    assert upgraded["null_counts"]["a"] == 1 and upgraded["row_count"] == 3
+
+    # 新的探测命中统计目录，不再读取样本和扫描行数
+    file_probe._probe_memo.clear()
+    monkeypatch.setattr(file_probe.pd, "read_csv", lambda *args, **kwargs: 1 / 0)
+    monkeypatch.setattr(file_probe, "count_csv_rows", lambda *args, **kwargs: 1 / 0)
+    info = file_probe.probe_file(str(path))
+    assert info["error"] is None
+    assert info["null_counts"]["a"] == 1 and info["row_count"] == 3
+
+
+def test_background_profile_skips_catalogued_files(tmp_path, monkeypatch):
+    """测试后台画像只计算探测时没有得到画像的文件，超时的文件保留探测信息"""
+    import agents.pandas_agent as pandas_agent
+    calls = []
+
+    def fake_profile_files(paths, timeout=None):
+        calls.append(paths)
+        return [{"path": p, "exists": True, "partial": True, "error": "超时"} if "slow" in p
+                else {"path": p, "exists": True, "null_counts": {}, "error": None} for p in paths]
+
+    monkeypatch.setattr(pandas_agent, "profile_files", fake_profile_files)
+    agent = _agent()
+    agent.profile_timeout = 1
+    agent._build_agent = lambda: None
+    agent.file_infos = [
+        {"path": "done.csv", "exists": True, "null_counts": {"a": 0}, "error": None},
+        {"path": "new.csv", "exists": True, "error": None},
+        {"path": "slow.csv", "exists": True, "error": None},
+        {"path": "missing.csv", "exists": False, "error": None},
+    ]
+
+    agent._profile_datasets()
+
+    assert calls == [["new.csv", "slow.csv"]]
+    assert agent.file_infos[0]["null_counts"] == {"a": 0}
+    assert "null_counts" in agent.file_infos[1]
+    assert "partial" not in agent.file_infos[2]
+
+    calls.clear()
+    agent.file_infos = agent.file_infos[:2]
+    agent._profile_datasets()
+    assert calls == []
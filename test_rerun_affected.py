@@ -0,0 +1,83 @@
+"""
+测试数据更新后按数据流增量重新执行cell
+"""
+import pandas as pd
+import pytest
+from tools.ipython_executor import IPythonExecutor
+from tools.kernel_pool import KernelPool
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    monkeypatch.setenv("IPYTHON_CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setenv("IPYTHON_CELL_CACHE", str(tmp_path / "cell_cache.sqlite"))
+    executor = IPythonExecutor(notebook_path=str(tmp_path / "rerun.ipynb"), kernel_pool=KernelPool(size=0),
+                               memoize=False)
+    yield executor
+    executor.stop_kernel()
+
+
+def _run(executor, code):
+    result = executor.execute_code(code)
+    assert not result.get("error"), result
+    return result["execution_count"]
+
+
+def _text(result):
+    return "".join(output.get("text", "") for output in result["outputs"] if output["output_type"] == "stream")
+
+
+def test_rerun_variable_dependents(executor):
+    """测试变量改变后只重新执行读取它的cell及其下游cell"""
+    first = _run(executor, "a = 1")
+    second = _run(executor, "b = a * 10")
+    _run(executor, "c = 5")
+    fourth = _run(executor, "print(b + c)")
+    _run(executor, "a = 2")
+
+    report = executor.rerun_affected(["a"])
+
+    assert report["affected"] == [second, fourth]
+    assert report["skipped"] == []
+    assert [r["rerun_of"] for r in report["results"]] == [second, fourth]
+    assert _text(report["results"][-1]).strip() == "25"
+    assert first not in report["affected"]
+
+    # 再次刷新时执行的是最新版本，rerun_of 仍指向最初的cell
+    _run(executor, "a = 3")
+    report = executor.rerun_affected(["a"])
+    assert report["affected"] == [second, fourth]
+    assert _text(report["results"][-1]).strip() == "35"
+
+
+def test_rerun_file_dependents(executor, tmp_path):
+    """测试文件内容更新后重新执行以常量路径读取它的cell及其下游cell"""
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"x": [1, 2, 3]}).to_csv(path, index=False)
+    _run(executor, "import pandas as pd")
+    load = _run(executor, f"df = pd.read_csv({str(path)!r})")
+    total = _run(executor, "total = int(df['x'].sum())")
+    show = _run(executor, "print(total)")
+    _run(executor, "unrelated = 1")
+
+    assert executor.affected_cells(["unrelated_name"]) == []
+    pd.DataFrame({"x": [10, 20, 30]}).to_csv(path, index=False)
+    report = executor.rerun_affected([str(path)])
+
+    assert report["affected"] == [load, total, show]
+    assert _text(report["results"][-1]).strip() == "60"
+
+
+def test_rerun_stops_on_error(executor):
+    """测试有cell出错时停止执行其余受影响的cell"""
+    _run(executor, "n = 2")
+    ratio = _run(executor, "ratio = 10 / n")
+    show = _run(executor, "print(ratio)")
+    _run(executor, "n = 0")
+
+    report = executor.rerun_affected(["n"])
+
+    assert report["affected"] == [ratio, show]
+    assert len(report["results"]) == 1
+    assert report["results"][0]["error"]
+    assert report["skipped"] == [show]
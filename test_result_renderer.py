@@ -0,0 +1,126 @@
+"""
+测试结果分页、字节截断和完整结果文件
+"""
+import os
+import re
+import pandas as pd
+from tools.result_renderer import TRUNCATION_MARKER, page_bounds, render_page, truncate_to_bytes
+
+
+def _saved_path(text):
+    match = re.search(r"结果已写入: (.+?):?$", text, re.M)
+    return match.group(1) if match else None
+
+
+def test_page_bounds():
+    """测试页码、偏移和越界"""
+    assert page_bounds(120, page=2, limit=50) == (50, 100)
+    assert page_bounds(120, page=3, limit=50) == (100, 120)
+    assert page_bounds(120, offset=200) == (120, 120)
+    assert page_bounds(10) == (0, 10)
+
+
+def test_truncate_to_bytes_keeps_utf8_and_lines():
+    """测试按字节截断时不切断多字节字符，并在换行处截断"""
+    text = "第一行\n第二行\n第三行"
+    cut, truncated = truncate_to_bytes(text, 20)
+    assert truncated
+    assert cut == "第一行\n第二行"
+    assert truncate_to_bytes(text, 1000) == (text, False)
+
+
+def test_complete_output_not_saved(tmp_path):
+    """测试完整显示的结果不写文件"""
+    df = pd.DataFrame({"a": range(5)})
+    text = render_page("查询结果", df, len(df), 0, full_result=df, result_dir=str(tmp_path))
+    assert _saved_path(text) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_byte_truncated_output_saved(tmp_path):
+    """测试输出被字节截断时写入完整结果文件"""
+    df = pd.DataFrame({"text": ["很长的文本内容" * 10] * 30})
+    text = render_page("查询结果", df, len(df), 0, max_bytes=500, full_result=df, result_dir=str(tmp_path))
+
+    assert TRUNCATION_MARKER in text
+    path = _saved_path(text)
+    assert path is not None and "完整结果已写入" in text
+    assert len(pd.read_csv(path)) == len(df)
+
+
+def test_paged_output_saved(tmp_path):
+    """测试只显示了一页时写入全部结果（例如sort带limit），标题说明写入的行数"""
+    full = pd.DataFrame({"a": range(100)})
+    text = render_page("排序结果", full.head(10), 1000, 0, full_result=full, result_dir=str(tmp_path))
+
+    assert "显示第1-10行" in text
+    assert "前100行结果已写入" in text
+    assert pd.read_csv(_saved_path(text))["a"].tolist() == list(range(100))
+
+
+def test_existing_result_file_reused(tmp_path):
+    """测试已写好的结果文件（流式执行）直接引用，不重复写入"""
+    existing = tmp_path / "streamed.csv"
+    existing.write_text("a\n1\n")
+    text = render_page("筛选结果", pd.DataFrame({"a": [1]}), 5000, 0, result_file=str(existing),
+                       full_result=pd.DataFrame({"a": [1]}), result_dir=str(tmp_path / "unused"))
+    assert _saved_path(text) == str(existing)
+    assert not (tmp_path / "unused").exists()
+
+
+def test_keyed_result_written_once(tmp_path):
+    """测试同一结果翻页时复用同一个文件，不重复写入"""
+    source = tmp_path / "data.csv"
+    pd.DataFrame({"a": range(300)}).to_csv(source, index=False)
+    from tools.pandas_tool import PandasTool
+    results = tmp_path / "results"
+    tool = PandasTool(result_dir=str(results))
+
+    paths = [_saved_path(tool._run(operation="filter", file_path=str(source), query="a > 10", page=page))
+             for page in (1, 2, 3)]
+    assert len(set(paths)) == 1
+    assert len(list(results.iterdir())) == 1
+    written = os.stat(paths[0]).st_mtime_ns
+
+    # 另一个查询写入新文件，原文件不被重写
+    other = _saved_path(tool._run(operation="filter", file_path=str(source), query="a > 20", page=2))
+    assert other != paths[0]
+    assert os.stat(paths[0]).st_mtime_ns == written
+    assert pd.read_csv(other)["a"].min() == 21
+
+
+def test_streamed_result_reused_across_pages(tmp_path):
+    """测试流式筛选翻页时复用结果文件，不重新扫描源文件"""
+    source = tmp_path / "data.csv"
+    pd.DataFrame({"a": range(300)}).to_csv(source, index=False)
+    from tools import streaming_ops
+    from tools.pandas_tool import PandasTool
+    results = tmp_path / "results"
+    tool = PandasTool(result_dir=str(results), streaming_threshold=1, chunksize=50)
+
+    first = tool._run(operation="filter", file_path=str(source), query="a >= 100", limit=10)
+    calls = []
+    original = streaming_ops.stream_filter
+    streaming_ops.stream_filter = lambda *args, **kwargs: calls.append(args) or original(*args, **kwargs)
+    try:
+        second = tool._run(operation="filter", file_path=str(source), query="a >= 100", limit=10, page=3)
+    finally:
+        streaming_ops.stream_filter = original
+    assert calls == []
+    assert _saved_path(first) == _saved_path(second)
+    assert "显示第21-30行" in second and "120" in second
+    assert len(list(results.iterdir())) == 1
+
+
+def test_result_directory_pruned(tmp_path, monkeypatch):
+    """测试结果目录超过文件数上限时删除最久未使用的结果"""
+    monkeypatch.setenv("PANDAS_RESULT_MAX_FILES", "3")
+    full = pd.DataFrame({"a": range(100)})
+    paths = []
+    for i in range(5):
+        text = render_page("查询结果", full.head(10), 100, 0, full_result=full,
+                           result_dir=str(tmp_path), result_key=f"key{i}")
+        paths.append(_saved_path(text))
+        os.utime(paths[-1], ns=(i * 10 ** 9, i * 10 ** 9))
+    remaining = sorted(p.name for p in tmp_path.iterdir())
+    assert remaining == ["result_key2.csv", "result_key3.csv", "result_key4.csv"]
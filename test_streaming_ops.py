@@ -0,0 +1,137 @@
+"""
+测试分块流式执行的结果与一次读入内存后的pandas结果一致
+"""
+import numpy as np
+import pandas as pd
+from tools.streaming_ops import (
+    RunningStats, external_sort, stream_describe, stream_filter, stream_groupby_mean,
+)
+
+
+CHUNKSIZE = 97
+
+
+def _write_data(tmp_path, rows=1000):
+    rng = np.random.default_rng(1)
+    price = rng.normal(100, 20, size=rows).round(2)
+    price[rng.choice(rows, size=30, replace=False)] = np.nan
+    df = pd.DataFrame({
+        "id": np.arange(rows),
+        "city": rng.choice(["北京", "上海", "广州", "深圳"], size=rows),
+        "year": rng.integers(2018, 2023, size=rows),
+        "price": price,
+        "qty": rng.integers(1, 50, size=rows),
+    })
+    path = tmp_path / "data.csv"
+    df.to_csv(path, index=False)
+    return str(path), pd.read_csv(path)
+
+
+def test_stream_filter_matches_query(tmp_path):
+    """测试流式筛选的匹配行数、预览和输出文件"""
+    path, df = _write_data(tmp_path)
+    output = tmp_path / "filtered.csv"
+    expected = df.query("price > 110")[["id", "price"]]
+
+    total, preview = stream_filter(path, "price > 110", str(output), selected=["id", "price"],
+                                   chunksize=CHUNKSIZE, preview_rows=10)
+
+    assert total == len(expected)
+    assert preview["id"].tolist() == expected["id"].head(10).tolist()
+    written = pd.read_csv(output)
+    pd.testing.assert_frame_equal(written, expected.reset_index(drop=True))
+
+
+def test_stream_describe_matches_describe(tmp_path):
+    """测试流式describe与DataFrame.describe()一致（样本容量内分位数是精确值）"""
+    path, df = _write_data(tmp_path)
+    expected = df.select_dtypes(include="number").describe()
+
+    result = stream_describe(path, chunksize=CHUNKSIZE)
+
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_exact=False, rtol=1e-9)
+
+
+def test_running_stats_merge():
+    """测试分别累积后合并与一次性累积的统计量一致"""
+    values = np.random.default_rng(2).normal(size=5000)
+    whole, left, right = RunningStats(), RunningStats(), RunningStats()
+    whole.update(values)
+    left.update(values[:1234])
+    right.update(values[1234:])
+    left.merge(right)
+
+    assert left.count == whole.count == 5000
+    assert np.isclose(left.mean, values.mean())
+    assert np.isclose(left.std(), values.std(ddof=1))
+    assert left.min == values.min() and left.max == values.max()
+
+
+def test_stream_groupby_mean_matches_groupby(tmp_path):
+    """测试流式分组均值与 groupby().mean() 一致"""
+    path, df = _write_data(tmp_path)
+    for keys in (["city"], ["city", "year"]):
+        columns = keys + ["price", "qty"]
+        expected = df[columns].groupby(keys).mean()
+
+        result = stream_groupby_mean(path, keys, columns=columns, chunksize=CHUNKSIZE)
+
+        pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-9)
+
+
+def test_stream_groupby_mean_rejects_text_columns(tmp_path):
+    """测试对非数值列求均值时报错"""
+    path, _ = _write_data(tmp_path)
+    try:
+        stream_groupby_mean(path, ["year"], columns=["year", "city"], chunksize=CHUNKSIZE)
+    except TypeError as e:
+        assert "city" in str(e)
+    else:
+        raise AssertionError("应当拒绝对非数值列求均值")
+
+
+def test_external_sort_matches_sort_values(tmp_path):
+    """测试外部归并排序的输出与 sort_values 一致，空值排在最后"""
+    path, df = _write_data(tmp_path)
+    for ascending in (True, False):
+        output = tmp_path / f"sorted_{ascending}.csv"
+        expected = df.sort_values(by="price", ascending=ascending, kind="mergesort")
+
+        total, preview = external_sort(path, "price", ascending, str(output), chunksize=CHUNKSIZE,
+                                       preview_rows=20, spill_dir=str(tmp_path))
+
+        assert total == len(df)
+        written = pd.read_csv(output)
+        # 排序列没有并列值时整行顺序也一致
+        pd.testing.assert_frame_equal(written, expected.reset_index(drop=True))
+        assert preview["id"].tolist() == expected["id"].head(20).tolist()
+        assert written["price"].tail(30).isna().all()
+
+
+def test_external_sort_with_ties(tmp_path):
+    """测试排序列有大量并列值时的顺序和行集合"""
+    path, df = _write_data(tmp_path)
+    output = tmp_path / "sorted.csv"
+    expected = df.sort_values(by="qty", kind="mergesort")
+
+    total, _ = external_sort(path, "qty", True, str(output), selected=["id", "qty"],
+                             chunksize=CHUNKSIZE, spill_dir=str(tmp_path))
+
+    written = pd.read_csv(output)
+    assert total == len(df)
+    assert written["qty"].tolist() == expected["qty"].tolist()
+    assert sorted(written["id"]) == sorted(df["id"])
+
+
+def test_streaming_describe_reports_profile_error(tmp_path, monkeypatch):
+    """测试流式describe的画像出错时返回错误信息，而不是抛出KeyError"""
+    import tools.pandas_tool as pandas_tool
+    path = tmp_path / "data.csv"
+    pd.DataFrame({"a": range(10)}).to_csv(path, index=False)
+    monkeypatch.setattr(pandas_tool, "profile_file",
+                        lambda file_path: {"path": file_path, "error": "文件损坏", "partial": True})
+    tool = pandas_tool.PandasTool(streaming_threshold=1)
+
+    result = tool._run(operation="describe", file_path=str(path))
+
+    assert result == "错误：计算统计信息失败: 文件损坏"
@@ -0,0 +1,79 @@
+"""
+测试Top-k选择与全量排序结果一致
+"""
+import numpy as np
+import pandas as pd
+from tools.topk import top_k, stream_top_k
+
+
+def _frame():
+    """包含大量并列值和空值的数据"""
+    rng = np.random.default_rng(0)
+    value = rng.integers(0, 10, size=500).astype(float)
+    value[rng.choice(500, size=40, replace=False)] = np.nan
+    return pd.DataFrame({
+        "value": value,
+        "tiebreak": rng.integers(0, 3, size=500),
+        "label": [f"row{i}" for i in range(500)],
+    })
+
+
+def _expected(df, by, k, ascending):
+    return df.sort_values(by=by, ascending=ascending, kind="mergesort").head(k)
+
+
+def test_top_k_matches_sort_values():
+    """测试升序、降序和多列排序时结果与sort_values一致（包括并列行的顺序）"""
+    df = _frame()
+    for by in (["value"], ["value", "tiebreak"]):
+        for ascending in (True, False):
+            for k in (1, 7, 50):
+                pd.testing.assert_frame_equal(top_k(df, by, k, ascending), _expected(df, by, k, ascending))
+
+
+def test_top_k_nan_last():
+    """测试k超过非空行数时空值行排在最后"""
+    df = _frame()
+    non_null = int(df["value"].notna().sum())
+    for ascending in (True, False):
+        result = top_k(df, ["value"], non_null + 10, ascending)
+        pd.testing.assert_frame_equal(result, _expected(df, ["value"], non_null + 10, ascending))
+        assert result["value"].iloc[:non_null].notna().all()
+        assert result["value"].iloc[non_null:].isna().all()
+
+
+def test_top_k_nan_in_tiebreak_column():
+    """测试后面的排序列含空值时结果与sort_values一致"""
+    df = _frame()
+    df["tiebreak"] = df["tiebreak"].astype(float)
+    df.loc[df.index % 7 == 0, "tiebreak"] = np.nan
+    for ascending in (True, False):
+        for k in (10, 480):
+            result = top_k(df, ["value", "tiebreak"], k, ascending)
+            pd.testing.assert_frame_equal(result, _expected(df, ["value", "tiebreak"], k, ascending))
+
+
+def test_top_k_all_nan_and_empty():
+    """测试全部为空值以及k不大于0的情况"""
+    df = pd.DataFrame({"value": [np.nan, np.nan, np.nan], "label": ["a", "b", "c"]})
+    pd.testing.assert_frame_equal(top_k(df, ["value"], 2), _expected(df, ["value"], 2, False))
+    assert len(top_k(df, ["value"], 0)) == 0
+
+
+def test_top_k_non_numeric_column():
+    """测试非数值排序列退化为全量排序"""
+    df = _frame()
+    pd.testing.assert_frame_equal(top_k(df, ["label"], 5, True), _expected(df, ["label"], 5, True))
+
+
+def test_stream_top_k_matches_in_memory(tmp_path):
+    """测试分块读取的Top-k与一次读入后排序的结果一致"""
+    df = _frame()
+    path = tmp_path / "data.csv"
+    df.to_csv(path, index=False)
+    full = pd.read_csv(path)
+    for ascending in (True, False):
+        for k in (5, 480):
+            total, result = stream_top_k(str(path), ["value", "tiebreak"], k, ascending, chunksize=37)
+            assert total == len(full)
+            pd.testing.assert_frame_equal(result, _expected(full, ["value", "tiebreak"], k, ascending))
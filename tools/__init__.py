@@ -1,24 +1,48 @@
 """
 Tools模块
 包含所有Agent使用的工具
+
+导出的类和函数按需导入：kernel中会导入检查点、指纹等轻量模块（tools.kernel_checkpoint、tools.cell_cache），
+导入包时不能加载langchain、jupyter_client，也不能注册宿主进程的atexit处理函数
 """
-# 导入IPython工具
-from .ipython_executor import IPythonExecutor
-from .ipython_tool import IPythonCodeTool, IPythonNotebookTool
+from importlib import import_module
+
+# 导出名 -> 所在模块
+_EXPORTS = {
+    # IPython工具
+    'IPythonExecutor': '.ipython_executor',
+    'get_executor': '.ipython_executor',
+    'acquire_executor': '.ipython_executor',
+    'release_executor': '.ipython_executor',
+    'AsyncIPythonExecutor': '.async_ipython_executor',
+    'IPythonCodeTool': '.ipython_tool',
+    'IPythonNotebookTool': '.ipython_tool',
+    # 基础工具
+    'ShellCommandTool': '.shell_command_tool',
+    'PandasTool': '.pandas_tool',
+    'TodoTool': '.todo_tool',
+    'DatasetCache': '.dataset_cache',
+    'get_dataset_cache': '.dataset_cache',
+    'ColumnarStore': '.columnar_store',
+    'get_columnar_store': '.columnar_store',
+    'KernelPool': '.kernel_pool',
+    'get_kernel_pool': '.kernel_pool',
+}
+
+__all__ = list(_EXPORTS)
+
 
-# 导入基础工具
-from .shell_command_tool import ShellCommandTool
-from .pandas_tool import PandasTool
-from .todo_tool import TodoTool
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
 
-__all__ = [
-    'IPythonExecutor', 
-    'IPythonCodeTool', 
-    'IPythonNotebookTool',
-    'ShellCommandTool',
-    'PandasTool',
-    'TodoTool',
-]
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
 
 
 def get_all_tools(enable_ipython: bool = True):
@@ -31,6 +55,10 @@ def get_all_tools(enable_ipython: bool = True):
     Returns:
         工具列表
     """
+    from .shell_command_tool import ShellCommandTool
+    from .pandas_tool import PandasTool
+    from .todo_tool import TodoTool
+
     tools = [
         ShellCommandTool(),
         PandasTool(),
@@ -40,6 +68,7 @@ def get_all_tools(enable_ipython: bool = True):
     # 添加IPython工具
     if enable_ipython:
         try:
+            from .ipython_tool import IPythonCodeTool, IPythonNotebookTool
             tools.extend([
                 IPythonCodeTool(),
                 IPythonNotebookTool()
@@ -48,4 +77,3 @@ def get_all_tools(enable_ipython: bool = True):
             print(f"警告：IPython工具未启用，原因: {e}")
     
     return tools
-
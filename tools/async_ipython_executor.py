@@ -0,0 +1,214 @@
+"""
+基于asyncio的IPython Kernel执行器
+使用jupyter_client的异步客户端等待kernel消息，等待期间不占用线程，
+一个事件循环可以同时驱动多个kernel，适合在一个进程中服务大量并发的分析会话。
+cell的记录、结果缓存、超时和kernel退出的处理、检查点恢复与 IPythonExecutor 共用 KernelExecutorBase，
+消息经 AsyncMessageRouter 按msg_id分发。
+"""
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+from jupyter_client.asynchronous import AsyncKernelClient
+from tools.ipython_executor import (FINGERPRINT_TIMEOUT, INTERRUPT_TIMEOUT, KernelExecutorBase,
+                                    describe_kernel_death, fingerprint_expression, parse_fingerprints)
+from tools.kernel_pool import KernelPool
+from tools.kernel_router import AsyncMessageRouter, Execution, KernelDiedError
+
+
+class AsyncIPythonExecutor(KernelExecutorBase):
+    """异步IPython Kernel执行器，将执行记录保存为notebook格式"""
+
+    def __init__(self, kernel_name: str = "python3", notebook_path: str = "execution_history.ipynb",
+                 kernel_pool: Optional[KernelPool] = None, cell_timeout: Optional[float] = None,
+                 memoize: Optional[bool] = None):
+        """
+        初始化异步IPython执行器，参数见 KernelExecutorBase
+        """
+        # 串行化同一个kernel上的执行（包括检查点的保存和恢复）；不同执行器之间互不阻塞
+        self._execution_lock = asyncio.Lock()
+        self._start_lock = asyncio.Lock()
+        super().__init__(kernel_name, notebook_path, kernel_pool, cell_timeout, memoize)
+
+    async def start_kernel(self):
+        """启动kernel：在线程中从kernel池取一个就绪的kernel，再用异步客户端连接"""
+        async with self._start_lock:
+            if self.km is not None:
+                return
+            km, kc = await asyncio.to_thread(self._pool().acquire)
+            # 池中的kernel带有阻塞客户端，换成异步客户端
+            kc.stop_channels()
+            client = AsyncKernelClient(**km.get_connection_info(session=True))
+            client.start_channels()
+            self.km, self.kc = km, client
+            self.router = AsyncMessageRouter(client, km.is_alive)
+
+    async def stop_kernel(self):
+        """停止kernel，并把日志中的cell写入notebook"""
+        if self.kc is not None:
+            self.kc.stop_channels()
+            self.kc = None
+        await asyncio.to_thread(self.close)
+
+    def close(self):
+        """同步停止kernel，用于没有事件循环的场合（例如对象销毁时）"""
+        self.flush_notebook()
+        kc, km = self.kc, self.km
+        self.kc = None
+        self.km = None
+        self.router = None
+        if kc is not None:
+            kc.stop_channels()
+        if km is not None:
+            try:
+                km.shutdown_kernel(now=True)
+            except Exception as e:
+                print(f"警告：关闭kernel失败: {e}")
+
+    async def restart_kernel(self, restore: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        重启kernel（从池中取一个新的kernel），可选从最近的检查点恢复命名空间
+
+        Args:
+            restore: 是否恢复最近的检查点
+
+        Returns:
+            恢复结果，没有恢复时为None
+        """
+        async with self._execution_lock:
+            return await self._restart(restore)
+
+    async def _restart(self, restore: bool) -> Optional[Dict[str, Any]]:
+        # 调用方持有 _execution_lock
+        await self.stop_kernel()
+        await self.start_kernel()
+        if restore and self.latest_checkpoint() is not None:
+            return await self._restore()
+        return None
+
+    async def execute_code(self, code: str, cell_type: str = "code",
+                           metadata: Optional[Dict[str, Any]] = None,
+                           on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                           timeout: Optional[float] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        执行Python代码并记录到notebook
+
+        超时时先中断kernel，中断无效再重启kernel（有检查点时恢复）；kernel因资源限制退出时也会重启，
+        结果包含 failure 字段，与 IPythonExecutor.execute_code 相同。
+        执行cell的任务被取消时中断kernel，已收到的输出照常记录到notebook（cell元数据标记 interrupted），然后重新抛出。
+
+        Args:
+            code: 要执行的Python代码
+            cell_type: cell类型（code或markdown）
+            metadata: 额外的元数据
+            on_output: 每收到一个输出时立即调用
+            timeout: 本cell的超时时间（秒），None表示使用执行器的 cell_timeout，0表示不限制
+            use_cache: 为False时跳过缓存，强制在kernel中执行（执行结果仍会更新缓存）
+
+        Returns:
+            执行结果字典，包含outputs、execution_count、error，与 IPythonExecutor.execute_code 相同
+        """
+        async with self._execution_lock:
+            if self.kc is None:
+                await self.start_kernel()
+
+            with self.lock:
+                execution_count, cell, analysis = self._begin_cell(code, cell_type, metadata)
+            if analysis is None:
+                return {"execution_count": execution_count, "outputs": [], "error": None}
+
+            key = await self._memo_key(code, analysis) if self.memoize else None
+            cached = self._cached_result(key, use_cache, cell, execution_count, on_output)
+            if cached is not None:
+                return cached
+
+            timeout = self._resolve_timeout(timeout)
+            started = time.monotonic()
+            execution = self.router.execute(code, execution_count=execution_count, on_output=on_output)
+            failure = None
+            try:
+                await self.router.wait(execution, timeout)
+            except asyncio.CancelledError:
+                await self._cancel(execution)
+                with self.lock:
+                    self._record_execution(cell, execution, interrupted=True)
+                raise
+            except TimeoutError:
+                failure = await self._handle_timeout(execution, timeout)
+            except KernelDiedError:
+                failure = await self._handle_kernel_death(execution)
+            return self._finish(cell, execution, key, started, failure)
+
+    async def _cancel(self, execution: Execution, timeout: float = INTERRUPT_TIMEOUT) -> bool:
+        """中断kernel并等待被中断的执行结束，返回中断是否生效；没有生效时放弃等待"""
+        self.interrupt()
+        try:
+            await self.router.wait(execution, timeout)
+            return True
+        except (TimeoutError, KernelDiedError) as e:
+            print(f"警告：中断执行后未能等到kernel回应: {e}")
+            self.router.discard(execution)
+            return False
+
+    async def _handle_timeout(self, execution: Execution, timeout: float) -> Dict[str, Any]:
+        """超时：先中断，中断无效时重启kernel，返回失败信息"""
+        if await self._cancel(execution):
+            return self._timeout_failure(execution, timeout, None)
+        return self._timeout_failure(execution, timeout, await self._restart_after_failure())
+
+    async def _handle_kernel_death(self, execution: Execution) -> Dict[str, Any]:
+        """kernel在执行中退出：根据退出码判断原因，重启kernel，返回失败信息"""
+        death = describe_kernel_death(self.km, self._pool())
+        return self._death_failure(execution, death, await self._restart_after_failure())
+
+    async def _restart_after_failure(self) -> str:
+        """重启kernel并尝试从最近的检查点恢复，返回给用户的说明"""
+        try:
+            report = await self._restart(restore=True)
+        except Exception as e:
+            return f"重启kernel失败: {e}"
+        return self._describe_restart(report)
+
+    async def checkpoint(self, path: Optional[str] = None, timeout: float = 600) -> Dict[str, Any]:
+        """保存kernel用户命名空间的检查点，参数和返回值见 IPythonExecutor.checkpoint"""
+        async with self._execution_lock:
+            path, code = self._checkpoint_request(path)
+            reply = await self._run_silent(code, timeout)
+        # 记录检查点会重写notebook文件，不在事件循环中执行
+        return await asyncio.to_thread(self._record_checkpoint, path, reply)
+
+    async def restore(self, path: Optional[str] = None, timeout: float = 600) -> Dict[str, Any]:
+        """从检查点恢复kernel用户命名空间，参数和返回值见 IPythonExecutor.restore"""
+        async with self._execution_lock:
+            return await self._restore(path, timeout)
+
+    async def _restore(self, path: Optional[str] = None, timeout: float = 600) -> Dict[str, Any]:
+        # 调用方持有 _execution_lock
+        path, report_path, code = self._restore_request(path)
+        if self.kc is None:
+            await self.start_kernel()
+        reply = await self._run_silent(code, timeout)
+        return self._read_restore_report(reply, path, report_path)
+
+    async def _run_silent(self, code: str, timeout: float) -> Dict[str, Any]:
+        """静默执行代码（不占用执行计数），返回execute_reply的content"""
+        execution = await self.router.run(code, timeout=timeout, silent=True, store_history=False)
+        return execution.reply
+
+    async def _memo_key(self, code: str, analysis: Dict[str, Any]) -> Optional[str]:
+        """只读cell的缓存键，见 KernelExecutorBase._memo_key_from"""
+        variables = await self._fingerprint_variables(analysis["uses"]) if analysis["pure"] else None
+        return self._memo_key_from(code, analysis, variables)
+
+    async def _fingerprint_variables(self, names: List[str]) -> Optional[Dict[str, Any]]:
+        """在kernel中计算变量指纹，有变量无法计算指纹时返回None"""
+        if not names:
+            return {}
+        execution = self.router.execute("", silent=True, store_history=False,
+                                        user_expressions={"fingerprints": fingerprint_expression(names)})
+        try:
+            await self.router.wait(execution, FINGERPRINT_TIMEOUT)
+        except (TimeoutError, KernelDiedError) as e:
+            self.router.discard(execution)
+            print(f"警告：计算变量指纹失败（{e}），本cell不使用缓存")
+            return None
+        return parse_fingerprints(execution.reply)
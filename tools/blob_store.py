@@ -0,0 +1,181 @@
+"""
+Notebook输出的内容寻址存储
+超过阈值的富输出（image/png、text/html 等）按内容的SHA-256存放在blob目录中，相同的图只存一份；
+notebook中只保留引用（输出的 metadata.blobs），text/plain 仍然内联，Jupyter直接打开时显示文本表示。
+导出时按引用读回（rehydrate）；可选用PIL重新压缩或缩小PNG（未安装PIL时跳过）。
+"""
+import base64
+import copy
+import hashlib
+import io
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# 超过该字节数的输出移入blob目录，可通过环境变量 IPYTHON_BLOB_MIN_BYTES 配置，0表示不移出
+DEFAULT_MIN_BYTES = 16 * 1024
+
+# notebook所在目录下的blob目录名，同一目录的notebook共用；可通过环境变量 IPYTHON_BLOB_DIR 指定其他目录
+BLOB_DIR_NAME = ".ipynb_blobs"
+
+# 始终内联的类型：notebook直接打开时的文本表示，摘要和历史也读取它
+INLINE_MIME_TYPES = ("text/plain",)
+
+# 以base64字符串保存在notebook中的类型，blob中存解码后的原始字节
+BASE64_MIME_TYPES = ("image/png", "image/jpeg", "image/gif", "application/pdf")
+
+# 输出metadata中记录引用的键
+BLOB_METADATA_KEY = "blobs"
+
+
+class BlobStore:
+    """内容寻址的输出存储"""
+
+    def __init__(self, directory: str, min_bytes: Optional[int] = None,
+                 png_optimize: Optional[bool] = None, png_max_side: Optional[int] = None):
+        """
+        初始化blob存储
+
+        Args:
+            directory: blob目录
+            min_bytes: 移出的输出大小阈值（字节），0表示不移出
+            png_optimize: 是否用PIL重新压缩PNG，None表示读取环境变量 IPYTHON_BLOB_PNG_OPTIMIZE
+            png_max_side: PNG最长边的像素上限，超过时等比缩小，0表示不缩小；
+                None表示读取环境变量 IPYTHON_BLOB_PNG_MAX_SIDE
+        """
+        self.directory = Path(directory)
+        self.min_bytes = min_bytes if min_bytes is not None else \
+            int(os.getenv("IPYTHON_BLOB_MIN_BYTES", DEFAULT_MIN_BYTES))
+        self.png_optimize = png_optimize if png_optimize is not None else \
+            os.getenv("IPYTHON_BLOB_PNG_OPTIMIZE", "").lower() in ("1", "true")
+        self.png_max_side = png_max_side if png_max_side is not None else \
+            int(os.getenv("IPYTHON_BLOB_PNG_MAX_SIDE", 0))
+        if (self.png_optimize or self.png_max_side) and Image is None:
+            print("警告：未安装Pillow，不重新压缩PNG")
+
+    @classmethod
+    def for_notebook(cls, notebook_path: str) -> "BlobStore":
+        """notebook对应的blob存储：环境变量 IPYTHON_BLOB_DIR，默认为notebook所在目录下的 .ipynb_blobs"""
+        directory = os.getenv("IPYTHON_BLOB_DIR") or os.path.join(
+            os.path.dirname(os.path.abspath(notebook_path)), BLOB_DIR_NAME)
+        return cls(directory)
+
+    def path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def put(self, data: bytes) -> str:
+        """保存内容，返回SHA-256摘要；相同内容只写一次"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{digest}.{uuid.uuid4().hex}.tmp")
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def externalize(self, cell: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        把cell中超过阈值的富输出移入blob目录
+
+        Args:
+            cell: notebook cell
+
+        Returns:
+            保存用的cell：有输出被移出时为副本（原cell不变），否则为原cell
+        """
+        if not self.min_bytes or not cell.get('outputs'):
+            return cell
+        stored = None
+        for index, output in enumerate(cell['outputs']):
+            large = [mime for mime, value in output.get('data', {}).items()
+                     if mime not in INLINE_MIME_TYPES and _size(value) >= self.min_bytes]
+            if not large:
+                continue
+            if stored is None:
+                stored = dict(cell, outputs=list(cell['outputs']))
+            output = copy.deepcopy(output)
+            refs = output.setdefault('metadata', {}).setdefault(BLOB_METADATA_KEY, {})
+            for mime in large:
+                data, encoding = self._encode(mime, output['data'].pop(mime))
+                refs[mime] = {"sha256": self.put(data), "encoding": encoding, "size": len(data)}
+            stored['outputs'][index] = output
+        return stored if stored is not None else cell
+
+    def rehydrate(self, cell: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按引用读回cell中移出的输出
+
+        Returns:
+            有引用时为恢复后的副本，否则为原cell；找不到的blob保持引用并打印警告
+        """
+        if not any(BLOB_METADATA_KEY in o.get('metadata', {}) for o in cell.get('outputs', [])):
+            return cell
+        cell = copy.deepcopy(cell)
+        for output in cell['outputs']:
+            refs = output.get('metadata', {}).get(BLOB_METADATA_KEY)
+            if not refs:
+                continue
+            for mime, ref in list(refs.items()):
+                try:
+                    output.setdefault('data', {})[mime] = _decode(self.get(ref["sha256"]), ref["encoding"])
+                except FileNotFoundError:
+                    print(f"警告：找不到输出的blob: {ref['sha256']}")
+                    continue
+                del refs[mime]
+            if not refs:
+                del output['metadata'][BLOB_METADATA_KEY]
+        return cell
+
+    def _encode(self, mime: str, value: Any) -> Tuple[bytes, str]:
+        if mime in BASE64_MIME_TYPES and isinstance(value, str):
+            data = base64.b64decode(value)
+            if mime == "image/png":
+                data = self._recompress_png(data)
+            return data, "base64"
+        if isinstance(value, str):
+            return value.encode('utf-8'), "text"
+        return json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8'), "json"
+
+    def _recompress_png(self, data: bytes) -> bytes:
+        """可选：缩小超过上限的PNG并重新压缩，结果更大时保留原图"""
+        if Image is None or not (self.png_optimize or self.png_max_side):
+            return data
+        try:
+            image = Image.open(io.BytesIO(data))
+            if self.png_max_side and max(image.size) > self.png_max_side:
+                image.thumbnail((self.png_max_side, self.png_max_side))
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", optimize=True)
+        except Exception as e:
+            print(f"警告：重新压缩PNG失败: {e}")
+            return data
+        result = buffer.getvalue()
+        return result if len(result) < len(data) or self.png_max_side else data
+
+
+def _size(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value)
+    return len(json.dumps(value, ensure_ascii=False))
+
+
+def _decode(data: bytes, encoding: str) -> Any:
+    if encoding == "base64":
+        return base64.b64encode(data).decode('ascii')
+    if encoding == "json":
+        return json.loads(data.decode('utf-8'))
+    return data.decode('utf-8')
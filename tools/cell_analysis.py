@@ -0,0 +1,367 @@
+"""
+Cell代码分析
+用AST找出cell定义的变量、读取的变量（在cell内先于定义读取、且不是内置名的变量）和以常量路径读取的文件，
+并判断cell是否只读：不定义或修改变量，只调用已知无副作用、结果确定的函数和方法（白名单），
+除以常量路径读取文件外不读写外部数据。只读cell的输出只取决于代码、读取的变量和输入文件，可以缓存；定义和读取的变量、输入文件也用于建立cell之间的数据流。
+"""
+import ast
+import builtins
+import re
+from typing import Any, Dict, List, Optional
+
+
+# 不作为变量依赖的名字：Python内置名和IPython注入的名字
+BUILTIN_NAMES = frozenset(dir(builtins)) | {"display", "get_ipython"}
+
+# 只读cell可以直接调用的函数（其余按名字调用的函数可能是用户定义的，视为有副作用）
+PURE_CALLS = frozenset({
+    "abs", "all", "any", "bool", "dict", "display", "divmod", "enumerate", "filter", "float",
+    "format", "frozenset", "int", "isinstance", "len", "list", "map", "max", "min", "print",
+    "range", "repr", "reversed", "round", "set", "sorted", "str", "sum", "tuple", "type", "zip",
+})
+
+# 读取文件的函数，第一个参数为常量路径时记录为cell的输入文件（用于数据流和缓存键）；路径不是常量时不是只读的
+READ_CALLS = frozenset({
+    "read_csv", "read_table", "read_excel", "read_parquet", "read_feather", "read_json",
+    "read_pickle", "read_orc", "read_fwf", "load", "loadtxt", "genfromtxt", "open",
+})
+
+# 只读cell可以调用的方法和模块函数：pandas/numpy中返回新对象、不修改调用对象、结果确定的操作，
+# 以及字符串、字典等内置类型的只读方法。不在其中的方法（np.random.*、read_*、execute、fill等）视为有副作用
+PURE_METHODS = frozenset({
+    # DataFrame/Series的查看和统计
+    "head", "tail", "describe", "info", "count", "sum", "mean", "median", "mode", "min", "max",
+    "std", "var", "sem", "skew", "kurt", "quantile", "prod", "cumsum", "cumprod", "cummin", "cummax",
+    "idxmin", "idxmax", "nunique", "unique", "value_counts", "corr", "cov", "abs", "round", "clip",
+    "nlargest", "nsmallest", "rank", "diff", "pct_change", "shift", "all", "any", "memory_usage",
+    # 选择、变形和组合（返回新对象）
+    "groupby", "agg", "aggregate", "transform", "apply", "map", "filter", "resample", "rolling",
+    "expanding", "pivot", "pivot_table", "melt", "stack", "unstack", "explode", "merge", "join",
+    "concat", "crosstab", "sort_values", "sort_index", "reset_index", "set_index", "rename",
+    "drop", "drop_duplicates", "duplicated", "dropna", "fillna", "isna", "isnull", "notna",
+    "notnull", "isin", "between", "where", "mask", "query", "eval", "assign", "astype", "copy",
+    "loc", "iloc", "get", "select_dtypes", "reindex", "nth", "first", "last", "size", "ngroup",
+    "cut", "qcut", "to_datetime", "to_numeric", "to_timedelta", "DataFrame", "Series", "Index",
+    "to_frame", "to_list", "tolist", "to_dict", "to_numpy", "to_string", "keys", "values", "items",
+    "equals", "sample",
+    # numpy
+    "array", "asarray", "arange", "linspace", "zeros", "ones", "full", "reshape", "ravel",
+    "flatten", "transpose", "dot", "sqrt", "log", "log1p", "exp", "floor", "ceil", "histogram",
+    "percentile", "nanmean", "nanmedian", "nanstd", "nansum", "argmin", "argmax", "argsort",
+    "bincount", "isnan", "isfinite", "maximum", "minimum",
+    # 字符串和.str、.dt访问器
+    "lower", "upper", "strip", "lstrip", "rstrip", "split", "replace", "contains", "startswith",
+    "endswith", "len", "slice", "extract", "format", "zfill", "strftime", "date", "year",
+    "month", "day",
+    # 以常量路径打开的文件
+    "read", "readlines",
+})
+
+# 原地修改对象的方法
+MUTATING_METHODS = frozenset({
+    "append", "extend", "insert", "pop", "popitem", "remove", "clear", "update", "setdefault",
+    "sort", "add", "discard", "intersection_update", "difference_update", "fill", "resize",
+})
+
+# 带路径参数时写文件的方法（不带参数时返回字符串，如 df.to_csv()）
+WRITE_METHODS = frozenset({
+    "to_csv", "to_excel", "to_parquet", "to_sql", "to_pickle", "to_feather", "to_hdf", "to_json",
+    "to_html", "to_markdown", "to_latex", "to_orc", "to_stata",
+})
+WRITE_PATH_KEYWORDS = frozenset({"path", "path_or_buf", "buf", "excel_writer", "con", "fname"})
+
+# 读取函数属于这些模块时才视为读取文件
+FILE_READ_MODULES = frozenset({"pd", "pandas", "np", "numpy"})
+
+# 结果不确定的模块：其中的任何调用都不是只读的
+NONDETERMINISTIC_MODULES = frozenset({"random", "secrets", "uuid", "time", "datetime"})
+
+# 调用即改变全局状态的模块别名
+STATEFUL_MODULES = frozenset({"plt", "matplotlib", "sns", "os", "sys", "shutil", "subprocess", "requests"})
+
+# IPython的执行历史变量（_、__、_3、_i3、In、Out），依赖历史的cell不能缓存
+_HISTORY_NAME = re.compile(r"^(_+|_i+|_i?\d+|In|Out)$")
+
+
+def analyze_cell(code: str) -> Dict[str, Any]:
+    """
+    分析cell代码
+
+    Args:
+        code: cell源码
+
+    Returns:
+        {"parsed": 是否能解析（包含magic命令时不能）,
+         "defines": 定义或重新绑定的变量, "uses": 读取的外部变量,
+         "files": 以常量路径读取的文件, "pure": 是否只读, "reason": 不是只读的原因}
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return {"parsed": False, "defines": [], "uses": [], "files": [], "pure": False,
+                "reason": "无法解析（可能包含magic或shell命令）"}
+
+    collector = _NameCollector()
+    for statement in tree.body:
+        collector.visit(statement)
+    uses = [name for name in collector.uses if name not in BUILTIN_NAMES]
+
+    reason = collector.impure_reason
+    if reason is None and collector.defines:
+        reason = f"定义或修改了变量: {', '.join(collector.defines)}"
+    if reason is None and any(_HISTORY_NAME.match(name) for name in uses):
+        reason = "依赖执行历史变量"
+    return {"parsed": True, "defines": collector.defines, "uses": uses, "files": collector.files,
+            "pure": reason is None, "reason": reason}
+
+
+def normalized_code(code: str) -> Optional[str]:
+    """去掉注释和格式差异后的代码表示，无法解析时返回None"""
+    try:
+        return ast.dump(ast.parse(code))
+    except SyntaxError:
+        return None
+
+
+class _NameCollector(ast.NodeVisitor):
+    """按执行顺序收集一个作用域中绑定和读取的名字，同时记录第一个副作用"""
+
+    def __init__(self, bound: Optional[set] = None):
+        self.defines: List[str] = []
+        self.uses: List[str] = []
+        self.files: List[str] = []
+        self.impure_reason: Optional[str] = None
+        self._bound = set(bound or ())
+
+    def _use(self, name: str):
+        if name not in self._bound and name not in self.uses:
+            self.uses.append(name)
+
+    def _define(self, name: str):
+        self._bound.add(name)
+        if name not in self.defines:
+            self.defines.append(name)
+
+    def _impure(self, reason: str):
+        if self.impure_reason is None:
+            self.impure_reason = reason
+
+    def _merge_scope(self, scope: "_NameCollector"):
+        """嵌套作用域（函数、lambda、推导式）：其局部变量不属于本作用域，自由变量算作读取"""
+        for name in scope.uses:
+            self._use(name)
+        self.files += [f for f in scope.files if f not in self.files]
+        if scope.impure_reason is not None:
+            self._impure(scope.impure_reason)
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Load):
+            self._use(node.id)
+        else:
+            self._define(node.id)
+
+    def visit_Assign(self, node: ast.Assign):
+        # 先求值右边再绑定左边：x = x + 1 读取了x
+        self.visit(node.value)
+        for target in node.targets:
+            self.visit(target)
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        self.visit(node.value)
+        if isinstance(node.target, ast.Name):
+            self._use(node.target.id)
+        self.visit(node.target)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        if node.value is not None:
+            self.visit(node.value)
+        self.visit(node.target)
+
+    def visit_NamedExpr(self, node: ast.NamedExpr):
+        self.visit(node.value)
+        self.visit(node.target)
+
+    def visit_For(self, node: ast.For):
+        self.visit(node.iter)
+        self.visit(node.target)
+        for statement in node.body + node.orelse:
+            self.visit(statement)
+
+    visit_AsyncFor = visit_For
+
+    def visit_Subscript(self, node: ast.Subscript):
+        if not isinstance(node.ctx, ast.Load):
+            self._impure("修改了对象的元素")
+            # df['x'] = ... 修改了df，数据流上视为重新定义
+            root = _root_name(node)
+            if root is not None:
+                self._use(root)
+                self._define(root)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if not isinstance(node.ctx, ast.Load):
+            self._impure("修改了对象的属性")
+            root = _root_name(node)
+            if root is not None:
+                self._use(root)
+                self._define(root)
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self._define(alias.asname or alias.name.split('.')[0])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        for alias in node.names:
+            if alias.name == '*':
+                self._impure("from ... import *")
+            else:
+                self._define(alias.asname or alias.name)
+
+    def visit_FunctionDef(self, node):
+        for expr in node.decorator_list + node.args.defaults + [d for d in node.args.kw_defaults if d]:
+            self.visit(expr)
+        scope = _NameCollector(bound=_argument_names(node.args))
+        for statement in node.body:
+            scope.visit(statement)
+        # 函数体在调用时才执行，递归调用自身不是外部依赖
+        self._define(node.name)
+        self._merge_scope(scope)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node: ast.Lambda):
+        for expr in node.args.defaults + [d for d in node.args.kw_defaults if d]:
+            self.visit(expr)
+        scope = _NameCollector(bound=_argument_names(node.args))
+        scope.visit(node.body)
+        self._merge_scope(scope)
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        for expr in node.decorator_list + node.bases + [k.value for k in node.keywords]:
+            self.visit(expr)
+        scope = _NameCollector()
+        for statement in node.body:
+            scope.visit(statement)
+        self._merge_scope(scope)
+        self._define(node.name)
+
+    def _visit_comprehension(self, node, elements: List[ast.AST]):
+        scope = _NameCollector()
+        for generator in node.generators:
+            scope.visit(generator.iter)
+            scope.visit(generator.target)
+            for condition in generator.ifs:
+                scope.visit(condition)
+        for element in elements:
+            scope.visit(element)
+        # 推导式的循环变量是局部的
+        scope.defines = []
+        self._merge_scope(scope)
+
+    def visit_ListComp(self, node):
+        self._visit_comprehension(node, [node.elt])
+
+    visit_SetComp = visit_ListComp
+    visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node: ast.DictComp):
+        self._visit_comprehension(node, [node.key, node.value])
+
+    def visit_Delete(self, node: ast.Delete):
+        self._impure("删除了变量或元素")
+        self.generic_visit(node)
+
+    def visit_Global(self, node):
+        self._impure("使用了global/nonlocal")
+
+    visit_Nonlocal = visit_Global
+
+    def visit_With(self, node):
+        self._impure("使用了with语句")
+        self.generic_visit(node)
+
+    visit_AsyncWith = visit_With
+
+    def visit_Await(self, node):
+        self._impure("使用了await")
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+        # 按名字调用的读取函数（open、from pandas import read_csv）和pandas/numpy的读取函数是读取文件，
+        # 其他对象上同名的方法（json.load、conn.load）仍按方法的规则判断
+        file_read = name in READ_CALLS and (isinstance(func, ast.Name) or _root_name(func) in FILE_READ_MODULES)
+        if name in READ_CALLS:
+            self._record_read(name, node)
+        if not file_read and isinstance(func, ast.Name) and name not in PURE_CALLS:
+            self._impure(f"调用了可能有副作用的函数: {name}")
+        if not file_read and isinstance(func, ast.Attribute):
+            modules = set(_attribute_path(func)) & NONDETERMINISTIC_MODULES
+            if modules:
+                self._impure(f"调用了结果不确定的函数: {'.'.join(_attribute_path(func))}")
+            elif name in MUTATING_METHODS:
+                self._impure(f"调用了原地修改的方法: {name}")
+            elif name in WRITE_METHODS:
+                if node.args or any(k.arg in WRITE_PATH_KEYWORDS for k in node.keywords):
+                    self._impure(f"写入了文件: {name}")
+            elif name.startswith("read_"):
+                self._impure(f"读取了外部数据: {name}")
+            elif name not in PURE_METHODS:
+                self._impure(f"调用了不在只读白名单中的方法: {name}")
+            if _root_name(func) in STATEFUL_MODULES:
+                self._impure(f"调用了改变全局状态的模块: {_root_name(func)}")
+        if name == "sample" and not _has_keyword(node, "random_state"):
+            self._impure("调用了结果不确定的函数: sample")
+        if any(k.arg == "inplace" and not (isinstance(k.value, ast.Constant) and not k.value.value)
+               for k in node.keywords):
+            self._impure("原地修改（inplace）")
+        self.generic_visit(node)
+
+    def _record_read(self, name: str, node: ast.Call):
+        path = node.args[0] if node.args else next(
+            (k.value for k in node.keywords if k.arg in ("filepath_or_buffer", "path", "io", "file", "fname")), None)
+        if not (isinstance(path, ast.Constant) and isinstance(path.value, str)):
+            self._impure(f"{name} 读取的路径不是常量")
+            return
+        if name == "open":
+            mode = node.args[1] if len(node.args) > 1 else next(
+                (k.value for k in node.keywords if k.arg == "mode"), None)
+            if mode is not None and not (isinstance(mode, ast.Constant) and set(str(mode.value)) <= set("rbt")):
+                self._impure("以写模式打开文件")
+                return
+        if path.value not in self.files:
+            self.files.append(path.value)
+
+
+def _argument_names(args: ast.arguments) -> set:
+    names = {a.arg for a in args.posonlyargs + args.args + args.kwonlyargs}
+    if args.vararg:
+        names.add(args.vararg.arg)
+    if args.kwarg:
+        names.add(args.kwarg.arg)
+    return names
+
+
+def _root_name(node: ast.AST) -> Optional[str]:
+    """a.b[c].d 的根变量名a，根不是变量时返回None"""
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _attribute_path(node: ast.Attribute) -> List[str]:
+    """np.random.normal 的各级名字 ['np', 'random', 'normal']，中间有调用或下标时只取其后的部分"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+    return parts[::-1]
+
+
+def _has_keyword(node: ast.Call, keyword: str) -> bool:
+    return any(k.arg == keyword for k in node.keywords)
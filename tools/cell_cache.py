@@ -0,0 +1,295 @@
+"""
+Cell结果缓存
+只读cell（见 cell_analysis）的输出只取决于代码和读取的变量，
+按 规范化代码 + 变量指纹 保存在SQLite中，同一份数据上重复执行的探索代码
+（df.describe()、groupby汇总等）直接返回缓存的输出，跨会话有效。
+
+fingerprint_variables 在kernel进程内运行，由 IPythonExecutor 通过 user_expressions 调用：
+DataFrame/Series/ndarray按内容哈希（超过 IPYTHON_CELL_HASH_FULL_BYTES 时只哈希均匀分布的采样行块，
+并加入每列数据缓冲区的地址，替换列或重新赋值都会改变指纹），其他对象按pickle结果哈希，
+函数、无法pickle的对象不可缓存。cell以常量路径读取的文件按(真实路径, 大小, 修改时间)加入缓存键。
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import types
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+
+# 默认缓存文件，可通过环境变量 IPYTHON_CELL_CACHE 覆盖
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "data_analyzer", "cell_cache.sqlite")
+
+# 最多保留的缓存条目数，超出时删除最久未使用的条目，可通过环境变量 IPYTHON_CELL_CACHE_MAX_ENTRIES 覆盖
+DEFAULT_MAX_ENTRIES = 5000
+
+# 单个条目输出的字节上限，输出更大（例如多张大图）的cell不缓存
+MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+# 超过该字节数的DataFrame/Series/ndarray只哈希采样行块，可通过环境变量 IPYTHON_CELL_HASH_FULL_BYTES 覆盖
+DEFAULT_FULL_HASH_BYTES = 64 * 1024 * 1024
+
+# 采样时每块的行数和块数（不含首尾两块）
+_SAMPLE_ROWS = 4096
+_SAMPLE_COUNT = 16
+
+
+class CellCache:
+    """按内容键保存只读cell输出的SQLite缓存，记录命中率"""
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: Optional[int] = None):
+        """
+        初始化缓存
+
+        Args:
+            db_path: SQLite文件路径
+            max_entries: 最多保留的条目数
+        """
+        self.db_path = db_path or os.getenv("IPYTHON_CELL_CACHE", DEFAULT_CACHE_PATH)
+        self.max_entries = max_entries or int(os.getenv("IPYTHON_CELL_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS cells ("
+            "key TEXT PRIMARY KEY, outputs TEXT, duration REAL, created TEXT, last_used TEXT)"
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.bypassed = 0
+        self.saved_seconds = 0.0
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        # 每次操作使用独立连接，多个线程和进程都可以安全访问
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                rows = conn.execute(sql, params).fetchall()
+            return rows
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的输出，计入命中或未命中
+
+        Returns:
+            {"outputs": 输出列表, "duration": 原执行耗时（秒）}，没有时返回None
+        """
+        rows = self._execute("SELECT outputs, duration FROM cells WHERE key = ?", (key,))
+        with self._lock:
+            if not rows:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += rows[0][1]
+        self._execute("UPDATE cells SET last_used = ? WHERE key = ?", (datetime.now().isoformat(), key))
+        return {"outputs": json.loads(rows[0][0]), "duration": rows[0][1]}
+
+    def put(self, key: str, outputs: List[Dict[str, Any]], duration: float) -> bool:
+        """
+        保存cell的输出
+
+        Returns:
+            是否保存（输出超过 MAX_ENTRY_BYTES 时不保存）
+        """
+        text = json.dumps(outputs, ensure_ascii=False)
+        if len(text) > MAX_ENTRY_BYTES:
+            return False
+        now = datetime.now().isoformat()
+        self._execute(
+            "INSERT OR REPLACE INTO cells (key, outputs, duration, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, text, duration, now, now),
+        )
+        self._execute(
+            "DELETE FROM cells WHERE key NOT IN (SELECT key FROM cells ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        return True
+
+    def record_uncacheable(self):
+        with self._lock:
+            self.uncacheable += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        entries = self._execute("SELECT COUNT(*) FROM cells")[0][0]
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncacheable": self.uncacheable,
+                "bypassed": self.bypassed,
+                "hit_rate": self.hits / total if total else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
+
+    def clear(self):
+        self._execute("DELETE FROM cells")
+
+
+def memo_key(normalized: str, variables: Dict[str, Any], kernel_name: str,
+             files: Optional[Dict[str, Any]] = None) -> str:
+    """由规范化代码、变量指纹、输入文件指纹和kernel名称生成缓存键"""
+    payload = json.dumps({"code": normalized, "variables": variables, "files": files or {},
+                          "kernel": kernel_name}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_fingerprints(paths: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    输入文件的指纹
+
+    Args:
+        paths: cell以常量路径读取的文件
+
+    Returns:
+        {真实路径: [大小, 修改时间ns]}，有文件无法访问时返回None（不可缓存）
+    """
+    fingerprints = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        fingerprints[os.path.realpath(path)] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprints
+
+
+def fingerprint_variables(ip, names: List[str]) -> str:
+    """
+    在kernel中计算变量的指纹
+
+    Args:
+        ip: kernel的InteractiveShell
+        names: 变量名
+
+    Returns:
+        JSON字符串：{变量名: 指纹}，未定义的变量为null；有变量无法计算指纹时为 null
+    """
+    fingerprints = {}
+    for name in names:
+        if name not in ip.user_ns:
+            fingerprints[name] = None
+            continue
+        fingerprint = _fingerprint_value(ip.user_ns[name])
+        if fingerprint is None:
+            return json.dumps(None)
+        fingerprints[name] = fingerprint
+    return json.dumps(fingerprints)
+
+
+def _fingerprint_value(value: Any) -> Optional[str]:
+    if isinstance(value, types.ModuleType):
+        return f"module:{value.__name__}:{getattr(value, '__version__', '')}"
+    if callable(value) and not isinstance(value, (pd.DataFrame, pd.Series)):
+        # 函数和类的行为取决于它们引用的全局变量，不可缓存
+        return None
+    # sha256在有硬件加速的CPU上比blake2b快，大DataFrame的指纹时间主要取决于哈希速度
+    digest = hashlib.sha256()
+    digest.update(type(value).__qualname__.encode())
+    try:
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr((list(value.columns), [str(t) for t in value.dtypes], value.shape)).encode())
+            rows = _sample_rows(len(value), value.memory_usage(index=False).sum())
+            if rows is not None:
+                digest.update(repr([_buffer_address(value.iloc[:, i]) for i in range(value.shape[1])]).encode())
+                value = value.iloc[rows]
+            _hash_index(digest, value.index)
+            for i in range(value.shape[1]):
+                _hash_values(digest, value.iloc[:, i])
+        elif isinstance(value, pd.Series):
+            digest.update(repr((value.name, str(value.dtype), len(value))).encode())
+            rows = _sample_rows(len(value), value.memory_usage(index=False))
+            if rows is not None:
+                digest.update(repr(_buffer_address(value)).encode())
+                value = value.iloc[rows]
+            _hash_index(digest, value.index)
+            _hash_values(digest, value)
+        elif isinstance(value, np.ndarray) and value.dtype.kind not in "OV":
+            digest.update(repr((str(value.dtype), value.shape)).encode())
+            rows = _sample_rows(len(value), value.nbytes) if value.ndim else None
+            if rows is not None:
+                digest.update(repr(value.__array_interface__["data"][0]).encode())
+                value = value[rows]
+            digest.update(np.ascontiguousarray(value).view(np.uint8))
+        else:
+            digest.update(pickle.dumps(value, protocol=4))
+    except Exception:
+        return None
+    return digest.hexdigest()
+
+
+def _sample_rows(length: int, nbytes: int) -> Optional[np.ndarray]:
+    """
+    大对象的采样行：首尾各一块以及均匀分布的若干块，和文件指纹（content_fingerprint）的采样方式一致
+
+    Returns:
+        采样行的位置，对象不超过全量哈希的字节数时返回None（哈希全部内容）
+    """
+    limit = int(os.getenv("IPYTHON_CELL_HASH_FULL_BYTES", DEFAULT_FULL_HASH_BYTES))
+    if nbytes <= limit or length <= _SAMPLE_ROWS * (_SAMPLE_COUNT + 2):
+        return None
+    step = length // (_SAMPLE_COUNT + 1)
+    starts = [0] + [step * i for i in range(1, _SAMPLE_COUNT + 1)] + [length - _SAMPLE_ROWS]
+    return np.concatenate([np.arange(start, start + _SAMPLE_ROWS) for start in starts])
+
+
+def _buffer_address(values: pd.Series) -> Any:
+    """列数据所在内存的地址，列被替换或重新计算后改变；无法取得时为None"""
+    if isinstance(values.dtype, np.dtype):
+        return values.to_numpy().__array_interface__["data"][0]
+    if hasattr(values.array, "__arrow_array__"):
+        return [buffer.address for chunk in values.array.__arrow_array__().chunks
+                for buffer in chunk.buffers() if buffer is not None]
+    return None
+
+
+def _hash_index(digest, index: pd.Index):
+    if isinstance(index, pd.RangeIndex):
+        digest.update(repr((index.start, index.stop, index.step, index.name)).encode())
+    else:
+        digest.update(repr((list(index.names), str(index.dtype))).encode())
+        _hash_values(digest, index)
+
+
+def _hash_values(digest, values):
+    """
+    普通数值列和Arrow存储的列（如pandas的字符串列）直接哈希内存，
+    其他类型（object、category等扩展类型）用pandas的行哈希
+    """
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind not in "OV":
+        digest.update(np.ascontiguousarray(values.to_numpy()).view(np.uint8))
+    elif hasattr(values.array, "__arrow_array__"):
+        for chunk in values.array.__arrow_array__().chunks:
+            # 切片共享父数组的缓冲区，偏移和长度区分不同的切片
+            digest.update(repr((chunk.offset, len(chunk))).encode())
+            for buffer in chunk.buffers():
+                if buffer is not None:
+                    digest.update(buffer)
+    else:
+        digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy())
+
+
+_shared_cache: Optional[CellCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_cell_cache() -> CellCache:
+    """获取进程内共享的cell结果缓存"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = CellCache()
+        return _shared_cache
@@ -0,0 +1,77 @@
+"""
+列投影
+分析PandasTool操作实际用到的列，读取数据时只加载这些列
+"""
+import ast
+import re
+from typing import Iterable, List, Optional
+
+
+_BACKTICK_PATTERN = re.compile(r"`([^`]*)`")
+
+
+def parse_column_list(text: str) -> List[str]:
+    """
+    解析逗号分隔的列名列表
+
+    Args:
+        text: 如 "city, amount"
+
+    Returns:
+        去掉空白后的列名列表
+    """
+    return [part.strip() for part in text.split(',') if part.strip()]
+
+
+def query_columns(expr: str, available: Iterable[str]) -> Optional[List[str]]:
+    """
+    找出 df.query 表达式引用的列
+
+    支持反引号包裹的列名（如 `order amount` > 10）。
+
+    Args:
+        expr: query表达式
+        available: 文件中实际存在的列
+
+    Returns:
+        引用到的列（按出现顺序），表达式无法解析时返回None
+    """
+    available = set(available)
+    placeholders = {}
+
+    def _replace(match):
+        name = f"__column_{len(placeholders)}__"
+        placeholders[name] = match.group(1)
+        return name
+
+    # @变量引用的是调用方的局部变量，不是列
+    text = _BACKTICK_PATTERN.sub(_replace, expr).replace('@', '_local_')
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError:
+        return None
+
+    columns = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            name = placeholders.get(node.id, node.id)
+            if name in available and name not in columns:
+                columns.append(name)
+    return columns
+
+
+def merge_columns(available: List[str], *groups: Iterable[str]) -> List[str]:
+    """
+    合并多组列名，按文件中的列顺序返回并去重
+
+    Args:
+        available: 文件中的列（决定顺序）
+        groups: 各操作需要的列
+
+    Returns:
+        合并后的列名列表
+    """
+    wanted = set()
+    for group in groups:
+        wanted.update(group)
+    return [column for column in available if column in wanted]
@@ -0,0 +1,321 @@
+"""
+列式旁路存储
+首次读取CSV时将其写为列式二进制副本（Feather，未安装pyarrow时退化为逐列.npy），
+之后按内容指纹直接读取副本，并尽可能使用内存映射，避免每次重新解析CSV
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional
+import numpy as np
+import pandas as pd
+from tools.csv_backend import DEFAULT_BACKEND, table_to_pandas
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+# 默认缓存目录，可通过环境变量 PANDAS_COLUMNAR_CACHE_DIR 覆盖
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "data_analyzer", "columnar")
+
+# 小于该大小的CSV直接解析更快，不写副本；可通过环境变量 PANDAS_COLUMNAR_MIN_BYTES 覆盖
+DEFAULT_MIN_BYTES = 8 * 1024 * 1024
+
+# 指纹采样块大小
+_SAMPLE_BLOCK = 1024 * 1024
+_SAMPLE_COUNT = 16
+
+_fingerprint_memo: Dict[tuple, str] = {}
+_fingerprint_lock = threading.Lock()
+
+
+def content_fingerprint(file_path: str) -> str:
+    """
+    计算文件指纹
+
+    对文件大小、修改时间、首尾各1MB以及均匀分布的采样块做哈希，大文件无需全量读取。
+    采样块不覆盖的位置被修改时（文件大小不变），修改时间随之变化，指纹同样改变；
+    同一文件身份的结果在进程内复用。
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        十六进制指纹字符串
+    """
+    path = os.path.realpath(file_path)
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    with _fingerprint_lock:
+        if memo_key in _fingerprint_memo:
+            return _fingerprint_memo[memo_key]
+
+    size = stat.st_size
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{size}:{stat.st_mtime_ns}".encode())
+    with open(path, 'rb') as f:
+        if size <= _SAMPLE_BLOCK * (_SAMPLE_COUNT + 2):
+            digest.update(f.read())
+        else:
+            offsets = [0, size - _SAMPLE_BLOCK]
+            step = size // (_SAMPLE_COUNT + 1)
+            offsets[1:1] = [step * i for i in range(1, _SAMPLE_COUNT + 1)]
+            for offset in offsets:
+                f.seek(offset)
+                digest.update(f.read(_SAMPLE_BLOCK))
+    fingerprint = digest.hexdigest()
+
+    with _fingerprint_lock:
+        _fingerprint_memo[memo_key] = fingerprint
+    return fingerprint
+
+
+class ColumnarStore:
+    """CSV的列式副本存储，清单文件按内容指纹索引"""
+
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(self, cache_dir: Optional[str] = None, min_bytes: Optional[int] = None):
+        """
+        初始化存储
+
+        Args:
+            cache_dir: 副本存放目录
+            min_bytes: 写副本的最小源文件大小
+        """
+        self.cache_dir = Path(cache_dir or os.getenv("PANDAS_COLUMNAR_CACHE_DIR", DEFAULT_CACHE_DIR))
+        self.min_bytes = min_bytes if min_bytes is not None else int(
+            os.getenv("PANDAS_COLUMNAR_MIN_BYTES", DEFAULT_MIN_BYTES))
+        self.format = "feather" if feather is not None else "npy"
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.cache_dir / self.MANIFEST_NAME
+
+    def load(self, file_path: str, columns: Optional[List[str]] = None,
+             reader: Optional[Callable[..., pd.DataFrame]] = None,
+             backend: str = DEFAULT_BACKEND) -> pd.DataFrame:
+        """
+        读取CSV：副本包含所需的列时读取副本，否则解析CSV并写入（或补全）副本
+
+        Args:
+            file_path: CSV文件路径
+            columns: 只读取这些列（None表示全部列）
+            reader: 解析CSV的函数，签名为 reader(file_path, usecols)
+            backend: 读取副本时使用的列类型，pandas 或 pyarrow（需与reader一致）
+
+        Returns:
+            DataFrame
+        """
+        reader = reader or _read_csv
+        if not self._eligible(file_path):
+            return _project(reader(file_path, columns), columns)
+
+        fingerprint = content_fingerprint(file_path)
+        entry = self.lookup(fingerprint)
+        if entry is not None and _covers(entry, columns):
+            try:
+                return self._read(entry, columns, backend)
+            except Exception as e:
+                print(f"警告：读取列式副本失败，重新解析CSV: {e}")
+                self.remove(fingerprint)
+
+        df = reader(file_path, columns)
+        self.write(fingerprint, file_path, df, complete=columns is None)
+        return _project(df, columns)
+
+    def find(self, file_path: str, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        查找与源文件当前内容一致、且包含所需列的副本清单条目
+
+        Args:
+            file_path: CSV文件路径
+            columns: 需要的列（None表示全部列）
+
+        Returns:
+            清单条目，没有可用副本（或文件不适合写副本）时返回None
+        """
+        if not self._eligible(file_path):
+            return None
+        entry = self.lookup(content_fingerprint(file_path))
+        return entry if entry is not None and _covers(entry, columns) else None
+
+    def data_path(self, entry: Dict[str, Any]) -> Path:
+        """Feather格式副本的数据文件路径"""
+        return self.cache_dir / entry["path"] / "data.feather"
+
+    def lookup(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """按指纹查找副本清单条目"""
+        entry = self._read_manifest().get(fingerprint)
+        if entry is None or not (self.cache_dir / entry["path"]).exists():
+            return None
+        return entry
+
+    def write(self, fingerprint: str, file_path: str, df: pd.DataFrame, complete: bool = True):
+        """
+        写入副本并更新清单，失败时只打印警告
+
+        Args:
+            fingerprint: 源文件内容指纹
+            file_path: 源文件路径
+            df: 要写入的数据
+            complete: df是否包含源文件的全部列；部分列会与已有副本合并
+
+        同一源文件其他指纹（旧内容）的副本和清单条目一并删除。
+        """
+        existing = self.lookup(fingerprint)
+        if existing is not None and not (complete and existing.get("complete", True)):
+            missing = [c for c in existing["columns"] if c not in df.columns]
+            if missing:
+                try:
+                    df = pd.concat([df.reset_index(drop=True), self._read(existing, missing)], axis=1)
+                except Exception as e:
+                    print(f"警告：合并列式副本失败: {e}")
+            complete = complete or existing.get("complete", True)
+
+        target = self.cache_dir / fingerprint
+        tmp = self.cache_dir / f".{fingerprint}.{uuid.uuid4().hex}"
+        try:
+            tmp.mkdir(parents=True)
+            if self.format == "feather":
+                # 不压缩才能内存映射读取
+                df.reset_index(drop=True).to_feather(tmp / "data.feather", compression="uncompressed")
+            else:
+                self._write_npy(tmp, df)
+            if target.exists():
+                shutil.rmtree(target)
+            os.replace(tmp, target)
+        except Exception as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            print(f"警告：写入列式副本失败: {e}")
+            return
+
+        source = os.path.realpath(file_path)
+        with self._lock:
+            manifest = self._read_manifest()
+            # 同一源文件旧内容的副本不会再被命中，写入新副本时删除
+            for old in [key for key, entry in manifest.items()
+                        if key != fingerprint and entry.get("source") == source]:
+                shutil.rmtree(self.cache_dir / manifest.pop(old)["path"], ignore_errors=True)
+            manifest[fingerprint] = {
+                "format": self.format,
+                "path": fingerprint,
+                "source": source,
+                "rows": len(df),
+                "columns": [str(c) for c in df.columns],
+                "complete": complete,
+                "created": datetime.now().isoformat(),
+            }
+            self._write_manifest(manifest)
+
+    def remove(self, fingerprint: str):
+        """删除指定指纹的副本"""
+        with self._lock:
+            manifest = self._read_manifest()
+            entry = manifest.pop(fingerprint, None)
+            if entry is not None:
+                shutil.rmtree(self.cache_dir / entry["path"], ignore_errors=True)
+                self._write_manifest(manifest)
+
+    def clear(self):
+        """清空所有副本"""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _eligible(self, file_path: str) -> bool:
+        if Path(file_path).suffix.lower() != ".csv":
+            return False
+        try:
+            return os.path.getsize(file_path) >= self.min_bytes
+        except OSError:
+            return False
+
+    def _read(self, entry: Dict[str, Any], columns: Optional[List[str]],
+              backend: str = DEFAULT_BACKEND) -> pd.DataFrame:
+        directory = self.cache_dir / entry["path"]
+        if entry["format"] == "feather":
+            if feather is None:
+                raise RuntimeError("读取Feather副本需要安装pyarrow")
+            table = feather.read_table(self.data_path(entry), columns=columns, memory_map=True)
+            return table_to_pandas(table, backend)
+        return self._read_npy(directory, entry["columns"] if columns is None else columns)
+
+    def _write_npy(self, directory: Path, df: pd.DataFrame):
+        dtypes = {}
+        for i, column in enumerate(df.columns):
+            series = df[column]
+            if series.dtype.kind in "biufcmM":
+                np.save(directory / f"{i}.npy", series.to_numpy())
+            else:
+                np.save(directory / f"{i}.npy", series.to_numpy(dtype=object), allow_pickle=True)
+            dtypes[str(column)] = {"file": f"{i}.npy", "dtype": str(series.dtype)}
+        with open(directory / "dtypes.json", 'w', encoding='utf-8') as f:
+            json.dump(dtypes, f, ensure_ascii=False)
+
+    def _read_npy(self, directory: Path, columns: List[str]) -> pd.DataFrame:
+        with open(directory / "dtypes.json", 'r', encoding='utf-8') as f:
+            dtypes = json.load(f)
+        data = {}
+        for column in columns:
+            info = dtypes[column]
+            try:
+                # 数值列可以内存映射
+                data[column] = np.load(directory / info["file"], mmap_mode='r')
+            except ValueError:
+                data[column] = np.load(directory / info["file"], allow_pickle=True)
+        df = pd.DataFrame(data, columns=columns, copy=False)
+        for column in columns:
+            if dtypes[column]["dtype"] in ("category", "bool"):
+                df[column] = df[column].astype(dtypes[column]["dtype"])
+        return df
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+
+
+def _read_csv(file_path: str, usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    return pd.read_csv(file_path, usecols=usecols)
+
+
+def _project(df: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+    return df if columns is None else df[columns]
+
+
+def _covers(entry: Dict[str, Any], columns: Optional[List[str]]) -> bool:
+    if columns is None:
+        return entry.get("complete", True)
+    return set(columns) <= set(entry["columns"])
+
+
+_shared_store: Optional[ColumnarStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_columnar_store() -> ColumnarStore:
+    """获取进程内共享的列式副本存储"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = ColumnarStore()
+        return _shared_store
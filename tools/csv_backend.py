@@ -0,0 +1,119 @@
+"""
+CSV解析与执行后端
+- pandas：pandas默认的C解析器，单线程，NumPy类型（默认）
+- pyarrow：Arrow多线程CSV解析器，列使用Arrow类型（dtype_backend="pyarrow"），
+  解析失败或未安装pyarrow时退化为C解析器
+"""
+import os
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+
+BACKENDS = ("pandas", "pyarrow")
+
+# 默认后端，可通过环境变量 PANDAS_BACKEND 覆盖
+DEFAULT_BACKEND = "pandas"
+
+# C解析器的空值写法，Arrow解析器使用同一份列表保证两个后端识别出相同的空值
+_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+# 永远不会匹配的时间格式：C解析器不会自动把字符串解析为日期，Arrow解析器也不应该
+_NO_TIMESTAMP_PARSERS = ["\x01"]
+
+
+def default_backend() -> str:
+    """读取环境变量中的默认后端"""
+    return os.getenv("PANDAS_BACKEND", DEFAULT_BACKEND).lower()
+
+
+def resolve_backend(backend: Optional[str]) -> str:
+    """
+    检查后端名称，pyarrow不可用时退化为pandas
+
+    Args:
+        backend: 后端名称，None表示使用默认后端
+
+    Returns:
+        实际使用的后端名称
+    """
+    name = (backend or default_backend()).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的后端: {name}，可选: {', '.join(BACKENDS)}")
+    if name == "pyarrow" and pa_csv is None:
+        print("警告：未安装pyarrow，使用pandas后端")
+        return "pandas"
+    return name
+
+
+def read_csv(file_path: str, usecols: Optional[List[str]] = None, backend: str = DEFAULT_BACKEND) -> pd.DataFrame:
+    """
+    用指定后端读取CSV
+
+    Args:
+        file_path: 文件路径
+        usecols: 只读取这些列（None表示全部列）
+        backend: pandas 或 pyarrow
+
+    Returns:
+        DataFrame，pyarrow后端的列为Arrow类型
+    """
+    if resolve_backend(backend) == "pandas":
+        return pd.read_csv(file_path, usecols=usecols)
+
+    try:
+        table = pa_csv.read_csv(
+            file_path,
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=usecols,
+                null_values=_NULL_VALUES,
+                strings_can_be_null=True,
+                timestamp_parsers=_NO_TIMESTAMP_PARSERS,
+            ),
+        )
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        print(f"警告：Arrow解析CSV失败，改用C解析器: {e}")
+        return pd.read_csv(file_path, usecols=usecols, dtype_backend="pyarrow")
+    return table_to_pandas(table, "pyarrow")
+
+
+def table_to_pandas(table, backend: str) -> pd.DataFrame:
+    """把Arrow表转为指定后端的DataFrame"""
+    if backend == "pyarrow":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    # 忽略写入时记录的pandas类型，副本可能由另一个后端写入
+    return table.to_pandas(ignore_metadata=True)
+
+
+def to_numpy_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    把Arrow类型的列转为NumPy类型，用于输出结果，使两个后端的结果显示一致
+
+    含空值的整数列转为float64，字符串和含空值的布尔列转为object，与C解析器的类型推断相同。
+    """
+    arrow_columns = [c for c in df.columns if isinstance(df[c].dtype, pd.ArrowDtype)]
+    if not arrow_columns:
+        return df
+    df = df.copy(deep=False)
+    for column in arrow_columns:
+        series = df[column]
+        target = series.dtype.numpy_dtype
+        has_na = bool(series.isna().any())
+        if target.kind in "iu" and has_na:
+            target = np.dtype(np.float64)
+        elif target.kind == "b" and has_na:
+            target = np.dtype(object)
+        na_value = pd.NaT if target.kind in "mM" else np.nan
+        df[column] = series.to_numpy(dtype=target, na_value=na_value)
+    return df
@@ -0,0 +1,216 @@
+"""
+数据集缓存
+进程内共享的DataFrame缓存，按文件身份（真实路径、大小、修改时间）索引，
+同一个文件在一次Agent运行中只解析一次
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, FrozenSet, List, Optional, Tuple
+import pandas as pd
+from functools import partial
+from tools.columnar_store import get_columnar_store
+from tools.csv_backend import DEFAULT_BACKEND, read_csv
+from tools.dtype_compaction import compact_dataframe
+
+
+# 文件身份：(真实路径, 文件大小, 修改时间ns)
+FileIdentity = Tuple[str, int, int]
+
+# 缓存键：(文件身份, 投影列集合, 是否压缩类型, 后端)，投影列为None表示全部列
+CacheKey = Tuple[FileIdentity, Optional[FrozenSet[str]], bool, str]
+
+# 默认缓存预算（字节），可通过环境变量 PANDAS_CACHE_MAX_BYTES 覆盖
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def file_identity(file_path: str) -> FileIdentity:
+    """
+    获取文件身份
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        (真实路径, 文件大小, 修改时间ns)
+    """
+    path = os.path.realpath(file_path)
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns)
+
+
+def dataframe_nbytes(df: pd.DataFrame) -> int:
+    """计算DataFrame占用的内存字节数（包含object列的实际内容）"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+class DatasetCache:
+    """
+    按字节预算做LRU淘汰的DataFrame缓存
+
+    缓存中的DataFrame会被多个调用方共享，调用方不应原地修改返回的对象。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 缓存可用的最大字节数
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[CacheKey, pd.DataFrame]" = OrderedDict()
+        self._sizes: Dict[CacheKey, int] = {}
+        self._current_bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_path: str, columns: Optional[List[str]] = None,
+            loader: Optional[Callable[..., pd.DataFrame]] = None, compact: bool = False,
+            backend: str = DEFAULT_BACKEND) -> pd.DataFrame:
+        """
+        获取文件对应的DataFrame，未命中时调用loader加载并缓存
+
+        已缓存完整数据或包含所需列的投影时直接从中选取列。
+
+        Args:
+            file_path: 文件路径
+            columns: 只需要这些列（None表示全部列）
+            loader: 加载函数，签名为 loader(file_path, columns)，
+                默认优先读取列式副本，没有副本时解析CSV
+            compact: 是否使用类型压缩后的数据，压缩报告保存在 df.attrs["compaction_report"]
+            backend: 解析CSV的后端，pandas 或 pyarrow，不同后端的数据分别缓存
+
+        Returns:
+            DataFrame
+        """
+        identity = file_identity(file_path)
+        with self._lock:
+            key = self._find(identity, columns, (compact, backend))
+            if key is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                df = self._entries[key]
+                return df if columns is None else df[columns]
+            self.misses += 1
+            # 同一路径的旧版本已经过期
+            self._drop_stale(identity)
+
+        if loader is None:
+            loader = partial(get_columnar_store().load, reader=partial(read_csv, backend=backend), backend=backend)
+        df = loader(identity[0], columns)
+        if compact:
+            df, _ = compact_dataframe(df)
+        self.put((identity, None if columns is None else frozenset(columns), compact, backend), df)
+        return df
+
+    def contains(self, file_path: str, columns: Optional[List[str]] = None, compact: bool = False,
+                 backend: str = DEFAULT_BACKEND) -> bool:
+        """判断文件（或其所需的列）是否已在缓存中，不影响LRU顺序和统计"""
+        try:
+            identity = file_identity(file_path)
+        except OSError:
+            return False
+        with self._lock:
+            return self._find(identity, columns, (compact, backend)) is not None
+
+    def put(self, key: CacheKey, df: pd.DataFrame):
+        """放入缓存，必要时按LRU顺序淘汰旧条目"""
+        size = dataframe_nbytes(df)
+        if size > self.max_bytes:
+            # 单个数据集超过预算，不缓存
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if key[1] is None:
+                # 完整数据可以覆盖同一文件（同一压缩模式和后端）的所有投影
+                for stale in [k for k in self._entries if k[0] == key[0] and k[2:] == key[2:]]:
+                    self._remove(stale)
+            self._entries[key] = df
+            self._sizes[key] = size
+            self._current_bytes += size
+            self._evict()
+
+    def invalidate(self, file_path: Optional[str] = None):
+        """
+        使缓存失效
+
+        Args:
+            file_path: 要失效的文件路径，为None时清空整个缓存
+        """
+        with self._lock:
+            if file_path is None:
+                self._entries.clear()
+                self._sizes.clear()
+                self._current_bytes = 0
+            else:
+                self._drop_path(os.path.realpath(file_path))
+
+    def set_max_bytes(self, max_bytes: int):
+        """调整缓存预算，立即按新预算淘汰"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def _evict(self):
+        while self._current_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def _find(self, identity: FileIdentity, columns: Optional[List[str]],
+              variant: Tuple[bool, str]) -> Optional[CacheKey]:
+        """查找可用的条目，variant为(是否压缩类型, 后端)"""
+        full = (identity, None) + variant
+        if full in self._entries:
+            return full
+        if columns is None:
+            return None
+        wanted = set(columns)
+        for key in reversed(self._entries):
+            if key[0] == identity and key[2:] == variant and key[1] is not None and wanted <= key[1]:
+                return key
+        return None
+
+    def _drop_stale(self, identity: FileIdentity):
+        for key in [k for k in self._entries if k[0][0] == identity[0] and k[0] != identity]:
+            self._remove(key)
+
+    def _drop_path(self, path: str):
+        for key in [k for k in self._entries if k[0][0] == path]:
+            self._remove(key)
+
+    def _remove(self, key: CacheKey):
+        del self._entries[key]
+        self._current_bytes -= self._sizes.pop(key)
+
+
+_shared_cache: Optional[DatasetCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_dataset_cache() -> DatasetCache:
+    """获取进程内共享的数据集缓存"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            max_bytes = int(os.getenv("PANDAS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+            _shared_cache = DatasetCache(max_bytes=max_bytes)
+        return _shared_cache
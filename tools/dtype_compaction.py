@@ -0,0 +1,132 @@
+"""
+类型压缩
+把低基数字符串转为category、在取值允许时向下转换整数和浮点数、解析日期列，
+可选使用Arrow字符串，使同样的内存能放下更多数据集
+"""
+import warnings
+from typing import Any, Dict, Tuple
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    _HAS_PYARROW = True
+except ImportError:
+    _HAS_PYARROW = False
+
+
+# 去重值占比不超过该比例的字符串列转为category
+DEFAULT_CATEGORY_RATIO = 0.5
+
+# 判断是否为日期列时检查的样本数
+_DATE_SAMPLE_SIZE = 1000
+
+
+def compact_dataframe(df: pd.DataFrame, category_ratio: float = DEFAULT_CATEGORY_RATIO,
+                      parse_dates: bool = True, arrow_strings: bool = False) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    压缩DataFrame的列类型
+
+    Args:
+        df: 原始数据（不会被修改）
+        category_ratio: 去重值占比不超过该值的字符串列转为category
+        parse_dates: 是否把看起来像日期的字符串列解析为datetime
+        arrow_strings: 其余字符串列是否转为Arrow字符串（需要pyarrow）
+
+    Returns:
+        (压缩后的DataFrame, 报告)，报告包含 before, after（字节）和 columns（每列的类型变化）
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    result = df.copy()
+    changes: Dict[str, str] = {}
+
+    for column in result.columns:
+        series = result[column]
+        converted = _compact_series(series, category_ratio, parse_dates, arrow_strings)
+        if converted.dtype != series.dtype:
+            changes[str(column)] = f"{series.dtype} → {converted.dtype}"
+            result[column] = converted
+
+    after = int(result.memory_usage(deep=True).sum())
+    report = {"before": before, "after": after, "columns": changes}
+    result.attrs["compaction_report"] = report
+    return result, report
+
+
+def format_compaction_report(report: Dict[str, Any]) -> str:
+    """把压缩报告格式化为文本"""
+    before, after = report["before"], report["after"]
+    ratio = before / after if after else 0
+    lines = [f"内存占用: {_format_bytes(before)} → {_format_bytes(after)}（压缩 {ratio:.1f} 倍）"]
+    for column, change in report["columns"].items():
+        lines.append(f"  - {column}: {change}")
+    return "\n".join(lines)
+
+
+def _compact_series(series: pd.Series, category_ratio: float, parse_dates: bool,
+                    arrow_strings: bool) -> pd.Series:
+    """压缩单列，没有可用的压缩时返回原对象"""
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        unsigned = len(series) > 0 and series.min() >= 0
+        return pd.to_numeric(series, downcast="unsigned" if unsigned else "integer")
+    if pd.api.types.is_float_dtype(series):
+        downcast = series.astype(np.float32)
+        # 只有转换后数值完全相同才向下转换
+        if np.array_equal(downcast.to_numpy(dtype=np.float64), series.to_numpy(), equal_nan=True):
+            return downcast
+        return series
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return series
+
+    values = series.dropna()
+    if values.empty:
+        return series
+    if parse_dates and _looks_like_dates(values):
+        parsed = _parse_dates(series)
+        if parsed is not None:
+            return parsed
+    if values.nunique() <= category_ratio * len(values):
+        return series.astype("category")
+    if arrow_strings and _HAS_PYARROW:
+        return series.astype("string[pyarrow]")
+    return series
+
+
+def _looks_like_dates(values: pd.Series) -> bool:
+    """样本中的值全部能解析为日期时认为是日期列"""
+    sample = values.iloc[:_DATE_SAMPLE_SIZE].astype(str)
+    # 纯数字不当作日期
+    if sample.str.fullmatch(r"[+-]?\d+(\.\d+)?").any():
+        return False
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            parsed = pd.to_datetime(sample, errors="coerce")
+        except (ValueError, TypeError):
+            return False
+    return bool(parsed.notna().all())
+
+
+def _parse_dates(series: pd.Series):
+    """
+    把整列解析为日期；样本之后有无法解析的值时（解析后空值变多）返回None，保留原类型，不丢失数据
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            parsed = pd.to_datetime(series, errors="coerce")
+        except (ValueError, TypeError, OverflowError):
+            return None
+    if parsed.isna().sum() > series.isna().sum():
+        return None
+    return parsed
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
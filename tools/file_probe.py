@@ -0,0 +1,223 @@
+"""
+数据文件元信息探测
+只读取表头和少量样本行获取列信息，行数通过带引号感知的缓冲换行扫描得到，
+不需要完整解析文件；多个文件的完整画像（类型、空值数）在进程池中并行计算
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+import pandas as pd
+from tools.dataset_cache import file_identity
+from tools.streaming_ops import iter_chunks
+from tools.stats_catalog import ProfileBuilder, lookup_profile, store_profile
+
+
+# 单个文件画像的默认超时时间（秒）
+DEFAULT_PROFILE_TIMEOUT = 60.0
+
+# 扫描行数时每次读取的字节数
+SCAN_BUFFER_SIZE = 4 * 1024 * 1024
+
+_probe_memo: Dict[tuple, Dict[str, Any]] = {}
+_probe_lock = threading.Lock()
+
+
+def count_csv_rows(file_path: str, buffer_size: int = SCAN_BUFFER_SIZE) -> int:
+    """
+    统计CSV数据行数（不含表头）
+
+    逐块扫描换行符，跳过双引号内的换行；转义的引号（""）成对出现，不影响引号状态。
+
+    Args:
+        file_path: 文件路径
+        buffer_size: 每次读取的字节数
+
+    Returns:
+        数据行数
+    """
+    lines = 0
+    in_quotes = False
+    last_byte = b"\n"
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(buffer_size)
+            if not block:
+                break
+            if not in_quotes and b'"' not in block:
+                lines += block.count(b"\n")
+            else:
+                segments = block.split(b'"')
+                for i, segment in enumerate(segments):
+                    # 偶数段在引号外（相对块开始时的状态）
+                    if (i % 2 == 1) != in_quotes:
+                        continue
+                    lines += segment.count(b"\n")
+                in_quotes ^= (len(segments) - 1) % 2 == 1
+            last_byte = block[-1:]
+    if last_byte != b"\n":
+        # 最后一行没有换行符
+        lines += 1
+    return max(lines - 1, 0)
+
+
+def probe_file(file_path: str, sample_rows: int = 5) -> Dict[str, Any]:
+    """
+    探测数据文件的元信息，同一文件身份的结果在进程内复用；
+    统计目录中有同样内容的完整画像时直接返回画像（类型准确，包含空值数）
+
+    Args:
+        file_path: 文件路径
+        sample_rows: 读取的样本行数
+
+    Returns:
+        包含 path, exists, columns, dtypes, row_count, sample, error 的字典
+    """
+    return _inspect(file_path, sample_rows, full_scan=False)
+
+
+def profile_file(file_path: str, sample_rows: int = 5) -> Dict[str, Any]:
+    """
+    计算数据文件的完整画像：分块扫描全文件，得到准确的行数、类型、空值数、最值和去重数估计；
+    画像按内容指纹保存在统计目录中，内容不变时直接复用
+
+    Args:
+        file_path: 文件路径
+        sample_rows: 样本行数
+
+    Returns:
+        探测信息字典，额外包含 null_counts, min, max, distinct, samples, describe
+        和 partial（是否只有部分信息）
+    """
+    return _inspect(file_path, sample_rows, full_scan=True)
+
+
+def _inspect(file_path: str, sample_rows: int, full_scan: bool) -> Dict[str, Any]:
+    info = _empty_info(file_path)
+    if not info["exists"]:
+        return info
+
+    try:
+        key = (file_identity(file_path), sample_rows)
+        with _probe_lock:
+            cached = _probe_memo.get(key)
+        # 完整画像可以代替探测信息，反之不行
+        if cached is not None and (not full_scan or "null_counts" in cached):
+            return dict(cached, path=file_path)
+
+        # 统计目录中已有同样内容的画像时直接复用，探测也不再读取样本和扫描行数
+        profile = lookup_profile(file_path)
+        if profile is not None:
+            info.update(profile, partial=False)
+        else:
+            sample = pd.read_csv(file_path, nrows=sample_rows)
+            info["columns"] = sample.columns.tolist()
+            info["dtypes"] = {column: str(dtype) for column, dtype in sample.dtypes.items()}
+            info["sample"] = sample
+            if full_scan:
+                profile = _scan_chunks(file_path)
+                store_profile(file_path, profile)
+                info.update(profile, partial=False)
+            else:
+                info["row_count"] = count_csv_rows(file_path)
+
+        with _probe_lock:
+            _probe_memo[key] = info
+    except Exception as e:
+        info["error"] = str(e)
+        if full_scan:
+            info["partial"] = True
+    return info
+
+
+def _scan_chunks(file_path: str) -> Dict[str, Any]:
+    """分块扫描全文件生成画像"""
+    builder = ProfileBuilder()
+    for chunk in iter_chunks(file_path):
+        builder.update(chunk)
+    return builder.result()
+
+
+def profile_files(file_paths: List[str], timeout: Optional[float] = DEFAULT_PROFILE_TIMEOUT,
+                  max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    在进程池中并行计算多个文件的画像
+
+    超时或出错的文件退化为 probe_file 的探测信息（表头、样本类型、行数），不会阻塞其他文件。
+
+    Args:
+        file_paths: 文件路径列表
+        timeout: 每个文件的超时时间（秒），None表示不限
+        max_workers: 进程数，默认为CPU核数
+
+    Returns:
+        与file_paths顺序一致的画像列表
+    """
+    if not file_paths:
+        return []
+    workers = max_workers or min(len(file_paths), os.cpu_count() or 1)
+    if len(file_paths) == 1 and timeout is None:
+        return [profile_file(file_paths[0])]
+
+    # 文件数多于进程数时要排队，截止时间按轮数放宽
+    deadline = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout * math.ceil(len(file_paths) / workers)
+
+    results: List[Dict[str, Any]] = []
+    executor = ProcessPoolExecutor(max_workers=workers)
+    timed_out = False
+    try:
+        futures = [executor.submit(profile_file, path) for path in file_paths]
+        for path, future in zip(file_paths, futures):
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                info = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                timed_out = True
+                info = _partial_profile(path, f"画像超时（超过{timeout}秒）")
+            except Exception as e:
+                info = _partial_profile(path, f"画像失败: {e}")
+            results.append(info)
+    finally:
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=not timed_out, cancel_futures=True)
+        if timed_out:
+            # 慢文件的工作进程不再等待
+            for process in processes:
+                process.terminate()
+
+    for path, info in zip(file_paths, results):
+        if not info.get("partial") and not info.get("error"):
+            _remember(path, info)
+    return results
+
+
+def _empty_info(file_path: str) -> Dict[str, Any]:
+    return {
+        "path": file_path,
+        "exists": os.path.exists(file_path),
+        "columns": [],
+        "dtypes": {},
+        "row_count": None,
+        "sample": None,
+        "error": None,
+    }
+
+
+def _partial_profile(file_path: str, reason: str) -> Dict[str, Any]:
+    """完整画像失败时退化为探测信息（表头、样本推断的类型和行数）构造部分画像"""
+    info = probe_file(file_path)
+    return dict(info, partial=True, error=reason if info["error"] is None else f"{reason}; {info['error']}")
+
+
+def _remember(file_path: str, info: Dict[str, Any], sample_rows: int = 5):
+    """把子进程算出的画像放入本进程的探测缓存"""
+    try:
+        key = (file_identity(file_path), sample_rows)
+    except OSError:
+        return
+    with _probe_lock:
+        _probe_memo[key] = info
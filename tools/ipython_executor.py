@@ -2,41 +2,77 @@
 基于IPython Kernel的代码执行工具
 支持执行Python代码并与kernel交互，所有交互都以notebook形式存储
 """
+import ast
+import atexit
+import copy
 import json
+import os
+import re
+import time
 import uuid
+import weakref
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, Generator, List, Optional, Tuple, Type
 from pathlib import Path
 from jupyter_client import KernelManager, KernelClient
-import queue
-import time
+import threading
+from tools.kernel_pool import KernelPool, get_kernel_pool
+from tools.kernel_router import Execution, KernelDiedError, MessageRouter
+from tools.kernel_launcher import describe_exit
+from tools import cell_cache, kernel_checkpoint
+from tools.cell_analysis import analyze_cell, normalized_code
+from tools.notebook_journal import NotebookJournal
+from tools.blob_store import BlobStore
+from tools.output_budget import render_outputs
 
 
-class IPythonExecutor:
-    """IPython Kernel执行器，将执行记录保存为notebook格式"""
+# 中断执行后等待kernel回应的时间（秒），超过后重启kernel
+INTERRUPT_TIMEOUT = 10.0
+
+# 单个cell的默认超时时间（秒），失控的cell不会一直占用kernel；
+# 可通过环境变量 IPYTHON_CELL_TIMEOUT 配置，0表示不限制，单次执行可用 execute_code(timeout=...) 覆盖
+DEFAULT_CELL_TIMEOUT = 600
+
+# 是否缓存只读cell的输出，可通过环境变量 IPYTHON_CELL_MEMOIZE 开启
+DEFAULT_MEMOIZE = False
+
+# 在kernel中计算变量指纹的超时时间（秒），超时的cell按不可缓存处理
+FINGERPRINT_TIMEOUT = 60.0
+
+# 执行失败原因对应的错误名
+_FAILURE_ENAMES = {
+    "timeout": "CellTimeoutError",
+    "memory": "KernelMemoryError",
+    "cpu": "KernelCPULimitError",
+    "died": "KernelDiedError",
+}
+
+
+class NotebookRecorder:
+    """把执行记录保存为notebook：cell追加到日志，.ipynb 在后台或关闭时整体重写"""
     
-    def __init__(self, kernel_name: str = "python3", notebook_path: str = "execution_history.ipynb"):
+    def __init__(self, notebook_path: str):
         """
-        初始化IPython执行器
+        初始化notebook记录
         
         Args:
-            kernel_name: Kernel名称，默认为python3
             notebook_path: 保存notebook的文件路径
         """
-        self.kernel_name = kernel_name
         self.notebook_path = notebook_path
-        self.km = None
-        self.kc = None
         self.notebook_data = None
+        # 保护notebook数据；IPythonExecutor还用它串行化kernel上的执行
+        self.lock = threading.RLock()
+        # cell以追加日志的方式持久化，.ipynb 在后台或关闭时整体重写
+        self.journal = NotebookJournal(notebook_path)
+        # 大的富输出（图片、大表格的HTML）按内容存入blob目录，notebook中只保留引用
+        self.blob_store = BlobStore.for_notebook(notebook_path)
+        self._reset_index()
         self._initialize_notebook()
+        _open_executors.add(self)
     
     def _initialize_notebook(self):
-        """初始化notebook数据结构"""
-        if Path(self.notebook_path).exists():
-            with open(self.notebook_path, 'r', encoding='utf-8') as f:
-                self.notebook_data = json.load(f)
-        else:
-            self.notebook_data = {
+        """初始化notebook数据结构，重放上次未写入notebook的日志"""
+        self.notebook_data = self.journal.load(lambda: {
                 "cells": [],
                 "metadata": {
                     "kernelspec": {
@@ -51,174 +87,865 @@ class IPythonExecutor:
                 },
                 "nbformat": 4,
                 "nbformat_minor": 4
+            })
+        self._rebuild_index()
+    
+    def _reset_index(self):
+        """
+        清空增量维护的cell索引：
+        各类型cell的数量和位置、执行计数到位置的映射、最后一个代码cell的位置、有错误的cell的位置，
+        以及每个cell用于搜索的文本（源码和文本输出）和代码cell之间的数据流图
+        """
+        self._cell_counts: Dict[str, int] = {}
+        self._type_positions: Dict[str, List[int]] = {}
+        self._code_cell_positions: Dict[int, int] = {}
+        self._last_code_position: Optional[int] = None
+        self._error_positions: List[int] = []
+        self._search_texts: List[str] = []
+        # 数据流图：读取某个变量的cell依赖于之前最后一个定义该变量的cell，边只从前往后指
+        self._last_definers: Dict[str, int] = {}
+        self._dependents: Dict[int, List[int]] = {}
+        self._variable_readers: Dict[str, List[int]] = {}
+        self._file_readers: Dict[str, List[int]] = {}
+        # 重新执行的cell以 rerun_of 记录最初的执行计数，旧的版本不再参与数据流
+        self._latest_versions: Dict[int, int] = {}
+        self._superseded: set = set()
+    
+    def _rebuild_index(self):
+        """从头建立cell索引，只在加载notebook或整体修改cell列表后调用"""
+        self._reset_index()
+        for position, cell in enumerate(self.notebook_data['cells']):
+            self._index_cell(cell, position)
+    
+    def _index_cell(self, cell: Dict[str, Any], position: int):
+        cell_type = cell.get('cell_type')
+        self._cell_counts[cell_type] = self._cell_counts.get(cell_type, 0) + 1
+        self._type_positions.setdefault(cell_type, []).append(position)
+        if cell_type == 'code':
+            self._last_code_position = position
+            if cell.get('execution_count') is not None:
+                self._code_cell_positions[cell['execution_count']] = position
+            self._index_dataflow(cell, position)
+        outputs = cell.get('outputs') or []
+        if any(output.get('output_type') == 'error' for output in outputs):
+            self._error_positions.append(position)
+        self._search_texts.append(_source_text(cell) + "\n" + render_outputs(outputs))
+    
+    def _index_dataflow(self, cell: Dict[str, Any], position: int):
+        # 旧notebook中的cell没有记录数据流，加载时重新分析
+        metadata = cell.get('metadata') or {}
+        flow = metadata.get('dataflow') or _dataflow(analyze_cell(_source_text(cell)))
+        for name in flow['uses']:
+            self._variable_readers.setdefault(name, []).append(position)
+            producer = self._last_definers.get(name)
+            if producer is not None:
+                self._dependents.setdefault(producer, []).append(position)
+        for path in flow['files']:
+            self._file_readers.setdefault(os.path.realpath(path), []).append(position)
+        for name in flow['defines']:
+            self._last_definers[name] = position
+        root = metadata.get('rerun_of')
+        if root is not None:
+            previous = self._latest_versions.get(root, self._code_cell_positions.get(root))
+            if previous is not None:
+                self._superseded.add(previous)
+            self._latest_versions[root] = position
+    
+    def _new_cell(self, source: str, cell_type: str, metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "cell_type": cell_type,
+            "metadata": metadata or {},
+            "source": source.split('\n'),
+        }
+    
+    def _next_execution_count(self) -> int:
+        return self._cell_counts.get('code', 0) + 1
+    
+    def save_notebook(self):
+        """把整个notebook写入文件（同时清空已写入的日志），用于清空cell、修改元数据等非追加的修改"""
+        with self.lock:
+            self.journal.compact(self.notebook_data)
+    
+    def flush_notebook(self):
+        """日志中还有未写入notebook的cell时，同步写入notebook文件"""
+        with self.lock:
+            if self.journal.pending:
+                self.journal.compact(self.notebook_data)
+            else:
+                self.journal.wait()
+    
+    def export_notebook(self, path: str) -> str:
+        """
+        导出独立的notebook：按引用读回blob中的输出，写入一个不依赖blob目录的 .ipynb
+
+        Args:
+            path: 导出的文件路径
+
+        Returns:
+            导出的文件路径
+        """
+        with self.lock:
+            cells = list(self.notebook_data['cells'])
+            notebook = dict(self.notebook_data, cells=[])
+        # blob只在导出时才读回
+        notebook['cells'] = [self.blob_store.rehydrate(cell) for cell in cells]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(notebook, f, indent=2, ensure_ascii=False)
+        return path
+    
+    def _append_cell(self, cell: Dict[str, Any]):
+        """添加cell：大输出先存入blob，再追加一条日志记录，未压缩的记录达到阈值时在后台重写notebook文件"""
+        if cell['cell_type'] == 'code' and 'dataflow' not in cell['metadata']:
+            cell['metadata']['dataflow'] = _dataflow(analyze_cell(_source_text(cell)))
+        cell = self.blob_store.externalize(cell)
+        self.notebook_data['cells'].append(cell)
+        self._index_cell(cell, len(self.notebook_data['cells']) - 1)
+        self.journal.append("cell", cell=cell)
+        if self.journal.needs_compaction():
+            self.journal.compact(self.notebook_data, background=True)
+    
+    def _record_execution(self, cell: Dict[str, Any], execution: Execution,
+                          interrupted: bool = False, failure: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """把执行结果写入cell并追加到notebook，返回执行结果字典"""
+        if failure is None and execution.error and execution.error.get("ename") == "MemoryError":
+            # 超出内存限制时kernel内的分配失败
+            failure = {"reason": "memory", "kernel_restarted": False}
+        cell["execution_count"] = execution.execution_count
+        cell["outputs"] = execution.outputs
+        result = {
+            "execution_count": execution.execution_count,
+            "outputs": execution.outputs,
+            "error": execution.error
+        }
+        if interrupted:
+            cell["metadata"]["interrupted"] = True
+            result["interrupted"] = True
+        if failure is not None:
+            cell["metadata"]["failure"] = failure
+            result["failure"] = failure
+        self._append_cell(cell)
+        return result
+    
+    def _add_failure_output(self, execution: Execution, reason: str, message: str):
+        execution.error = {
+            "output_type": "error",
+            "ename": _FAILURE_ENAMES[reason],
+            "evalue": message,
+            "traceback": []
+        }
+        execution.outputs.append(execution.error)
+    
+    def _record_cached(self, cell: Dict[str, Any], execution_count: int, entry: Dict[str, Any],
+                       on_output: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """把缓存的输出作为本次执行的结果记录到notebook"""
+        outputs = copy.deepcopy(entry["outputs"])
+        for output in outputs:
+            if output.get("output_type") == "execute_result":
+                output["execution_count"] = execution_count
+            if on_output is not None:
+                on_output(output)
+        cell["execution_count"] = execution_count
+        cell["outputs"] = outputs
+        cell["metadata"]["memoized"] = {"saved_seconds": round(entry["duration"], 3)}
+        self._append_cell(cell)
+        return {"execution_count": execution_count, "outputs": outputs, "error": None, "cached": True}
+    
+    def add_markdown_cell(self, text: str, metadata: Optional[Dict[str, Any]] = None):
+        """添加markdown cell到notebook"""
+        cell = self._new_cell(text, "markdown", metadata)
+        with self.lock:
+            self._append_cell(cell)
+    
+    def clear_cells(self):
+        """清空所有cell并写入notebook文件，之后的执行计数从1开始"""
+        with self.lock:
+            # 先清空索引再替换cell列表，不持锁的读取方不会按旧索引访问新列表
+            self._reset_index()
+            self.notebook_data['cells'] = []
+            self.save_notebook()
+    
+    def get_execution_history(self) -> List[Dict[str, Any]]:
+        """获取执行历史"""
+        return self.notebook_data['cells']
+    
+    def get_cell(self, execution_count: int) -> Optional[Dict[str, Any]]:
+        """按执行计数查找代码cell，找不到时返回None"""
+        position = self._code_cell_positions.get(execution_count)
+        return None if position is None else self.notebook_data['cells'][position]
+    
+    def find_cells(self, start: int = 0, limit: int = 0, cell_type: Optional[str] = None,
+                   has_error: Optional[bool] = None, query: Optional[str] = None,
+                   regex: bool = False) -> Tuple[List[Tuple[int, Dict[str, Any]]], int]:
+        """
+        按条件查找cell并分页，候选cell来自索引，只有搜索时才逐个匹配文本
+        
+        Args:
+            start: 跳过前多少个匹配的cell
+            limit: 最多返回多少个cell，0表示不限制
+            cell_type: 只查找该类型的cell（code或markdown）
+            has_error: True只查找有错误输出的cell，False只查找没有错误的cell
+            query: 在源码和文本输出中搜索的子串（不区分大小写）或正则表达式
+            regex: query是否为正则表达式
+            
+        Returns:
+            ([(cell位置, cell), ...], 匹配的cell总数)
+            
+        Raises:
+            re.error: 正则表达式无效
+        """
+        cells = self.notebook_data['cells']
+        texts = self._search_texts
+        if cell_type:
+            positions = self._type_positions.get(cell_type, [])
+        else:
+            positions = range(min(len(cells), len(texts)))
+        if has_error is not None:
+            if has_error and not cell_type:
+                positions = self._error_positions
+            else:
+                error_set = set(self._error_positions)
+                positions = [p for p in positions if (p in error_set) == has_error]
+        if query:
+            if regex:
+                pattern = re.compile(query)
+                positions = [p for p in positions if pattern.search(texts[p])]
+            else:
+                needle = query.lower()
+                positions = [p for p in positions if needle in texts[p].lower()]
+        total = len(positions)
+        start = max(start, 0)
+        page = positions[start:start + limit] if limit > 0 else positions[start:]
+        return [(p, cells[p]) for p in page], total
+    
+    def affected_cells(self, changed: List[str]) -> List[int]:
+        """
+        找出依赖于变化的变量或文件的代码cell：直接读取它们的cell，以及数据流图上这些cell下游的所有cell
+        
+        Args:
+            changed: 变化的变量名或文件路径
+            
+        Returns:
+            受影响的cell位置，按notebook顺序（即拓扑顺序）排列；被重新执行过的旧版本不包含在内
+        """
+        seeds = []
+        for item in changed:
+            seeds += self._variable_readers.get(item, [])
+            seeds += self._file_readers.get(os.path.realpath(item), [])
+        affected = set()
+        pending = [p for p in seeds if p not in self._superseded]
+        while pending:
+            position = pending.pop()
+            if position in affected:
+                continue
+            affected.add(position)
+            pending += [p for p in self._dependents.get(position, []) if p not in self._superseded]
+        return sorted(affected)
+    
+    def get_notebook_summary(self) -> str:
+        """获取notebook摘要（只读取索引，不等待正在执行的cell）"""
+        total = len(self.notebook_data['cells'])
+        code_count = self._cell_counts.get('code', 0)
+        markdown_count = self._cell_counts.get('markdown', 0)
+        last_cell = None if self._last_code_position is None else \
+            self.notebook_data['cells'][self._last_code_position]
+        
+        summary = f"Notebook摘要:\n"
+        summary += f"- 总共有 {total} 个cells\n"
+        summary += f"- 代码cells: {code_count}\n"
+        summary += f"- Markdown cells: {markdown_count}\n"
+        
+        if last_cell is not None:
+            summary += f"\n最后的代码执行:\n"
+            code = ''.join(last_cell['source']) if isinstance(last_cell['source'], list) else last_cell['source']
+            summary += f"```python\n{code}\n```\n"
+            
+            if last_cell.get('outputs'):
+                summary += "输出:\n"
+                for output in last_cell['outputs']:
+                    if output.get('output_type') == 'stream':
+                        summary += output.get('text', '')
+                    elif output.get('output_type') == 'execute_result':
+                        data = output.get('data', {})
+                        if 'text/plain' in data:
+                            summary += data['text/plain']
+        
+        return summary
+
+
+class KernelExecutorBase(NotebookRecorder):
+    """
+    IPythonExecutor 和 AsyncIPythonExecutor 共用的部分：配置和kernel池、cell的创建与记录、结果缓存、
+    超时和kernel退出时的失败信息、检查点的记录与恢复；与kernel的通信（同步或异步的消息路由）由子类实现
+    """
+    
+    def __init__(self, kernel_name: str = "python3", notebook_path: str = "execution_history.ipynb",
+                 kernel_pool: Optional[KernelPool] = None, cell_timeout: Optional[float] = None,
+                 memoize: Optional[bool] = None):
+        """
+        Args:
+            kernel_name: Kernel名称，默认为python3
+            notebook_path: 保存notebook的文件路径
+            kernel_pool: 获取kernel的池，默认使用进程内共享的池；kernel的内存和CPU限制在池上配置
+            cell_timeout: 单个cell的超时时间（秒），0表示不限制，None表示读取环境变量 IPYTHON_CELL_TIMEOUT（默认600秒）
+            memoize: 是否缓存只读cell的输出，None表示读取环境变量 IPYTHON_CELL_MEMOIZE
+        """
+        self.kernel_name = kernel_name
+        self.kernel_pool = kernel_pool
+        self.cell_timeout = cell_timeout if cell_timeout is not None else \
+            float(os.getenv("IPYTHON_CELL_TIMEOUT", DEFAULT_CELL_TIMEOUT))
+        self.memoize = memoize if memoize is not None else \
+            os.getenv("IPYTHON_CELL_MEMOIZE", str(DEFAULT_MEMOIZE)).lower() in ("1", "true")
+        self.km = None
+        self.kc = None
+        # 按msg_id分发kernel消息，kernel启动后创建
+        self.router = None
+        super().__init__(notebook_path)
+    
+    def warm_up(self):
+        """在后台预启动kernel池，之后的第一个cell无需等待kernel启动"""
+        self._pool().start()
+    
+    def _pool(self) -> KernelPool:
+        return self.kernel_pool or get_kernel_pool(self.kernel_name)
+    
+    def interrupt(self):
+        """中断正在执行的cell（可以在其他线程中调用），已收到的输出照常记录"""
+        if self.km is not None:
+            self.km.interrupt_kernel()
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """cell结果缓存的统计信息：命中、未命中、不可缓存、跳过的次数，命中率和节省的执行时间"""
+        return cell_cache.get_cell_cache().stats()
+    
+    def _begin_cell(self, code: str, cell_type: str,
+                    metadata: Optional[Dict[str, Any]]) -> Tuple[int, Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        分配执行计数并创建cell，调用方持有 self.lock
+        
+        Returns:
+            (执行计数, cell, 代码分析)；非代码cell直接记录到notebook，代码分析为None
+        """
+        execution_count = self._next_execution_count()
+        cell = self._new_cell(code, cell_type, metadata)
+        if cell_type != "code":
+            self._append_cell(cell)
+            return execution_count, cell, None
+        analysis = analyze_cell(code)
+        cell["metadata"]["dataflow"] = _dataflow(analysis)
+        return execution_count, cell, analysis
+    
+    def _memo_key_from(self, code: str, analysis: Dict[str, Any],
+                       variables: Optional[Dict[str, Any]]) -> Optional[str]:
+        """只读cell的缓存键：规范化代码 + 读取的变量和输入文件的指纹；不可缓存（variables为None）时返回None"""
+        files = cell_cache.file_fingerprints(analysis["files"]) if variables is not None else None
+        if files is None:
+            cell_cache.get_cell_cache().record_uncacheable()
+            return None
+        return cell_cache.memo_key(normalized_code(code), variables, self.kernel_name, files)
+    
+    def _cached_result(self, key: Optional[str], use_cache: bool, cell: Dict[str, Any], execution_count: int,
+                       on_output: Optional[Callable[[Dict[str, Any]], None]]) -> Optional[Dict[str, Any]]:
+        """缓存命中时把缓存的输出记录为本次执行的结果并返回，否则返回None"""
+        if key is None:
+            return None
+        if not use_cache:
+            cell_cache.get_cell_cache().record_bypass()
+            return None
+        entry = cell_cache.get_cell_cache().get(key)
+        if entry is None:
+            return None
+        with self.lock:
+            return self._record_cached(cell, execution_count, entry, on_output)
+    
+    def _finish(self, cell: Dict[str, Any], execution: Execution, key: Optional[str], started: float,
+                failure: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """成功的执行写入结果缓存，执行结果记录到notebook"""
+        if failure is None and key is not None and execution.error is None:
+            cell_cache.get_cell_cache().put(key, execution.outputs, time.monotonic() - started)
+        with self.lock:
+            return self._record_execution(cell, execution, failure=failure)
+    
+    def _resolve_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        timeout = self.cell_timeout if timeout is None else timeout
+        return timeout if timeout and timeout > 0 else None
+    
+    def _timeout_failure(self, execution: Execution, timeout: float, restarted: Optional[str]) -> Dict[str, Any]:
+        """超时的失败信息，restarted为重启kernel的说明，None表示中断已生效、kernel未重启"""
+        if restarted is None:
+            message = f"cell执行超过{timeout:g}秒，已中断（kernel中的变量保留）"
+        else:
+            message = f"cell执行超过{timeout:g}秒且中断无效，{restarted}"
+        self._add_failure_output(execution, "timeout", message)
+        return {"reason": "timeout", "timeout": timeout, "kernel_restarted": restarted is not None}
+    
+    def _death_failure(self, execution: Execution, death: Tuple[str, Optional[int], str],
+                       restarted: str) -> Dict[str, Any]:
+        """kernel在执行中退出的失败信息，death为 describe_kernel_death 的结果（须在重启前获取）"""
+        reason, returncode, cause = death
+        self._add_failure_output(execution, reason, f"{cause}，{restarted}")
+        return {"reason": reason, "returncode": returncode, "kernel_restarted": True}
+    
+    @staticmethod
+    def _describe_restart(report: Optional[Dict[str, Any]]) -> str:
+        """重启kernel后给用户的说明"""
+        if report is None:
+            return "kernel已重启，之前定义的变量已丢失"
+        return f"kernel已重启，已从检查点恢复 {len(report['restored'])} 个变量"
+    
+    def latest_checkpoint(self) -> Optional[str]:
+        """notebook元数据中最近一个仍然存在的检查点路径"""
+        for record in reversed(self.notebook_data['metadata'].get('checkpoints', [])):
+            if Path(record["path"], kernel_checkpoint.MANIFEST_NAME).exists():
+                return record["path"]
+        return None
+    
+    def _checkpoint_request(self, path: Optional[str]) -> Tuple[str, str]:
+        """检查点目录和在kernel中保存命名空间的代码"""
+        if self.kc is None:
+            raise RuntimeError("kernel未启动，没有可保存的状态")
+        path = os.path.abspath(path or kernel_checkpoint.new_checkpoint_path(Path(self.notebook_path).stem))
+        return path, kernel_checkpoint.kernel_call("save_namespace", path)
+    
+    def _record_checkpoint(self, path: str, reply: Dict[str, Any]) -> Dict[str, Any]:
+        """保存完成后把检查点记录到notebook元数据的 checkpoints 中，返回检查点清单（额外包含 path）"""
+        if reply.get("status") == "error":
+            raise RuntimeError(f"保存检查点失败: {reply.get('ename')}: {reply.get('evalue')}")
+        manifest = kernel_checkpoint.read_manifest(path)
+        with self.lock:
+            record = {
+                "path": path,
+                "created": manifest["created"],
+                "cell_index": len(self.notebook_data['cells']),
+                "variables": [entry["name"] for entry in manifest["entries"]],
+                "skipped": sorted(manifest["skipped"]),
             }
+            self.notebook_data['metadata'].setdefault('checkpoints', []).append(record)
+            self.save_notebook()
+        return dict(manifest, path=path)
+    
+    def _restore_request(self, path: Optional[str]) -> Tuple[str, str, str]:
+        """检查点目录、恢复报告的路径和在kernel中恢复命名空间的代码"""
+        path = path or self.latest_checkpoint()
+        if path is None:
+            raise FileNotFoundError("没有可用的检查点")
+        path = os.path.abspath(path)
+        report_path = os.path.join(path, f"restore-{uuid.uuid4().hex[:8]}.json")
+        return path, report_path, kernel_checkpoint.kernel_call("load_namespace", path, report_path)
+    
+    @staticmethod
+    def _read_restore_report(reply: Dict[str, Any], path: str, report_path: str) -> Dict[str, Any]:
+        """读取kernel写出的恢复报告：{"restored": [变量名], "failed": {变量名: 原因}, "path": 检查点目录}"""
+        try:
+            if reply.get("status") == "error":
+                raise RuntimeError(f"恢复检查点失败: {reply.get('ename')}: {reply.get('evalue')}")
+            with open(report_path, 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        finally:
+            if os.path.exists(report_path):
+                os.remove(report_path)
+        return dict(report, path=path)
+
+
+class IPythonExecutor(KernelExecutorBase):
+    """IPython Kernel执行器，将执行记录保存为notebook格式"""
+    
+    def __init__(self, kernel_name: str = "python3", notebook_path: str = "execution_history.ipynb",
+                 kernel_pool: Optional[KernelPool] = None, cell_timeout: Optional[float] = None,
+                 memoize: Optional[bool] = None):
+        """
+        初始化IPython执行器，参数见 KernelExecutorBase
+        
+        self.lock 串行化kernel上的执行，后台预加载和Agent的代码可能来自不同线程；
+        调用方可以持有该锁连续执行多个cell，中间不会插入其他线程的代码
+        """
+        super().__init__(kernel_name, notebook_path, kernel_pool, cell_timeout, memoize)
     
     def start_kernel(self):
-        """启动kernel"""
-        if self.km is None:
-            self.km = KernelManager(kernel_name=self.kernel_name)
-            self.km.start_kernel()
-            self.kc = self.km.client()
-            self.kc.start_channels()
-            time.sleep(1)  # 等待kernel启动
+        """启动kernel：从kernel池取一个已就绪、已导入常用库的kernel"""
+        with self.lock:
+            if self.km is None:
+                self.km, self.kc = self._pool().acquire()
+                self.router = MessageRouter(self.kc, self.km.is_alive)
     
     def stop_kernel(self):
-        """停止kernel"""
+        """停止kernel，并把日志中的cell写入notebook"""
+        self.flush_notebook()
         if self.kc is not None:
             self.kc.stop_channels()
         if self.km is not None:
-            self.km.shutdown_kernel()
+            try:
+                # kernel已经退出（例如超出内存限制被杀死）时直接清理
+                self.km.shutdown_kernel(now=not self.km.is_alive())
+            except Exception as e:
+                print(f"警告：关闭kernel失败: {e}")
         self.km = None
         self.kc = None
+        self.router = None
     
     def execute_code(self, code: str, cell_type: str = "code", 
-                    metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+                    metadata: Optional[Dict[str, Any]] = None,
+                    on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                    timeout: Optional[float] = None, use_cache: bool = True) -> Dict[str, Any]:
         """
         执行Python代码并记录到notebook
         
+        开启 memoize 时，只读cell（不定义变量、无副作用、不读取外部数据，见 cell_analysis）按代码和读取的变量的指纹
+        查找缓存，命中时不在kernel中执行，直接返回缓存的输出（结果包含 cached=True）。
+        
+        执行中按Ctrl-C（KeyboardInterrupt）会中断kernel，已收到的输出照常记录到notebook，然后重新抛出。
+        超时时先中断kernel，中断无效再重启kernel（有检查点时恢复）；kernel因资源限制退出时也会重启。
+        这两种情况的结果包含结构化的 failure 字段：{"reason": timeout/memory/cpu/died, "kernel_restarted": bool, ...}，
+        error 为对应的 CellTimeoutError / KernelMemoryError / KernelCPULimitError / KernelDiedError。
+        
         Args:
             code: 要执行的Python代码
             cell_type: cell类型（code或markdown）
             metadata: 额外的元数据
+            on_output: 每收到一个输出（stream、display_data、execute_result、error）时立即调用
+            timeout: 本cell的超时时间（秒），None表示使用执行器的 cell_timeout，0表示不限制
+            use_cache: 为False时跳过缓存，强制在kernel中执行（执行结果仍会更新缓存）
             
         Returns:
             执行结果字典，包含output、execution_count等
         """
+        with self.lock:
+            return self._execute_code(code, cell_type, metadata, on_output, timeout, use_cache)
+    
+    def _execute_code(self, code: str, cell_type: str, metadata: Optional[Dict[str, Any]],
+                      on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      timeout: Optional[float] = None, use_cache: bool = True) -> Dict[str, Any]:
         # 启动kernel（如果还没启动）
         if self.kc is None:
             self.start_kernel()
         
-        # 创建新的cell
-        execution_count = len([c for c in self.notebook_data['cells'] if c.get('cell_type') == 'code']) + 1
+        execution_count, cell, analysis = self._begin_cell(code, cell_type, metadata)
+        if analysis is None:
+            return {"execution_count": execution_count, "outputs": [], "error": None}
         
-        cell = {
-            "cell_type": cell_type,
-            "metadata": metadata or {},
-            "source": code.split('\n'),
-        }
+        key = self._memo_key(code, analysis) if self.memoize else None
+        cached = self._cached_result(key, use_cache, cell, execution_count, on_output)
+        if cached is not None:
+            return cached
         
-        result = {
-            "execution_count": execution_count,
-            "outputs": [],
-            "error": None
-        }
+        # 执行代码，按msg_id收集输出，直到kernel回到idle并收到execute_reply
+        timeout = self._resolve_timeout(timeout)
+        started = time.monotonic()
+        execution = self.router.execute(code, execution_count=execution_count, on_output=on_output)
+        failure = None
+        try:
+            self.router.wait(execution, timeout=timeout)
+        except KeyboardInterrupt:
+            self._cancel(execution)
+            self._record_execution(cell, execution, interrupted=True)
+            raise
+        except TimeoutError:
+            failure = self._handle_timeout(execution, timeout)
+        except KernelDiedError:
+            failure = self._handle_kernel_death(execution)
+        return self._finish(cell, execution, key, started, failure)
+    
+    def _memo_key(self, code: str, analysis: Dict[str, Any]) -> Optional[str]:
+        """只读cell的缓存键，见 _memo_key_from；不可缓存时返回None"""
+        variables = self._fingerprint_variables(analysis["uses"]) if analysis["pure"] else None
+        return self._memo_key_from(code, analysis, variables)
+    
+    def _fingerprint_variables(self, names: List[str]) -> Optional[Dict[str, Any]]:
+        """在kernel中计算变量指纹，有变量无法计算指纹时返回None"""
+        if not names:
+            return {}
+        execution = self.router.execute("", silent=True, store_history=False,
+                                        user_expressions={"fingerprints": fingerprint_expression(names)})
+        try:
+            self.router.wait(execution, timeout=FINGERPRINT_TIMEOUT)
+        except TimeoutError:
+            self.router.discard(execution)
+            print("警告：计算变量指纹超时，本cell不使用缓存")
+            return None
+        return parse_fingerprints(execution.reply)
+    
+    def rerun_affected(self, changed: List[str], stop_on_error: bool = True,
+                       use_cache: bool = True) -> Dict[str, Any]:
+        """
+        数据更新后增量刷新：只重新执行依赖于变化的变量或文件的cell（见 affected_cells），按拓扑顺序执行
         
-        if cell_type == "code":
-            # 执行代码
-            msg_id = self.kc.execute(code)
-            
-            # 获取输出
-            outputs = []
-            error_output = None
-            
-            while True:
-                try:
-                    msg = self.kc.get_iopub_msg(timeout=1)
-                    msg_type = msg['msg_type']
-                    
-                    if msg_type == 'execute_result':
-                        outputs.append({
-                            "output_type": "execute_result",
-                            "execution_count": execution_count,
-                            "data": msg['content']['data'],
-                            "metadata": msg['content']['metadata']
-                        })
-                    elif msg_type == 'display_data':
-                        outputs.append({
-                            "output_type": "display_data",
-                            "data": msg['content']['data'],
-                            "metadata": msg['content']['metadata']
-                        })
-                    elif msg_type == 'stream':
-                        outputs.append({
-                            "output_type": "stream",
-                            "name": msg['content']['name'],
-                            "text": msg['content']['text']
-                        })
-                    elif msg_type == 'error':
-                        error_output = {
-                            "output_type": "error",
-                            "ename": msg['content']['ename'],
-                            "evalue": msg['content']['evalue'],
-                            "traceback": msg['content']['traceback']
-                        }
-                        break
-                    elif msg_type == 'status' and msg['content']['execution_state'] == 'idle':
-                        break
-                        
-                except queue.Empty:
-                    # 检查执行状态
-                    try:
-                        reply_msg = self.kc.get_shell_msg(timeout=1)
-                        if reply_msg['parent_header']['msg_id'] == msg_id:
-                            if reply_msg['content']['status'] == 'error':
-                                error_output = {
-                                    "output_type": "error",
-                                    "ename": reply_msg['content'].get('ename', 'Unknown'),
-                                    "evalue": reply_msg['content'].get('evalue', 'Unknown error'),
-                                    "traceback": []
-                                }
-                            break
-                    except queue.Empty:
-                        break
+        重新执行的cell追加到notebook末尾，metadata中的 rerun_of 记录最初的执行计数；
+        之后再次刷新时执行的是最新的版本。文件依赖只识别以常量路径读取的文件。
+        
+        Args:
+            changed: 变化的变量名或文件路径
+            stop_on_error: 有cell出错时是否停止执行其余的cell
+            use_cache: 是否使用cell结果缓存（开启 memoize 时）
             
-            cell["execution_count"] = execution_count
-            cell["outputs"] = outputs if not error_output else [error_output]
-            result["outputs"] = cell["outputs"]
-            result["error"] = error_output
+        Returns:
+            {"affected": 受影响的cell的执行计数, "results": [{"rerun_of", "execution_count", "error", ...}],
+             "skipped": 因出错而未执行的cell的执行计数}
+        """
+        with self.lock:
+            cells = [self.notebook_data['cells'][p] for p in self.affected_cells(changed)]
+            roots = [cell['metadata'].get('rerun_of', cell.get('execution_count')) for cell in cells]
+            results = []
+            for cell, root in zip(cells, roots):
+                result = self._execute_code(_source_text(cell), "code", {"rerun_of": root}, use_cache=use_cache)
+                results.append(dict(result, rerun_of=root))
+                if stop_on_error and result.get("error"):
+                    break
+            return {"affected": roots, "results": results, "skipped": roots[len(results):]}
+    
+    def execute_code_stream(self, code: str, metadata: Optional[Dict[str, Any]] = None,
+                            timeout: Optional[float] = None) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+        """
+        执行Python代码，每收到一个输出就yield出来，用于观察长时间运行的cell
         
-        # 添加到notebook
-        self.notebook_data['cells'].append(cell)
+        提前关闭生成器（break 或 close()）会中断kernel，已收到的输出仍然记录到notebook。
+        生成器运行期间持有执行器的锁，应在同一个线程中迭代完或关闭。
         
-        # 保存notebook
-        self.save_notebook()
+        Args:
+            code: 要执行的Python代码
+            metadata: 额外的元数据
+            timeout: 超时时间（秒），处理方式同 execute_code
+            
+        Yields:
+            notebook格式的输出
+            
+        Returns:
+            执行结果字典（生成器的返回值，即StopIteration.value），与 execute_code 相同
+        """
+        with self.lock:
+            if self.kc is None:
+                self.start_kernel()
+            execution_count = self._next_execution_count()
+            cell = self._new_cell(code, "code", metadata)
+            timeout = self._resolve_timeout(timeout)
+            execution = self.router.execute(code, execution_count=execution_count)
+            try:
+                yield from self.router.stream(execution, timeout=timeout)
+            except (GeneratorExit, KeyboardInterrupt):
+                self._cancel(execution)
+                self._record_execution(cell, execution, interrupted=True)
+                raise
+            except TimeoutError:
+                return self._record_execution(cell, execution, failure=self._handle_timeout(execution, timeout))
+            except KernelDiedError:
+                return self._record_execution(cell, execution, failure=self._handle_kernel_death(execution))
+            return self._record_execution(cell, execution)
+    
+    def _cancel(self, execution: Execution, timeout: float = INTERRUPT_TIMEOUT) -> bool:
+        """
+        中断kernel并等待被中断的执行结束
         
-        return result
+        Returns:
+            中断是否生效；没有生效时放弃等待，之后到达的消息会被丢弃
+        """
+        self.interrupt()
+        try:
+            self.router.wait(execution, timeout=timeout)
+            return True
+        except (TimeoutError, KernelDiedError) as e:
+            print(f"警告：中断执行后未能等到kernel回应: {e}")
+            self.router.discard(execution)
+            return False
     
-    def save_notebook(self):
-        """保存notebook到文件"""
-        with open(self.notebook_path, 'w', encoding='utf-8') as f:
-            json.dump(self.notebook_data, f, indent=2, ensure_ascii=False)
+    def _handle_timeout(self, execution: Execution, timeout: float) -> Dict[str, Any]:
+        """超时：先中断，中断无效时重启kernel，返回失败信息"""
+        if self._cancel(execution):
+            return self._timeout_failure(execution, timeout, None)
+        return self._timeout_failure(execution, timeout, self._restart_after_failure())
     
-    def add_markdown_cell(self, text: str, metadata: Optional[Dict[str, Any]] = None):
-        """添加markdown cell到notebook"""
-        cell = {
-            "cell_type": "markdown",
-            "metadata": metadata or {},
-            "source": text.split('\n')
-        }
-        self.notebook_data['cells'].append(cell)
-        self.save_notebook()
+    def _handle_kernel_death(self, execution: Execution) -> Dict[str, Any]:
+        """kernel在执行中退出：根据退出码判断原因，重启kernel，返回失败信息"""
+        death = describe_kernel_death(self.km, self._pool())
+        return self._death_failure(execution, death, self._restart_after_failure())
     
-    def get_execution_history(self) -> List[Dict[str, Any]]:
-        """获取执行历史"""
-        return self.notebook_data['cells']
+    def _restart_after_failure(self) -> str:
+        """重启kernel并尝试从最近的检查点恢复，返回给用户的说明"""
+        try:
+            report = self.restart_kernel(restore=True)
+        except Exception as e:
+            return f"重启kernel失败: {e}"
+        return self._describe_restart(report)
     
-    def get_notebook_summary(self) -> str:
-        """获取notebook摘要"""
-        code_cells = [c for c in self.notebook_data['cells'] if c.get('cell_type') == 'code']
-        markdown_cells = [c for c in self.notebook_data['cells'] if c.get('cell_type') == 'markdown']
+    def checkpoint(self, path: Optional[str] = None, timeout: float = 600) -> Dict[str, Any]:
+        """
+        保存kernel用户命名空间的检查点，并记录到notebook元数据的 checkpoints 中
         
-        summary = f"Notebook摘要:\n"
-        summary += f"- 总共有 {len(self.notebook_data['cells'])} 个cells\n"
-        summary += f"- 代码cells: {len(code_cells)}\n"
-        summary += f"- Markdown cells: {len(markdown_cells)}\n"
+        Args:
+            path: 检查点目录，默认在检查点根目录下按notebook名生成
+            timeout: 保存的超时时间（秒）
+            
+        Returns:
+            检查点清单，额外包含 path
+        """
+        with self.lock:
+            path, code = self._checkpoint_request(path)
+            return self._record_checkpoint(path, self._run_silent(code, timeout))
+    
+    def _run_silent(self, code: str, timeout: float) -> Dict[str, Any]:
+        """静默执行代码（不占用执行计数），返回execute_reply的content"""
+        return self.router.run(code, timeout=timeout, silent=True, store_history=False).reply
+    
+    def restore(self, path: Optional[str] = None, timeout: float = 600) -> Dict[str, Any]:
+        """
+        从检查点恢复kernel用户命名空间，kernel未启动时先启动
         
-        if code_cells:
-            summary += f"\n最后的代码执行:\n"
-            last_cell = code_cells[-1]
-            code = ''.join(last_cell['source']) if isinstance(last_cell['source'], list) else last_cell['source']
-            summary += f"```python\n{code}\n```\n"
+        Args:
+            path: 检查点目录，默认使用notebook元数据中最近的检查点
+            timeout: 恢复的超时时间（秒）
             
-            if last_cell.get('outputs'):
-                summary += "输出:\n"
-                for output in last_cell['outputs']:
-                    if output.get('output_type') == 'stream':
-                        summary += output.get('text', '')
-                    elif output.get('output_type') == 'execute_result':
-                        data = output.get('data', {})
-                        if 'text/plain' in data:
-                            summary += data['text/plain']
+        Returns:
+            {"restored": [变量名], "failed": {变量名: 原因}, "path": 检查点目录}
+        """
+        path, report_path, code = self._restore_request(path)
+        with self.lock:
+            if self.kc is None:
+                self.start_kernel()
+            reply = self._run_silent(code, timeout)
+        return self._read_restore_report(reply, path, report_path)
+    
+    def restart_kernel(self, restore: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        重启kernel，可选从最近的检查点恢复命名空间
         
-        return summary
+        Args:
+            restore: 是否恢复最近的检查点
+            
+        Returns:
+            恢复结果，没有恢复时为None
+        """
+        with self.lock:
+            self.stop_kernel()
+            self.start_kernel()
+            if restore and self.latest_checkpoint() is not None:
+                return self.restore()
+        return None
+
+
+def describe_kernel_death(km: KernelManager, pool: KernelPool) -> Tuple[str, Optional[int], str]:
+    """
+    根据kernel进程的退出码判断退出原因
+    
+    Returns:
+        (原因 memory/cpu/died, 退出码, 给用户的说明)
+    """
+    process = getattr(getattr(km, "provisioner", None), "process", None)
+    returncode = process.poll() if process is not None else None
+    reason = describe_exit(returncode, pool.memory_mb)
+    cause = {
+        "memory": f"kernel超出内存限制（{pool.memory_mb}MB）被终止",
+        "cpu": f"kernel超出CPU时间限制（{pool.cpu_seconds}秒）被终止",
+        "died": f"kernel意外退出（退出码 {returncode}）",
+    }[reason]
+    return reason, returncode, cause
+
+
+def parse_fingerprints(reply: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """从execute_reply的user_expressions中取出 fingerprint_variables 的结果，失败时返回None"""
+    value = reply.get("user_expressions", {}).get("fingerprints", {})
+    if value.get("status") != "ok":
+        return None
+    # 表达式的值为 (None, JSON字符串)
+    return json.loads(ast.literal_eval(value["data"]["text/plain"])[1])
+
+
+def fingerprint_expression(names: List[str]) -> str:
+    """在kernel中计算变量指纹的user_expressions表达式"""
+    return kernel_checkpoint.kernel_call("fingerprint_variables", names, module="tools.cell_cache")
+
+
+def _dataflow(analysis: Dict[str, Any]) -> Dict[str, List[str]]:
+    """cell在数据流图中的信息：定义的变量、读取的变量和输入文件"""
+    return {key: analysis[key] for key in ("defines", "uses", "files")}
+
+
+def _source_text(cell: Dict[str, Any]) -> str:
+    source = cell.get('source', [])
+    return '\n'.join(source) if isinstance(source, list) else source
+
+
+# 进程内共享的执行器，按notebook的真实路径索引；同一个notebook只有一个执行器写日志
+_shared_executors: Dict[str, NotebookRecorder] = {}
+# 通过 acquire_executor 持有各执行器的对象数，最后一个持有者释放时才停止kernel
+_executor_holders: Dict[str, int] = {}
+_shared_executors_lock = threading.Lock()
+
+
+def get_executor(notebook_path: str = "execution_history.ipynb",
+                 executor_class: Optional[Type[NotebookRecorder]] = None, **kwargs) -> NotebookRecorder:
+    """
+    获取进程内共享的执行器（每个notebook一个），notebook只在第一次获取时从文件加载。
+    只是临时使用（不持有）执行器时调用；需要长期持有并在结束时停止kernel的对象使用 acquire_executor
+    
+    Args:
+        notebook_path: notebook文件路径
+        executor_class: 需要的执行器类型，None表示不限（没有时创建 IPythonExecutor）
+        **kwargs: 第一次创建时传给执行器的其他参数
+        
+    Returns:
+        执行器
+        
+    Raises:
+        ValueError: 该notebook已由另一种执行器使用
+    """
+    with _shared_executors_lock:
+        return _lookup_executor(notebook_path, executor_class, kwargs)
+
+
+def acquire_executor(notebook_path: str = "execution_history.ipynb",
+                     executor_class: Optional[Type[NotebookRecorder]] = None, **kwargs) -> NotebookRecorder:
+    """
+    获取并持有共享的执行器，参数同 get_executor；持有者结束时必须调用 release_executor
+    """
+    with _shared_executors_lock:
+        executor = _lookup_executor(notebook_path, executor_class, kwargs)
+        key = os.path.realpath(notebook_path)
+        _executor_holders[key] = _executor_holders.get(key, 0) + 1
+        return executor
+
+
+def release_executor(executor: NotebookRecorder):
+    """
+    释放 acquire_executor 获取的执行器；最后一个持有者释放时把执行器移出注册表并停止kernel
+    
+    Args:
+        executor: 要释放的执行器，不在注册表中时不做任何操作
+    """
+    with _shared_executors_lock:
+        key = next((k for k, e in _shared_executors.items() if e is executor), None)
+        if key is None or key not in _executor_holders:
+            return
+        _executor_holders[key] -= 1
+        if _executor_holders[key] > 0:
+            return
+        del _executor_holders[key]
+        del _shared_executors[key]
+    # 停止kernel可能较慢，不持有注册表的锁；异步执行器的 close() 可在没有事件循环时调用
+    if hasattr(executor, "close"):
+        executor.close()
+    elif hasattr(executor, "stop_kernel"):
+        executor.stop_kernel()
+    else:
+        executor.flush_notebook()
+
+
+def _lookup_executor(notebook_path: str, executor_class: Optional[Type[NotebookRecorder]],
+                     kwargs: Dict[str, Any]) -> NotebookRecorder:
+    key = os.path.realpath(notebook_path)
+    executor = _shared_executors.get(key)
+    if executor is None:
+        executor = (executor_class or IPythonExecutor)(notebook_path=notebook_path, **kwargs)
+        _shared_executors[key] = executor
+    elif executor_class is not None and not isinstance(executor, executor_class):
+        raise ValueError(f"notebook {notebook_path} 已由 {type(executor).__name__} 使用")
+    return executor
+
+
+# 进程退出时把仍在运行的执行器的日志写入notebook
+_open_executors: "weakref.WeakSet[IPythonExecutor]" = weakref.WeakSet()
+
 
+@atexit.register
+def _flush_open_notebooks():
+    for executor in list(_open_executors):
+        try:
+            executor.flush_notebook()
+        except Exception as e:
+            print(f"警告：写入notebook失败: {e}")
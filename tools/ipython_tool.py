@@ -1,20 +1,31 @@
 """
 IPython执行工具 - 用于Agent的代码执行
 """
-from typing import Type, Optional
+import asyncio
+import re
+import weakref
+from typing import Any, Callable, Dict, Type, Optional, Union
 from langchain.tools import BaseTool
-from langchain.pydantic_v1 import BaseModel, Field
-from tools.ipython_executor import IPythonExecutor
+from langchain.pydantic_v1 import BaseModel, Field, PrivateAttr
+from tools.ipython_executor import IPythonExecutor, NotebookRecorder, acquire_executor, release_executor
+from tools.async_ipython_executor import AsyncIPythonExecutor
+from tools.output_budget import (compact_text, estimate_tokens, frame_summary_tokens, output_token_budget,
+                                 page_lines, render_outputs)
 from datetime import datetime
 import uuid
 from pathlib import Path
 
 
+# history操作默认每页的cell数
+DEFAULT_HISTORY_CELLS = 20
+
+
 class IPythonCodeInput(BaseModel):
     """IPython代码执行工具输入参数"""
     code: str = Field(description="要执行的Python代码")
     execute: bool = Field(default=True, description="是否立即执行代码")
     add_markdown: bool = Field(default=False, description="是否为结果添加markdown说明")
+    use_cache: bool = Field(default=True, description="启用结果缓存时是否使用缓存的输出，False表示强制重新执行")
 
 
 class IPythonCodeTool(BaseTool):
@@ -27,17 +38,36 @@ class IPythonCodeTool(BaseTool):
         "输入应该是包含'code'（要执行的代码）的JSON字符串。"
     )
     args_schema: Type[BaseModel] = IPythonCodeInput
-    executor: Optional[IPythonExecutor] = None
+    executor: Optional[Union[IPythonExecutor, AsyncIPythonExecutor]] = None
     notebook_path: str = "execution_history.ipynb"
+    use_async: bool = False
+    # 每收到一个输出时调用，用于在cell执行过程中实时显示进度
+    output_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    # 返回给Agent的输出的token预算，超出时保留首尾，完整输出在notebook中；0表示不限制
+    max_output_tokens: int = Field(default_factory=output_token_budget)
+    # 释放从共享注册表持有的执行器；传入的执行器由调用方管理，为None
+    _release_executor: Optional[weakref.finalize] = PrivateAttr(default=None)
     
-    def __init__(self, notebook_path: str = "execution_history.ipynb", **kwargs):
-        super().__init__(**kwargs)
+    def __init__(self, notebook_path: str = "execution_history.ipynb", use_async: bool = False, **kwargs):
+        """
+        Args:
+            notebook_path: 保存notebook的文件路径
+            use_async: 使用异步执行器，工具需通过 arun/ainvoke 调用，多个会话可以共用一个事件循环
+        """
+        super().__init__(use_async=use_async, **kwargs)
         self.notebook_path = notebook_path
         if self.executor is None:
-            self.executor = IPythonExecutor(notebook_path=notebook_path)
+            executor_class = AsyncIPythonExecutor if use_async else IPythonExecutor
+            self.executor = acquire_executor(notebook_path, executor_class)
+            # 用finalize而不是__del__释放：langchain会复制工具对象，副本被回收时不能释放原对象持有的执行器
+            self._release_executor = weakref.finalize(self, release_executor, self.executor)
+        # 在Agent等待用户输入时预启动kernel
+        self.executor.warm_up()
     
-    def _run(self, code: str, execute: bool = True, add_markdown: bool = False) -> str:
+    def _run(self, code: str, execute: bool = True, add_markdown: bool = False, use_cache: bool = True) -> str:
         """执行代码"""
+        if isinstance(self.executor, AsyncIPythonExecutor):
+            return "错误：使用异步执行器时请通过 arun/ainvoke 调用"
         try:
             if not code.strip():
                 return "错误：代码不能为空"
@@ -48,63 +78,71 @@ class IPythonCodeTool(BaseTool):
                 self.executor.add_markdown_cell(f"## 执行时间: {timestamp}\n\n执行以下代码：")
             
             # 执行代码
-            result = self.executor.execute_code(code)
-            
-            # 收集输出
-            output_text = []
-            
-            if result.get("error"):
-                error = result["error"]
-                output_text.append(f"错误: {error['ename']}")
-                output_text.append(f"{error['evalue']}")
-                if error.get('traceback'):
-                    output_text.append("\n".join(error['traceback']))
+            result = self.executor.execute_code(code, on_output=self.output_callback, use_cache=use_cache)
+            return self._format_result(result)
             
-            if result.get("outputs"):
-                for output in result["outputs"]:
-                    output_type = output.get('output_type')
-                    
-                    if output_type == 'stream':
-                        text = output.get('text', '')
-                        output_text.append(text)
-                    
-                    elif output_type == 'execute_result':
-                        data = output.get('data', {})
-                        # 优先显示text/plain格式
-                        if 'text/plain' in data:
-                            output_text.append(data['text/plain'])
-                        elif 'text/html' in data:
-                            output_text.append(data['text/html'])
-                        elif 'image/png' in data:
-                            output_text.append(f"[图像输出 - base64长度: {len(data['image/png'])}]")
-                        else:
-                            output_text.append(str(data))
-                    
-                    elif output_type == 'display_data':
-                        data = output.get('data', {})
-                        if 'text/plain' in data:
-                            output_text.append(data['text/plain'])
-            
-            result_str = "\n".join(output_text)
+        except Exception as e:
+            return f"执行代码时出错: {str(e)}"
+    
+    async def _arun(self, code: str, execute: bool = True, add_markdown: bool = False,
+                    use_cache: bool = True) -> str:
+        """异步执行代码；同步执行器在线程中执行，不阻塞事件循环"""
+        if not isinstance(self.executor, AsyncIPythonExecutor):
+            return await asyncio.to_thread(self._run, code, execute, add_markdown, use_cache)
+        try:
+            if not code.strip():
+                return "错误：代码不能为空"
             
-            if not result_str.strip():
-                result_str = "代码执行完成（无输出）"
+            if add_markdown:
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self.executor.add_markdown_cell(f"## 执行时间: {timestamp}\n\n执行以下代码：")
             
-            return f"代码执行结果:\n{result_str}"
+            result = await self.executor.execute_code(code, on_output=self.output_callback, use_cache=use_cache)
+            return self._format_result(result)
             
         except Exception as e:
             return f"执行代码时出错: {str(e)}"
     
-    def __del__(self):
-        """清理资源"""
-        if self.executor:
-            self.executor.stop_kernel()
+    def _format_result(self, result: Dict[str, Any]) -> str:
+        """把执行结果整理为返回给Agent的文本，超出token预算时压缩"""
+        outputs = result.get("outputs") or []
+        if result.get("error") and result["error"] not in outputs:
+            outputs = [result["error"]] + outputs
+        budget = self.max_output_tokens
+        execution_count = result.get('execution_count')
+        result_str = render_outputs(
+            outputs, frame_tokens=frame_summary_tokens(budget), blob_store=self.executor.blob_store,
+            reference=f"可通过 ipython_notebook 的 output 操作读取（execution_count={execution_count}，或 blob=上述引用）")
+        
+        if not result_str.strip():
+            result_str = "代码执行完成（无输出）"
+        else:
+            reference = (f"完整输出可通过 ipython_notebook 的 output 操作读取"
+                         f"（execution_count={execution_count}，offset为行号-1）")
+            result_str, _ = compact_text(result_str, budget, reference)
+        
+        header = "代码执行结果（缓存）" if result.get("cached") else "代码执行结果"
+        return f"{header}:\n{result_str}"
+    
+    def close(self):
+        """释放共享的执行器，同一notebook的最后一个持有者释放时才停止kernel；可重复调用，对象被回收时自动调用"""
+        if self._release_executor is not None:
+            self._release_executor()
 
 
 class IPythonNotebookInput(BaseModel):
     """Notebook操作输入参数"""
-    action: str = Field(description="操作类型：summary（获取摘要）, history（获取历史）, clear（清空）")
+    action: str = Field(description="操作类型：summary（获取摘要）, history（获取历史）, clear（清空）, output（读取cell的完整输出）")
     notebook_path: str = Field(default="execution_history.ipynb", description="Notebook文件路径")
+    execution_count: int = Field(default=0, description="output操作：cell的执行计数")
+    blob: str = Field(default="", description="output操作：读取DataFrame摘要中给出的blob引用（完整文本），设置时忽略execution_count")
+    offset: int = Field(default=0, description="output操作：起始行（从0开始）")
+    limit: int = Field(default=0, description="output操作：读取的行数，0表示读到输出预算用完；history操作：每页的cell数，默认20")
+    start: int = Field(default=0, description="history操作：跳过前多少个匹配的cell")
+    cell_type: str = Field(default="", description="history操作：只列出该类型的cell（code或markdown）")
+    errors_only: bool = Field(default=False, description="history操作：只列出执行出错的cell")
+    query: str = Field(default="", description="history操作：在cell源码和输出中搜索的文本（不区分大小写）")
+    regex: bool = Field(default=False, description="history操作：query是否为正则表达式")
 
 
 class IPythonNotebookTool(BaseTool):
@@ -112,47 +150,117 @@ class IPythonNotebookTool(BaseTool):
     name: str = "ipython_notebook"
     description: str = (
         "管理代码执行历史和notebook的工具。"
-        "支持的操作：summary（获取notebook摘要）, history（获取完整历史）, clear（清空历史）。"
+        "支持的操作：summary（获取notebook摘要）, "
+        "history（分页列出cell，可按类型、是否出错筛选，按query搜索源码和输出）, clear（清空历史）, "
+        "output（按execution_count或摘要中的blob引用分页读取完整输出，用于查看被省略的输出和DataFrame的完整文本）。"
         "输入应该是包含'action'（操作类型）的JSON字符串。"
     )
     args_schema: Type[BaseModel] = IPythonNotebookInput
     
-    def _run(self, action: str, notebook_path: str = "execution_history.ipynb") -> str:
+    def _run(self, action: str, notebook_path: str = "execution_history.ipynb",
+             execution_count: int = 0, offset: int = 0, limit: int = 0, start: int = 0,
+             cell_type: str = "", errors_only: bool = False, query: str = "", regex: bool = False,
+             blob: str = "") -> str:
         """执行notebook操作"""
         try:
-            executor = IPythonExecutor(notebook_path=notebook_path)
-            
+            # 共享执行器已在内存中维护notebook，不再每次从文件读取；
+            # 只在本次操作期间持有，没有其他持有者（例如IPythonCodeTool）时操作结束后释放
+            executor = acquire_executor(notebook_path)
+        except Exception as e:
+            return f"执行notebook操作时出错: {str(e)}"
+        try:
             if action == "summary":
                 return executor.get_notebook_summary()
             
             elif action == "history":
-                cells = executor.get_execution_history()
-                if not cells:
-                    return "Notebook为空"
-                
-                result = f"Notebook包含 {len(cells)} 个cells:\n\n"
-                for i, cell in enumerate(cells, 1):
-                    cell_type = cell.get('cell_type', 'unknown')
-                    source = cell.get('source', [])
-                    if isinstance(source, list):
-                        code = '\n'.join(source)
-                    else:
-                        code = source
-                    
-                    result += f"### Cell {i} ({cell_type}):\n"
-                    result += f"```\n{code}\n```\n"
-                    result += f"---\n"
-                
-                return result
+                return self._history(executor, start, limit, cell_type, errors_only, query, regex)
             
             elif action == "clear":
-                executor.notebook_data['cells'] = []
-                executor.save_notebook()
+                executor.clear_cells()
                 return "Notebook已清空"
             
+            elif action == "output":
+                return self._read_output(executor, execution_count, offset, limit, blob)
+            
             else:
-                return f"未知操作: {action}. 支持的操作: summary, history, clear"
+                return f"未知操作: {action}. 支持的操作: summary, history, clear, output"
                 
         except Exception as e:
             return f"执行notebook操作时出错: {str(e)}"
-
+        finally:
+            release_executor(executor)
+    
+    def _history(self, executor: NotebookRecorder, start: int, limit: int, cell_type: str,
+                 errors_only: bool, query: str, regex: bool) -> str:
+        """分页列出符合条件的cell，单页同样受输出预算限制"""
+        try:
+            cells, total = executor.find_cells(start, limit or DEFAULT_HISTORY_CELLS, cell_type or None,
+                                               True if errors_only else None, query or None, regex)
+        except re.error as e:
+            return f"无效的正则表达式: {e}"
+        if total == 0:
+            return "没有符合条件的cell" if (cell_type or errors_only or query) else "Notebook为空"
+        
+        budget = output_token_budget()
+        result = f"共 {total} 个符合条件的cells（Notebook共 {len(executor.get_execution_history())} 个）:\n\n"
+        shown = 0
+        for position, cell in cells:
+            entry = self._format_history_cell(position, cell, query, regex)
+            if budget and shown and estimate_tokens(result + entry) > budget:
+                break
+            result += entry
+            shown += 1
+        
+        end = max(start, 0) + shown
+        if end < total:
+            result += f"...（还有{total - end}个cells，可设置start={end}继续查看）"
+        return result
+    
+    @staticmethod
+    def _format_history_cell(position: int, cell: Dict[str, Any], query: str, regex: bool) -> str:
+        cell_type = cell.get('cell_type', 'unknown')
+        source = cell.get('source', [])
+        code = '\n'.join(source) if isinstance(source, list) else source
+        
+        labels = [cell_type]
+        if cell.get('execution_count') is not None:
+            labels.append(f"执行计数 {cell['execution_count']}")
+        errors = [o for o in cell.get('outputs') or [] if o.get('output_type') == 'error']
+        if errors:
+            labels.append(f"错误 {errors[0].get('ename')}")
+        entry = f"### Cell {position + 1} ({', '.join(labels)}):\n```\n{code}\n```\n"
+        
+        # 匹配位置不在源码中时给出输出中第一个匹配的行
+        if query:
+            matches = (lambda line: re.search(query, line)) if regex else (lambda line: query.lower() in line.lower())
+            if not any(matches(line) for line in code.split('\n')):
+                line = next((l for l in render_outputs(cell.get('outputs') or []).split('\n') if matches(l)), None)
+                if line is not None:
+                    entry += f"输出中匹配: {line.strip()[:200]}\n"
+        return entry + "---\n"
+    
+    def _read_output(self, executor: NotebookRecorder, execution_count: int, offset: int, limit: int,
+                     blob: str = "") -> str:
+        """分页读取cell的完整输出或blob中的完整文本（DataFrame不再用摘要代替），读取结果同样受输出预算限制"""
+        budget = output_token_budget()
+        if blob:
+            if not re.fullmatch(r"[0-9a-f]{64}", blob):
+                return f"无效的blob引用: {blob}"
+            try:
+                text = executor.blob_store.get(blob).decode('utf-8')
+            except FileNotFoundError:
+                return f"找不到blob: {blob}"
+            label = f"Blob {blob[:12]}"
+        else:
+            cell = executor.get_cell(execution_count)
+            if cell is None:
+                return f"找不到执行计数为 {execution_count} 的cell"
+            text = render_outputs(executor.blob_store.rehydrate(cell).get('outputs', []))
+            label = f"Cell [{execution_count}]"
+        if not text.strip():
+            return f"{label} 没有输出"
+        page, start, end, total = page_lines(text, offset, limit, budget)
+        result = f"{label} 输出第{start + 1}-{end}行（共{total}行）:\n{page}"
+        if end < total:
+            result += f"\n...（还有{total - end}行，可设置offset={end}继续读取）"
+        return result
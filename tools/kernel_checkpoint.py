@@ -0,0 +1,216 @@
+"""
+Kernel命名空间检查点
+把kernel用户命名空间中的变量保存到本地目录：DataFrame写为Feather列式文件，
+模块记录导入名，交互定义的函数和类保存源码，其余可pickle的对象使用pickle。
+kernel重启或会话迁移后从检查点恢复，无需重新执行历史cell。
+
+save_namespace / load_namespace 在kernel进程内运行，由 IPythonExecutor 静默调用。
+"""
+import ast
+import inspect
+import json
+import linecache
+import os
+import pickle
+import shutil
+import types
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+
+# 默认检查点目录，可通过环境变量 IPYTHON_CHECKPOINT_DIR 覆盖
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "data_analyzer", "checkpoints")
+
+MANIFEST_NAME = "manifest.json"
+
+# 恢复顺序：先导入模块、定义函数和类，pickle的对象可能引用它们
+_RESTORE_ORDER = {"module": 0, "source": 1, "feather": 2, "pickle": 3}
+
+
+def checkpoint_root() -> str:
+    """获取检查点根目录"""
+    return os.getenv("IPYTHON_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+
+
+def new_checkpoint_path(name: str = "checkpoint") -> str:
+    """在根目录下生成一个新的检查点路径"""
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(checkpoint_root(), f"{name}-{stamp}-{uuid.uuid4().hex[:8]}")
+
+
+def save_namespace(shell, directory: str) -> Dict[str, Any]:
+    """
+    保存用户命名空间（在kernel内运行）
+
+    先写入临时目录，完成后再替换为目标目录，中途失败不会留下不完整的检查点。
+
+    Args:
+        shell: IPython的InteractiveShell（kernel中的 get_ipython()）
+        directory: 检查点目录
+
+    Returns:
+        清单字典，包含 created, entries（已保存的变量）和 skipped（{变量名: 原因}）
+    """
+    target = Path(directory)
+    tmp = target.parent / f".{target.name}.{uuid.uuid4().hex}"
+    tmp.mkdir(parents=True)
+    entries = []
+    skipped: Dict[str, str] = {}
+    hidden = set(getattr(shell, "user_ns_hidden", {}))
+
+    try:
+        for name, value in list(shell.user_ns.items()):
+            if name.startswith("_") or name in hidden:
+                continue
+            try:
+                entry = _save_value(tmp, name, value)
+            except Exception as e:
+                skipped[name] = f"{type(e).__name__}: {e}"
+                continue
+            if entry is not None:
+                entries.append(entry)
+
+        manifest = {
+            "created": datetime.now().isoformat(),
+            "entries": entries,
+            "skipped": skipped,
+        }
+        with open(tmp / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(tmp, target)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return manifest
+
+
+def load_namespace(shell, directory: str, report_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    从检查点恢复用户命名空间（在kernel内运行）
+
+    Args:
+        shell: IPython的InteractiveShell
+        directory: 检查点目录
+        report_path: 恢复结果写入的JSON文件，供调用方读取
+
+    Returns:
+        {"restored": [变量名], "failed": {变量名: 原因}}
+    """
+    manifest = read_manifest(directory)
+    restored = []
+    failed: Dict[str, str] = {}
+    for entry in sorted(manifest["entries"], key=lambda e: _RESTORE_ORDER.get(e["kind"], 99)):
+        try:
+            _load_value(shell, Path(directory), entry)
+            restored.append(entry["name"])
+        except Exception as e:
+            failed[entry["name"]] = f"{type(e).__name__}: {e}"
+
+    report = {"restored": restored, "failed": failed}
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+    return report
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """读取检查点清单"""
+    with open(Path(directory) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def kernel_call(function: str, *args, module: str = "tools.kernel_checkpoint") -> str:
+    """
+    生成在kernel中调用本模块（或tools包中其他模块）函数的代码
+
+    生成的代码只有一个表达式，值为 (None, 函数返回值)，不会在用户命名空间中留下任何变量；
+    本模块所在的目录会加入kernel的sys.path；tools包按需导入导出名，kernel中只加载目标模块
+    及其依赖（pandas、pyarrow），不会加载langchain、jupyter_client或注册宿主进程的atexit处理函数。
+    """
+    root = str(Path(__file__).resolve().parent.parent)
+    call_args = ", ".join(["get_ipython()"] + [repr(a) for a in args])
+    return (
+        f"(__import__('sys').path.append({root!r}) if {root!r} not in __import__('sys').path else None, "
+        f"__import__({module!r}, fromlist=['{function}']).{function}({call_args}))"
+    )
+
+
+def _save_value(directory: Path, name: str, value: Any) -> Optional[Dict[str, Any]]:
+    """保存单个变量，返回清单条目；不需要保存的变量返回None"""
+    if isinstance(value, types.ModuleType):
+        return {"name": name, "kind": "module", "module": value.__name__}
+
+    if isinstance(value, (types.FunctionType, type)) and getattr(value, "__module__", None) == "__main__":
+        # 交互定义的函数和类按引用pickle，在新kernel中无法还原，保存源码
+        source = _class_source(value) if isinstance(value, type) else inspect.getsource(value)
+        return {"name": name, "kind": "source", "source": source}
+
+    if isinstance(value, pd.DataFrame) and feather is not None:
+        file_name = f"{uuid.uuid4().hex}.feather"
+        try:
+            # 保留索引和列名等pandas元数据；不压缩才能内存映射读取
+            table = pa.Table.from_pandas(value, preserve_index=True)
+            feather.write_feather(table, str(directory / file_name), compression="uncompressed")
+            return {"name": name, "kind": "feather", "file": file_name}
+        except Exception:
+            # 列名或列类型无法转为Arrow时退化为pickle
+            (directory / file_name).unlink(missing_ok=True)
+
+    file_name = f"{uuid.uuid4().hex}.pkl"
+    with open(directory / file_name, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {"name": name, "kind": "pickle", "file": file_name}
+
+
+def _class_source(cls: type) -> str:
+    """
+    获取交互定义的类的源码
+
+    inspect.getsource 找不到cell中定义的类，通过方法的代码对象定位所在cell，再用ast取出类定义。
+    """
+    try:
+        return inspect.getsource(cls)
+    except (OSError, TypeError):
+        pass
+    for member in vars(cls).values():
+        code = getattr(inspect.unwrap(member) if callable(member) else member, "__code__", None)
+        if code is None:
+            continue
+        cell_source = "".join(linecache.getlines(code.co_filename))
+        if not cell_source:
+            continue
+        for node in ast.walk(ast.parse(cell_source)):
+            if isinstance(node, ast.ClassDef) and node.name == cls.__name__ \
+                    and node.lineno <= code.co_firstlineno <= node.end_lineno:
+                return ast.get_source_segment(cell_source, node)
+    raise OSError("source code not available")
+
+
+def _load_value(shell, directory: Path, entry: Dict[str, Any]):
+    name, kind = entry["name"], entry["kind"]
+    if kind == "module":
+        shell.user_ns[name] = __import__(entry["module"], fromlist=["_"])
+    elif kind == "source":
+        exec(compile(entry["source"], f"<checkpoint {name}>", "exec"), shell.user_ns)
+    elif kind == "feather":
+        if feather is None:
+            raise RuntimeError("恢复DataFrame需要安装pyarrow")
+        table = feather.read_table(str(directory / entry["file"]), memory_map=True)
+        shell.user_ns[name] = table.to_pandas()
+    elif kind == "pickle":
+        with open(directory / entry["file"], 'rb') as f:
+            shell.user_ns[name] = pickle.load(f)
+    else:
+        raise ValueError(f"未知的检查点条目类型: {kind}")
@@ -0,0 +1,141 @@
+"""
+Kernel启动包装
+以 `python kernel_launcher.py --memory-mb 4096 --cpu-seconds 3600 -- <kernel命令>` 启动kernel：
+先设置资源限制，再exec为真正的kernel进程，限制由kernel继承，失控的cell不会拖垮整台机器。
+- 内存：RLIMIT_AS，超出时kernel内分配失败抛出MemoryError
+- CPU时间：RLIMIT_CPU，超出软限制时kernel收到SIGXCPU退出
+- cgroup（v2）：把kernel进程加入一个已创建好的cgroup目录，由cgroup的 memory.max / cpu.max 限制
+
+本文件只依赖标准库，作为脚本运行，不需要导入tools包。
+"""
+import argparse
+import os
+import signal
+import sys
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，只能不限制
+    resource = None
+
+
+# 默认限制，可通过环境变量 IPYTHON_KERNEL_MEMORY_MB / IPYTHON_KERNEL_CPU_SECONDS / IPYTHON_KERNEL_CGROUP 配置，
+# 0或空表示不限制
+DEFAULT_MEMORY_MB = 0
+DEFAULT_CPU_SECONDS = 0
+
+# CPU时间硬限制比软限制多出的秒数，kernel忽略SIGXCPU时由硬限制的SIGKILL兜底
+_CPU_HARD_LIMIT_GRACE = 5
+
+
+def limits_from_env(memory_mb: Optional[int] = None, cpu_seconds: Optional[int] = None,
+                    cgroup: Optional[str] = None):
+    """
+    补全未指定的限制
+
+    Returns:
+        (memory_mb, cpu_seconds, cgroup)，0和空字符串表示不限制
+    """
+    if memory_mb is None:
+        memory_mb = int(os.getenv("IPYTHON_KERNEL_MEMORY_MB", DEFAULT_MEMORY_MB))
+    if cpu_seconds is None:
+        cpu_seconds = int(os.getenv("IPYTHON_KERNEL_CPU_SECONDS", DEFAULT_CPU_SECONDS))
+    if cgroup is None:
+        cgroup = os.getenv("IPYTHON_KERNEL_CGROUP", "")
+    return memory_mb, cpu_seconds, cgroup
+
+
+def wrap_kernel_command(argv: List[str], memory_mb: int = 0, cpu_seconds: int = 0,
+                        cgroup: str = "") -> List[str]:
+    """
+    在kernel命令前加上本包装
+
+    Args:
+        argv: kernelspec中的启动命令
+        memory_mb: 地址空间上限（MB）
+        cpu_seconds: CPU时间上限（秒）
+        cgroup: 要加入的cgroup目录
+
+    Returns:
+        新的启动命令；没有任何限制时原样返回
+    """
+    if not (memory_mb or cpu_seconds or cgroup):
+        return list(argv)
+    command = [sys.executable, os.path.abspath(__file__)]
+    if memory_mb:
+        command += ["--memory-mb", str(memory_mb)]
+    if cpu_seconds:
+        command += ["--cpu-seconds", str(cpu_seconds)]
+    if cgroup:
+        command += ["--cgroup", cgroup]
+    return command + ["--"] + list(argv)
+
+
+def apply_limits(km, memory_mb: Optional[int] = None, cpu_seconds: Optional[int] = None,
+                 cgroup: Optional[str] = None):
+    """
+    让KernelManager通过本包装启动kernel（需在 start_kernel 之前调用）
+
+    Args:
+        km: KernelManager
+        memory_mb: 地址空间上限（MB），None表示使用环境变量
+        cpu_seconds: CPU时间上限（秒），None表示使用环境变量
+        cgroup: 要加入的cgroup目录，None表示使用环境变量
+    """
+    memory_mb, cpu_seconds, cgroup = limits_from_env(memory_mb, cpu_seconds, cgroup)
+    if memory_mb or cpu_seconds or cgroup:
+        km.kernel_spec.argv = wrap_kernel_command(km.kernel_spec.argv, memory_mb, cpu_seconds, cgroup)
+
+
+def describe_exit(returncode: Optional[int], memory_mb: int = 0) -> str:
+    """
+    根据kernel进程的退出码判断退出原因
+
+    Returns:
+        cpu（超出CPU时间）、memory（被SIGKILL且设置了内存限制，通常是OOM）或 died
+    """
+    if returncode is None:
+        return "died"
+    sigxcpu = getattr(signal, "SIGXCPU", None)
+    if sigxcpu is not None and returncode == -sigxcpu:
+        return "cpu"
+    if returncode == -getattr(signal, "SIGKILL", 9):
+        return "memory" if memory_mb else "died"
+    return "died"
+
+
+def _set_limits(memory_mb: int, cpu_seconds: int, cgroup: str):
+    if cgroup:
+        with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+            f.write(str(os.getpid()))
+    if not (memory_mb or cpu_seconds):
+        return
+    if resource is None:
+        print("警告：当前平台不支持resource模块，kernel不限制内存和CPU", file=sys.stderr)
+        return
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + _CPU_HARD_LIMIT_GRACE))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="设置资源限制后启动kernel")
+    parser.add_argument("--memory-mb", type=int, default=0, help="地址空间上限（MB）")
+    parser.add_argument("--cpu-seconds", type=int, default=0, help="CPU时间上限（秒）")
+    parser.add_argument("--cgroup", default="", help="要加入的cgroup v2目录")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="kernel启动命令（放在 -- 之后）")
+    args = parser.parse_args(argv)
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("缺少kernel启动命令")
+    _set_limits(args.memory_mb, args.cpu_seconds, args.cgroup)
+    os.execvp(command[0], command)
+
+
+if __name__ == "__main__":
+    main()
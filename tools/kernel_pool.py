@@ -0,0 +1,250 @@
+"""
+Kernel池
+预先启动若干个已导入常用库（pandas、numpy、matplotlib）的kernel，
+通过 wait_for_ready 确认就绪，新会话可以立即取走一个kernel执行第一个cell，
+被取走的kernel在后台补充
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from jupyter_client import KernelManager
+from tools.kernel_launcher import apply_limits, limits_from_env
+from tools.output_budget import FRAME_SUMMARY_SETUP
+
+
+# 每个kernel名称默认预启动的kernel数，可通过环境变量 IPYTHON_KERNEL_POOL_SIZE 覆盖，0表示不预启动
+DEFAULT_POOL_SIZE = 2
+
+# 等待kernel就绪（包括执行预热代码）的超时时间（秒）
+DEFAULT_READY_TIMEOUT = 60.0
+
+# 预热代码：导入常用库，缺少的库跳过；注册DataFrame摘要格式化器，供工具压缩输出时使用
+DEFAULT_WARMUP_CODE = """
+import pandas as pd
+import numpy as np
+try:
+    import matplotlib.pyplot as plt
+except ImportError:
+    pass
+""" + FRAME_SUMMARY_SETUP
+
+KernelHandle = Tuple[KernelManager, object]
+
+
+def start_warm_kernel(kernel_name: str = "python3", warmup_code: str = DEFAULT_WARMUP_CODE,
+                      timeout: float = DEFAULT_READY_TIMEOUT, memory_mb: int = 0, cpu_seconds: int = 0,
+                      cgroup: str = "") -> KernelHandle:
+    """
+    启动kernel，等待就绪并执行预热代码
+
+    预热代码以silent方式执行，不占用执行计数，输出也会被读掉，不会混入之后的cell。
+
+    Args:
+        kernel_name: Kernel名称
+        warmup_code: 预热代码，为空时跳过
+        timeout: 等待就绪和预热完成的超时时间（秒）
+        memory_mb: kernel的内存上限（MB），0表示不限制
+        cpu_seconds: kernel的CPU时间上限（秒），0表示不限制
+        cgroup: kernel加入的cgroup目录，空表示不加入
+
+    Returns:
+        (KernelManager, KernelClient)
+    """
+    km = KernelManager(kernel_name=kernel_name)
+    apply_limits(km, memory_mb, cpu_seconds, cgroup)
+    km.start_kernel()
+    kc = km.client()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=timeout)
+        if warmup_code.strip():
+            # 预热失败（例如缺少某个库）不影响kernel使用
+            run_silent(kc, warmup_code, timeout)
+    except Exception:
+        kc.stop_channels()
+        km.shutdown_kernel(now=True)
+        raise
+    return km, kc
+
+
+def run_silent(kc, code: str, timeout: float = DEFAULT_READY_TIMEOUT) -> Dict[str, Any]:
+    """
+    静默执行代码（不占用执行计数、不产生execute_result），直到kernel回到idle，
+    期间的输出都会被读掉，不会混入之后的cell
+
+    Args:
+        kc: KernelClient
+        code: 要执行的代码
+        timeout: 超时时间（秒）
+
+    Returns:
+        execute_reply的content，status为error时包含ename/evalue
+    """
+    msg_id = kc.execute(code, silent=True, store_history=False)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"静默执行超时（超过{timeout}秒）")
+        try:
+            msg = kc.get_iopub_msg(timeout=remaining)
+        except queue.Empty:
+            continue
+        if msg['parent_header'].get('msg_id') == msg_id and msg['msg_type'] == 'status' \
+                and msg['content']['execution_state'] == 'idle':
+            break
+    # 取走对应的execute_reply
+    while True:
+        try:
+            reply = kc.get_shell_msg(timeout=max(deadline - time.monotonic(), 0.1))
+        except queue.Empty:
+            return {"status": "unknown"}
+        if reply['parent_header'].get('msg_id') == msg_id:
+            return reply['content']
+
+
+class KernelPool:
+    """预启动kernel的池，取用为O(1)，后台线程把池补充到指定大小"""
+
+    def __init__(self, kernel_name: str = "python3", size: Optional[int] = None,
+                 warmup_code: str = DEFAULT_WARMUP_CODE, ready_timeout: float = DEFAULT_READY_TIMEOUT,
+                 memory_mb: Optional[int] = None, cpu_seconds: Optional[int] = None,
+                 cgroup: Optional[str] = None):
+        """
+        初始化kernel池
+
+        Args:
+            kernel_name: Kernel名称
+            size: 预启动的kernel数，0表示不预启动（每次取用时直接启动）
+            warmup_code: 每个kernel启动后执行的预热代码
+            ready_timeout: 等待kernel就绪的超时时间（秒）
+            memory_mb: 每个kernel的内存上限（MB），None表示读取环境变量 IPYTHON_KERNEL_MEMORY_MB
+            cpu_seconds: 每个kernel的CPU时间上限（秒），None表示读取环境变量 IPYTHON_KERNEL_CPU_SECONDS
+            cgroup: kernel加入的cgroup目录，None表示读取环境变量 IPYTHON_KERNEL_CGROUP
+        """
+        self.kernel_name = kernel_name
+        self.size = size if size is not None else int(os.getenv("IPYTHON_KERNEL_POOL_SIZE", DEFAULT_POOL_SIZE))
+        self.warmup_code = warmup_code
+        self.ready_timeout = ready_timeout
+        self.memory_mb, self.cpu_seconds, self.cgroup = limits_from_env(memory_mb, cpu_seconds, cgroup)
+        self._ready: Deque[KernelHandle] = deque()
+        self._cond = threading.Condition()
+        self._filling = False
+        self._waiting = False
+        self._closed = False
+
+    def start(self):
+        """在后台把池填满"""
+        self._ensure_filling()
+
+    def acquire(self) -> KernelHandle:
+        """
+        取出一个就绪的kernel，调用方负责关闭
+
+        池中有就绪的kernel时直接返回；后台正在启动kernel且没有其他线程在等待时等待它就绪；
+        否则在当前线程启动一个（并发取用时各自启动，不排队等待后台逐个启动）。取用后后台补充。
+
+        Returns:
+            (KernelManager, KernelClient)
+        """
+        handle = None
+        with self._cond:
+            while handle is None:
+                if not self._ready and self._filling and not self._waiting:
+                    self._waiting = True
+                    try:
+                        self._cond.wait_for(lambda: self._ready or not self._filling, timeout=self.ready_timeout)
+                    finally:
+                        self._waiting = False
+                if not self._ready:
+                    break
+                handle = self._ready.popleft()
+                if not handle[0].is_alive():
+                    # 池中的kernel意外退出，丢弃
+                    _shutdown(handle)
+                    handle = None
+        if handle is None:
+            handle = self._start_kernel()
+        self._ensure_filling()
+        return handle
+
+    def available(self) -> int:
+        """当前就绪的kernel数"""
+        with self._cond:
+            return len(self._ready)
+
+    def shutdown(self):
+        """关闭池中所有空闲的kernel，之后不再补充"""
+        with self._cond:
+            self._closed = True
+            handles = list(self._ready)
+            self._ready.clear()
+            self._cond.notify_all()
+        for handle in handles:
+            _shutdown(handle)
+
+    def _start_kernel(self) -> KernelHandle:
+        return start_warm_kernel(self.kernel_name, self.warmup_code, self.ready_timeout,
+                                 self.memory_mb, self.cpu_seconds, self.cgroup)
+
+    def _ensure_filling(self):
+        with self._cond:
+            if self._filling or self._closed or len(self._ready) >= self.size:
+                return
+            self._filling = True
+        threading.Thread(target=self._fill, daemon=True).start()
+
+    def _fill(self):
+        try:
+            while True:
+                with self._cond:
+                    if self._closed or len(self._ready) >= self.size:
+                        return
+                try:
+                    handle = self._start_kernel()
+                except Exception as e:
+                    print(f"警告：预启动kernel失败: {e}")
+                    return
+                with self._cond:
+                    if self._closed:
+                        _shutdown(handle)
+                        return
+                    self._ready.append(handle)
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._filling = False
+                self._cond.notify_all()
+
+
+def _shutdown(handle: KernelHandle):
+    km, kc = handle
+    try:
+        kc.stop_channels()
+        km.shutdown_kernel(now=True)
+    except Exception as e:
+        print(f"警告：关闭kernel失败: {e}")
+
+
+_shared_pools: Dict[str, KernelPool] = {}
+_shared_pools_lock = threading.Lock()
+
+
+def get_kernel_pool(kernel_name: str = "python3") -> KernelPool:
+    """获取进程内共享的kernel池（每个kernel名称一个）"""
+    with _shared_pools_lock:
+        if kernel_name not in _shared_pools:
+            _shared_pools[kernel_name] = KernelPool(kernel_name)
+        return _shared_pools[kernel_name]
+
+
+@atexit.register
+def _shutdown_shared_pools():
+    with _shared_pools_lock:
+        pools = list(_shared_pools.values())
+    for pool in pools:
+        pool.shutdown()
@@ -0,0 +1,289 @@
+"""
+Kernel消息路由
+按 parent_header.msg_id 把iopub消息和shell回复分发给对应的执行，
+一次执行在收到idle状态和execute_reply后才算完成。
+同步路由等待时用zmq poll同时阻塞在iopub和shell两个socket上，有消息立即处理，不轮询、不sleep；
+异步路由（AsyncMessageRouter）在事件循环中等待异步客户端的消息，分发方式相同；
+不属于任何进行中执行的消息（例如超时或中断的cell之后到达的输出）直接丢弃，不会混入其他cell。
+"""
+import asyncio
+import queue
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+import zmq
+
+
+# 等待期间检查kernel是否存活的间隔（秒），只在没有消息时生效，不增加正常执行的延迟
+LIVENESS_INTERVAL = 1.0
+
+
+class KernelDiedError(RuntimeError):
+    """等待执行结果时kernel进程已退出（例如被OOM killer杀死）"""
+
+
+def output_from_message(msg: Dict[str, Any], execution_count: Optional[int]) -> Optional[Dict[str, Any]]:
+    """
+    把iopub消息转为notebook的输出
+
+    Args:
+        msg: iopub消息
+        execution_count: 所属cell的执行计数
+
+    Returns:
+        notebook格式的输出（error消息转为error输出），其他类型的消息返回None
+    """
+    msg_type = msg['msg_type']
+    content = msg['content']
+    if msg_type == 'execute_result':
+        return {
+            "output_type": "execute_result",
+            "execution_count": execution_count,
+            "data": content['data'],
+            "metadata": content['metadata']
+        }
+    if msg_type == 'display_data':
+        return {
+            "output_type": "display_data",
+            "data": content['data'],
+            "metadata": content['metadata']
+        }
+    if msg_type == 'stream':
+        return {
+            "output_type": "stream",
+            "name": content['name'],
+            "text": content['text']
+        }
+    if msg_type == 'error':
+        return {
+            "output_type": "error",
+            "ename": content['ename'],
+            "evalue": content['evalue'],
+            "traceback": content['traceback']
+        }
+    return None
+
+
+class Execution:
+    """一次execute_request的状态，收到idle状态和execute_reply后完成"""
+
+    def __init__(self, msg_id: str, execution_count: Optional[int] = None,
+                 on_output: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Args:
+            msg_id: execute_request的msg_id
+            execution_count: 所属cell的执行计数，写入execute_result输出
+            on_output: 每收到一个输出时调用
+        """
+        self.msg_id = msg_id
+        self.execution_count = execution_count
+        self.on_output = on_output
+        self.outputs: List[Dict[str, Any]] = []
+        self.error: Optional[Dict[str, Any]] = None
+        self.reply: Optional[Dict[str, Any]] = None
+        self.idle = False
+
+    @property
+    def done(self) -> bool:
+        return self.idle and self.reply is not None
+
+    def handle_iopub(self, msg: Dict[str, Any]):
+        """处理一条属于本次执行的iopub消息"""
+        if msg['msg_type'] == 'status':
+            if msg['content']['execution_state'] == 'idle':
+                self.idle = True
+            return
+        output = output_from_message(msg, self.execution_count)
+        if output is None:
+            return
+        if output['output_type'] == 'error':
+            self.error = output
+        self._add_output(output)
+
+    def handle_reply(self, msg: Dict[str, Any]):
+        """处理本次执行的execute_reply"""
+        self.reply = msg['content']
+        if self.reply.get('status') == 'error' and self.error is None:
+            # 没有收到error消息（例如kernel只在回复中报告错误）时用回复中的信息
+            self.error = {
+                "output_type": "error",
+                "ename": self.reply.get('ename', 'Unknown'),
+                "evalue": self.reply.get('evalue', 'Unknown error'),
+                "traceback": self.reply.get('traceback', [])
+            }
+            self._add_output(self.error)
+
+    def _add_output(self, output: Dict[str, Any]):
+        self.outputs.append(output)
+        if self.on_output is not None:
+            self.on_output(output)
+
+
+class _Router:
+    """按msg_id登记执行并分发消息，同步和异步路由共用"""
+
+    def __init__(self, kc, is_alive: Optional[Callable[[], bool]] = None):
+        self.kc = kc
+        self.is_alive = is_alive
+        self._pending: Dict[str, Execution] = {}
+
+    def execute(self, code: str, execution_count: Optional[int] = None, silent: bool = False,
+                store_history: bool = True,
+                on_output: Optional[Callable[[Dict[str, Any]], None]] = None,
+                user_expressions: Optional[Dict[str, str]] = None) -> Execution:
+        """发送execute_request并登记执行，之后用 wait 等待完成；user_expressions 的结果在 reply 中"""
+        msg_id = self.kc.execute(code, silent=silent, store_history=store_history,
+                                 user_expressions=user_expressions)
+        execution = Execution(msg_id, execution_count, on_output)
+        self._pending[msg_id] = execution
+        return execution
+
+    def discard(self, execution: Execution):
+        """放弃等待一个执行，之后到达的消息会被丢弃"""
+        self._pending.pop(execution.msg_id, None)
+
+    def _dispatch(self, msg: Dict[str, Any], shell: bool):
+        execution = self._pending.get(msg['parent_header'].get('msg_id'))
+        if execution is None:
+            return
+        if shell:
+            if msg['msg_type'] == 'execute_reply':
+                execution.handle_reply(msg)
+        else:
+            execution.handle_iopub(msg)
+
+    def _remaining(self, deadline: Optional[float], timeout: Optional[float]) -> Optional[float]:
+        """本次等待的时长：有 is_alive 时不超过 LIVENESS_INTERVAL，已到截止时间时抛出TimeoutError"""
+        wait = LIVENESS_INTERVAL if self.is_alive is not None else None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"执行超时（超过{timeout}秒）")
+            wait = remaining if wait is None else min(wait, remaining)
+        return wait
+
+    def _check_alive(self, execution: Execution):
+        """没有收到消息时检查kernel是否存活"""
+        if self.is_alive is not None and not self.is_alive():
+            self._pending.pop(execution.msg_id, None)
+            raise KernelDiedError("kernel已退出")
+
+
+class MessageRouter(_Router):
+    """阻塞KernelClient的消息路由，由等待执行结果的线程驱动（调用方负责串行化）"""
+
+    def __init__(self, kc, is_alive: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            kc: BlockingKernelClient，通道已启动
+            is_alive: 检查kernel是否存活的函数（例如 KernelManager.is_alive）
+        """
+        super().__init__(kc, is_alive)
+        self._poller = zmq.Poller()
+        self._poller.register(kc.iopub_channel.socket, zmq.POLLIN)
+        self._poller.register(kc.shell_channel.socket, zmq.POLLIN)
+
+    def wait(self, execution: Execution, timeout: Optional[float] = None) -> Execution:
+        """
+        分发消息直到执行完成
+
+        Args:
+            execution: execute 返回的执行
+            timeout: 超时时间（秒），None表示一直等待
+
+        Returns:
+            完成的执行
+
+        Raises:
+            TimeoutError: 超时（执行保持登记，之后仍可继续等待或丢弃）
+            KernelDiedError: kernel已退出
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not execution.done:
+            self._pump(execution, deadline, timeout)
+        self._pending.pop(execution.msg_id, None)
+        return execution
+
+    def stream(self, execution: Execution, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        分发消息直到执行完成，每收到一个输出就yield出来
+
+        参数和异常同 wait；提前停止迭代时执行仍保持登记，可以继续 wait 或 discard。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        sent = 0
+        while True:
+            while sent < len(execution.outputs):
+                yield execution.outputs[sent]
+                sent += 1
+            if execution.done:
+                break
+            self._pump(execution, deadline, timeout)
+        self._pending.pop(execution.msg_id, None)
+
+    def run(self, code: str, timeout: Optional[float] = None, **kwargs) -> Execution:
+        """执行代码并等待完成，参数同 execute"""
+        return self.wait(self.execute(code, **kwargs), timeout)
+
+    def _pump(self, execution: Execution, deadline: Optional[float], timeout: Optional[float]):
+        """等待一次socket事件并分发收到的消息"""
+        wait = self._remaining(deadline, timeout)
+        events = dict(self._poller.poll(None if wait is None else int(wait * 1000)))
+        if not events:
+            self._check_alive(execution)
+            return
+        if self.kc.iopub_channel.socket in events:
+            self._drain(self.kc.iopub_channel, shell=False)
+        if self.kc.shell_channel.socket in events:
+            self._drain(self.kc.shell_channel, shell=True)
+
+    def _drain(self, channel, shell: bool):
+        while True:
+            try:
+                msg = channel.get_msg(timeout=0)
+            except queue.Empty:
+                return
+            self._dispatch(msg, shell)
+
+
+class AsyncMessageRouter(_Router):
+    """
+    异步KernelClient的消息路由，接口与 MessageRouter 相同，wait 和 run 为协程；
+    等待期间不占用线程，同一路由上的执行由调用方串行化
+    """
+
+    def __init__(self, kc, is_alive: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            kc: AsyncKernelClient，通道已启动
+            is_alive: 检查kernel是否存活的函数（例如 KernelManager.is_alive）
+        """
+        super().__init__(kc, is_alive)
+
+    async def wait(self, execution: Execution, timeout: Optional[float] = None) -> Execution:
+        """分发消息直到执行完成，参数、返回值和异常同 MessageRouter.wait"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # kernel先发出idle状态再发送execute_reply，依次读取两个通道
+        while not execution.idle:
+            msg = await self._receive(self.kc.get_iopub_msg, execution, deadline, timeout)
+            if msg is not None:
+                self._dispatch(msg, shell=False)
+        while execution.reply is None:
+            msg = await self._receive(self.kc.get_shell_msg, execution, deadline, timeout)
+            if msg is not None:
+                self._dispatch(msg, shell=True)
+        self._pending.pop(execution.msg_id, None)
+        return execution
+
+    async def run(self, code: str, timeout: Optional[float] = None, **kwargs) -> Execution:
+        """执行代码并等待完成，参数同 execute"""
+        return await self.wait(self.execute(code, **kwargs), timeout)
+
+    async def _receive(self, receive: Callable[[], Awaitable[Dict[str, Any]]], execution: Execution,
+                       deadline: Optional[float], timeout: Optional[float]) -> Optional[Dict[str, Any]]:
+        """等待一条消息，等待超过 LIVENESS_INTERVAL 时检查kernel是否存活并返回None"""
+        wait = self._remaining(deadline, timeout)
+        try:
+            return await asyncio.wait_for(receive(), wait)
+        except asyncio.TimeoutError:
+            self._check_alive(execution)
+            return None
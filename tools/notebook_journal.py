@@ -0,0 +1,275 @@
+"""
+Notebook追加式日志
+每个cell以一行JSON追加到 <notebook>.journal.jsonl，单个cell的持久化开销与notebook长度无关；
+.ipynb 由压缩（compaction）在后台或关闭时整体重写，写入后删除已包含在其中的日志。
+进程崩溃后打开notebook时重放日志，恢复最后一次压缩之后的cell。
+
+每条记录带递增的序号，.ipynb 的元数据 journal_seq 记录已写入的最大序号，
+重放时跳过不大于它的记录，压缩中途崩溃也不会重复添加cell。
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+# fsync策略：
+# - always：每条记录都fsync，断电也不丢失
+# - interval：距上次fsync超过间隔时才fsync（默认），进程崩溃不丢失，断电可能丢失最后一次fsync之后的记录
+# - never：只写入操作系统缓冲区，由操作系统决定何时落盘
+FSYNC_POLICIES = ("always", "interval", "never")
+
+# 默认fsync策略，可通过环境变量 IPYTHON_JOURNAL_FSYNC 覆盖
+DEFAULT_FSYNC_POLICY = "interval"
+
+# interval策略的fsync间隔（秒），可通过环境变量 IPYTHON_JOURNAL_FSYNC_INTERVAL 覆盖
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+# 未压缩的记录数或字节数达到阈值时在后台压缩，可通过环境变量
+# IPYTHON_JOURNAL_COMPACT_RECORDS / IPYTHON_JOURNAL_COMPACT_BYTES 覆盖，0表示只在关闭时压缩
+DEFAULT_COMPACT_RECORDS = 200
+DEFAULT_COMPACT_BYTES = 32 * 1024 * 1024
+
+# .ipynb 元数据中记录已写入的最大序号的键
+SEQ_METADATA_KEY = "journal_seq"
+
+
+class NotebookJournal:
+    """一个notebook文件的追加式日志"""
+
+    def __init__(self, notebook_path: str, fsync: Optional[str] = None,
+                 fsync_interval: Optional[float] = None,
+                 compact_records: Optional[int] = None, compact_bytes: Optional[int] = None):
+        """
+        初始化日志
+
+        Args:
+            notebook_path: notebook文件路径，日志写在同一目录下
+            fsync: fsync策略（always / interval / never）
+            fsync_interval: interval策略的fsync间隔（秒）
+            compact_records: 触发后台压缩的记录数，0表示不按记录数触发
+            compact_bytes: 触发后台压缩的日志字节数，0表示不按字节数触发
+        """
+        self.notebook_path = Path(notebook_path)
+        self.path = self.notebook_path.with_name(self.notebook_path.name + ".journal.jsonl")
+        self.fsync = (fsync or os.getenv("IPYTHON_JOURNAL_FSYNC", DEFAULT_FSYNC_POLICY)).lower()
+        if self.fsync not in FSYNC_POLICIES:
+            raise ValueError(f"不支持的fsync策略: {self.fsync}，可选: {', '.join(FSYNC_POLICIES)}")
+        self.fsync_interval = fsync_interval if fsync_interval is not None else \
+            float(os.getenv("IPYTHON_JOURNAL_FSYNC_INTERVAL", DEFAULT_FSYNC_INTERVAL))
+        self.compact_records = compact_records if compact_records is not None else \
+            int(os.getenv("IPYTHON_JOURNAL_COMPACT_RECORDS", DEFAULT_COMPACT_RECORDS))
+        self.compact_bytes = compact_bytes if compact_bytes is not None else \
+            int(os.getenv("IPYTHON_JOURNAL_COMPACT_BYTES", DEFAULT_COMPACT_BYTES))
+
+        self.seq = 0
+        # 尚未写入 .ipynb 的记录数和字节数
+        self.pending = 0
+        self._pending_bytes = 0
+        self._file = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+
+    def load(self, default: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        读取notebook并重放日志
+
+        Args:
+            default: notebook文件不存在时创建空notebook的函数
+
+        Returns:
+            notebook数据，包含最后一次压缩之后追加的cell
+        """
+        if self.notebook_path.exists():
+            with open(self.notebook_path, 'r', encoding='utf-8') as f:
+                notebook_data = json.load(f)
+        else:
+            notebook_data = default()
+
+        applied = notebook_data.get('metadata', {}).get(SEQ_METADATA_KEY, 0)
+        records = sorted(self._read_records(), key=lambda r: r["seq"])
+        replayed = 0
+        with self._lock:
+            self.seq = applied
+            for record in records:
+                if record["seq"] <= self.seq:
+                    continue
+                _apply(notebook_data, record)
+                self.seq = record["seq"]
+                replayed += 1
+            self.pending = replayed
+        if replayed:
+            print(f"从日志恢复了 {replayed} 条未写入notebook的记录: {self.notebook_path}")
+        return notebook_data
+
+    def append(self, op: str, **fields):
+        """
+        追加一条记录
+
+        Args:
+            op: 记录类型，目前支持 cell（fields中的cell追加到notebook末尾）
+            **fields: 记录内容，必须可以JSON序列化
+        """
+        with self._lock:
+            if self._file is None:
+                self._file = self._open()
+            self.seq += 1
+            line = json.dumps(dict(fields, seq=self.seq, op=op), ensure_ascii=False) + "\n"
+            self._file.write(line)
+            self._file.flush()
+            self.pending += 1
+            self._pending_bytes += len(line)
+            self._sync()
+
+    def needs_compaction(self) -> bool:
+        """未压缩的记录是否达到了后台压缩的阈值"""
+        return (self.compact_records > 0 and self.pending >= self.compact_records) or \
+            (self.compact_bytes > 0 and self._pending_bytes >= self.compact_bytes)
+
+    def compact(self, notebook_data: Dict[str, Any], background: bool = False):
+        """
+        把notebook整体写入 .ipynb，然后删除已写入的日志
+
+        调用线程中只在锁内复制cell列表和元数据（调用方应持有保护notebook_data的锁），
+        序列化和写文件可以放到后台线程，不阻塞调用方（例如异步执行器的事件循环），
+        期间新的记录写入新的日志文件。
+
+        Args:
+            notebook_data: 完整的notebook数据（会写入 journal_seq 元数据）
+            background: 是否在后台线程序列化和写文件
+        """
+        previous = self._compaction
+        if not background:
+            self.wait()
+        with self._lock:
+            notebook_data.setdefault('metadata', {})[SEQ_METADATA_KEY] = self.seq
+            snapshot = _snapshot(notebook_data)
+            seq = self.seq
+            self._rotate()
+            self.pending = 0
+            self._pending_bytes = 0
+        if background:
+            # 上一次后台压缩完成后再写，较新的快照总是最后写入
+            self._compaction = threading.Thread(target=self._write_after, args=(previous, snapshot, seq),
+                                                daemon=True)
+            self._compaction.start()
+        else:
+            self._write_notebook(snapshot, seq)
+
+    def wait(self):
+        """等待后台压缩完成"""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+            self._compaction = None
+
+    def close(self):
+        """等待后台压缩完成并关闭日志文件"""
+        self.wait()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open(self):
+        torn = False
+        if self.path.exists() and self.path.stat().st_size > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        f = open(self.path, 'a', encoding='utf-8')
+        if torn:
+            # 崩溃时最后一行可能只写了一半，另起一行，避免和新记录连在一起
+            f.write("\n")
+        return f
+
+    def _sync(self):
+        if self.fsync == "never":
+            return
+        now = time.monotonic()
+        if self.fsync == "always" or now - self._last_sync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+
+    def _rotate(self):
+        """把本实例正在写的日志改名为 <notebook>.journal.<序号>.jsonl，之后的记录写入新文件"""
+        if self._file is None:
+            # 没有写过日志（例如只读打开后清空notebook），不改动其他实例可能正在写的日志
+            return
+        self._file.close()
+        self._file = None
+        if self.path.exists():
+            os.replace(self.path, self.path.with_name(f"{self.notebook_path.name}.journal.{self.seq}.jsonl"))
+
+    def _write_after(self, previous: Optional[threading.Thread], notebook_data: Dict[str, Any], seq: int):
+        if previous is not None:
+            previous.join()
+        self._write_notebook(notebook_data, seq)
+
+    def _write_notebook(self, notebook_data: Dict[str, Any], seq: int):
+        tmp = self.notebook_path.with_name(f".{self.notebook_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            text = json.dumps(notebook_data, indent=2, ensure_ascii=False)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                if self.fsync != "never":
+                    os.fsync(f.fileno())
+            os.replace(tmp, self.notebook_path)
+        except Exception as e:
+            # 日志仍然保留，下次压缩或重放时不会丢失cell
+            print(f"警告：写入notebook失败: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+        for path in self._journal_files():
+            rotated_seq = _rotated_seq(path, self.notebook_path.name)
+            if rotated_seq is not None and rotated_seq <= seq:
+                path.unlink(missing_ok=True)
+
+    def _journal_files(self) -> List[Path]:
+        prefix = f"{self.notebook_path.name}.journal."
+        directory = self.notebook_path.parent
+        if not directory.exists():
+            return []
+        return [p for p in directory.iterdir() if p.name.startswith(prefix) and p.name.endswith(".jsonl")]
+
+    def _read_records(self) -> List[Dict[str, Any]]:
+        records = []
+        for path in self._journal_files():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # 崩溃时写了一半的最后一行
+                        print(f"警告：跳过日志中无法解析的记录: {path}")
+        return records
+
+
+def _rotated_seq(path: Path, notebook_name: str) -> Optional[int]:
+    """改名后的日志文件中最大的序号，正在写的日志返回None"""
+    middle = path.name[len(f"{notebook_name}.journal."):-len(".jsonl")]
+    return int(middle) if middle.isdigit() else None
+
+
+def _snapshot(notebook_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    压缩用的notebook快照：复制cell列表、元数据及其中的列表（如检查点记录），
+    之后追加的cell和元数据不影响后台序列化；已追加的cell本身不再修改，不需要深拷贝
+    """
+    snapshot = dict(notebook_data)
+    snapshot['cells'] = list(notebook_data.get('cells', []))
+    snapshot['metadata'] = {key: list(value) if isinstance(value, list) else value
+                            for key, value in notebook_data.get('metadata', {}).items()}
+    return snapshot
+
+
+def _apply(notebook_data: Dict[str, Any], record: Dict[str, Any]):
+    if record["op"] == "cell":
+        notebook_data['cells'].append(record["cell"])
+    else:
+        print(f"警告：跳过未知类型的日志记录: {record['op']}")
@@ -0,0 +1,239 @@
+"""
+工具输出预算
+把cell的输出整理为返回给Agent的文本，并限制在token预算内：
+- 超出预算时保留开头和结尾，中间省略，标注省略的行号范围；完整输出仍在notebook中，可按执行计数分页读取
+- 大的DataFrame/Series用摘要（形状、列类型、首尾几行）代替完整的文本表示，摘要由kernel中注册的格式化器生成；
+  完整的文本表示存入blob，摘要中给出引用，可通过 ipython_notebook 的 output 操作读取
+- 去掉traceback中的ANSI颜色代码
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 工具单次输出的token预算，可通过环境变量 IPYTHON_TOOL_OUTPUT_TOKENS 配置，0表示不限制
+DEFAULT_OUTPUT_TOKENS = 2000
+
+# 估算token数时每个token对应的UTF-8字节数
+BYTES_PER_TOKEN = 4
+
+# 超出预算时开头部分占预算的比例，其余留给结尾
+HEAD_SHARE = 0.6
+
+# DataFrame摘要的mimetype，kernel中的格式化器为DataFrame和Series生成该表示
+FRAME_SUMMARY_MIME = "application/vnd.data-analyzer.frame-summary+json"
+
+# 摘要中保留的首尾行数和列类型数
+FRAME_SUMMARY_ROWS = 5
+FRAME_SUMMARY_MAX_COLUMNS = 50
+
+# 在kernel中注册DataFrame摘要格式化器的代码，随kernel池的预热代码执行
+FRAME_SUMMARY_SETUP = f"""
+def _register_frame_summary():
+    import pandas as pd
+    from IPython import get_ipython
+    from IPython.core.formatters import JSONFormatter
+    from traitlets import Unicode
+
+    class FrameSummaryFormatter(JSONFormatter):
+        format_type = Unicode({FRAME_SUMMARY_MIME!r})
+
+    def summarize(obj):
+        frame = obj.to_frame() if isinstance(obj, pd.Series) else obj
+        rows = {FRAME_SUMMARY_ROWS}
+        dtypes = list(frame.dtypes.items())
+        return {{
+            "kind": type(obj).__name__,
+            "shape": list(obj.shape),
+            "dtypes": [[str(c), str(t)] for c, t in dtypes[:{FRAME_SUMMARY_MAX_COLUMNS}]],
+            "head": frame.head(rows).to_string(max_cols=20),
+            "tail": frame.tail(rows).to_string(max_cols=20) if len(frame) > 2 * rows else "",
+        }}
+
+    display_formatter = get_ipython().display_formatter
+    formatter = FrameSummaryFormatter(parent=display_formatter)
+    display_formatter.formatters[formatter.format_type] = formatter
+    if formatter.format_type not in display_formatter.active_types:
+        display_formatter.active_types.append(formatter.format_type)
+    formatter.for_type(pd.DataFrame, summarize)
+    formatter.for_type(pd.Series, summarize)
+
+try:
+    _register_frame_summary()
+except Exception:
+    pass
+del _register_frame_summary
+"""
+
+_ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+
+
+def output_token_budget() -> int:
+    """获取工具输出的token预算"""
+    return int(os.getenv("IPYTHON_TOOL_OUTPUT_TOKENS", DEFAULT_OUTPUT_TOKENS))
+
+
+def frame_summary_tokens(max_tokens: int) -> Optional[int]:
+    """单个DataFrame的文本超过预算的一半时改用摘要，不限制预算时不使用摘要"""
+    return max_tokens // 2 if max_tokens else None
+
+
+def estimate_tokens(text: str) -> int:
+    """按UTF-8字节数估算token数"""
+    return -(-len(text.encode('utf-8')) // BYTES_PER_TOKEN)
+
+
+def strip_ansi(text: str) -> str:
+    return _ANSI_ESCAPE.sub('', text)
+
+
+def summarize_frame(summary: Dict[str, Any], reference: str = "") -> str:
+    """把kernel生成的DataFrame摘要转为文本，reference为获取完整文本的方式"""
+    shape = summary.get("shape", [])
+    size = f"{shape[0]}行 × {shape[1]}列" if len(shape) == 2 else f"{shape[0]}行" if shape else ""
+    dtypes = summary.get("dtypes", [])
+    columns = shape[1] if len(shape) == 2 else len(dtypes)
+    lines = [f"{summary.get('kind', 'DataFrame')}（{size}）"]
+    if dtypes:
+        more = f", ...（共{columns}列）" if columns > len(dtypes) else ""
+        lines.append("列类型: " + ", ".join(f"{c}: {t}" for c, t in dtypes) + more)
+    if summary.get("tail"):
+        lines += ["前几行:", summary.get("head", ""), "后几行:", summary["tail"]]
+    else:
+        lines.append(summary.get("head", ""))
+    if reference:
+        lines.append(f"（以上为摘要；{reference}）")
+    return "\n".join(lines)
+
+
+def render_outputs(outputs: List[Dict[str, Any]], frame_tokens: Optional[int] = None,
+                   blob_store=None, reference: str = "") -> str:
+    """
+    把cell的输出整理为文本：错误在前，其余输出按顺序，连续的stream输出直接拼接
+
+    Args:
+        outputs: notebook格式的输出
+        frame_tokens: DataFrame的文本表示超过该token数时改用摘要，None表示不使用摘要
+        blob_store: 改用摘要时保存完整文本表示的BlobStore，摘要中给出blob引用
+        reference: 读取完整文本的方式，写入摘要
+
+    Returns:
+        输出文本
+    """
+    errors = []
+    parts = []
+    stream = None
+    for output in outputs:
+        output_type = output.get('output_type')
+        if output_type == 'stream':
+            text = output.get('text', '')
+            if stream is not None:
+                parts[-1] += text
+            else:
+                parts.append(text)
+            stream = output.get('name')
+            continue
+        stream = None
+        if output_type == 'error':
+            errors.append(f"错误: {output['ename']}")
+            errors.append(f"{output['evalue']}")
+            if output.get('traceback'):
+                errors.append(strip_ansi("\n".join(output['traceback'])))
+        elif output_type == 'execute_result':
+            data = output.get('data', {})
+            # 优先显示text/plain格式
+            if 'text/plain' in data:
+                parts.append(_plain_or_summary(data, frame_tokens, blob_store, reference))
+            elif 'text/html' in data:
+                parts.append(data['text/html'])
+            elif 'image/png' in data:
+                parts.append(f"[图像输出 - base64长度: {len(data['image/png'])}]")
+            else:
+                parts.append(str(data))
+        elif output_type == 'display_data':
+            data = output.get('data', {})
+            if 'text/plain' in data:
+                parts.append(_plain_or_summary(data, frame_tokens, blob_store, reference))
+    return "\n".join(errors + parts)
+
+
+def _plain_or_summary(data: Dict[str, Any], frame_tokens: Optional[int], blob_store, reference: str) -> str:
+    text = data['text/plain']
+    if frame_tokens is None or FRAME_SUMMARY_MIME not in data or estimate_tokens(text) <= frame_tokens:
+        return text
+    if blob_store is not None:
+        digest = blob_store.put(text.encode('utf-8'))
+        blob_reference = f"完整文本（约{estimate_tokens(text)}个token）已存入blob {digest}"
+        reference = f"{blob_reference}，{reference}" if reference else blob_reference
+    return summarize_frame(data[FRAME_SUMMARY_MIME], reference)
+
+
+def compact_text(text: str, max_tokens: int, reference: str = "") -> Tuple[str, bool]:
+    """
+    把文本压缩到token预算内：保留开头和结尾的行，中间省略
+
+    Args:
+        text: 原文本
+        max_tokens: token预算，0表示不限制
+        reference: 获取完整输出的方式，写入省略标记
+
+    Returns:
+        (压缩后的文本, 是否省略了内容)
+    """
+    max_bytes = max_tokens * BYTES_PER_TOKEN
+    if not max_tokens or len(text.encode('utf-8')) <= max_bytes:
+        return text, False
+    lines = text.split('\n')
+    head_bytes = int(max_bytes * HEAD_SHARE)
+    head = _take_lines(lines, head_bytes)
+    shown, first = len(head), len(head) + 1
+    if not head:
+        # 第一行本身超出预算时只保留其开头，省略范围从第1行算起
+        head = [_cut_bytes(lines[0], head_bytes) + " …"]
+        shown, first = 1, 1
+    tail = _take_lines(lines[shown:][::-1], max_bytes - head_bytes)[::-1]
+    last = len(lines) - len(tail)
+    omitted = "\n".join(lines[first - 1:last])
+    marker = f"...（省略第{first}-{last}行，约{estimate_tokens(omitted)}个token"
+    marker += f"；{reference}）" if reference else "）"
+    return "\n".join(head + [marker] + tail), True
+
+
+def page_lines(text: str, offset: int = 0, limit: int = 0, max_tokens: int = 0) -> Tuple[str, int, int, int]:
+    """
+    按行读取完整输出的一部分，结果同样受token预算限制
+
+    Args:
+        text: 完整输出
+        offset: 起始行（从0开始）
+        limit: 行数，0表示读到预算用完
+        max_tokens: token预算，0表示不限制
+
+    Returns:
+        (文本, 起始行, 结束行, 总行数)，行范围左闭右开
+    """
+    lines = text.split('\n')
+    start = min(max(offset, 0), len(lines))
+    end = min(start + limit, len(lines)) if limit > 0 else len(lines)
+    if max_tokens:
+        taken = _take_lines(lines[start:end], max_tokens * BYTES_PER_TOKEN)
+        if not taken and start < end:
+            # 单行超出预算时只返回其开头
+            return _cut_bytes(lines[start], max_tokens * BYTES_PER_TOKEN) + " …", start, start + 1, len(lines)
+        end = start + len(taken)
+    return "\n".join(lines[start:end]), start, end, len(lines)
+
+
+def _take_lines(lines: List[str], max_bytes: int) -> List[str]:
+    taken = []
+    used = 0
+    for line in lines:
+        used += len(line.encode('utf-8')) + 1
+        if used > max_bytes:
+            break
+        taken.append(line)
+    return taken
+
+
+def _cut_bytes(text: str, max_bytes: int) -> str:
+    return text.encode('utf-8')[:max_bytes].decode('utf-8', errors='ignore')
@@ -2,18 +2,37 @@
 Pandas数据处理工具
 使用pandas进行数据处理操作
 """
+import os
+import sys
 import pandas as pd
-from typing import Type
+from typing import List, Optional, Tuple, Type
 from langchain.tools import BaseTool
 from langchain.pydantic_v1 import BaseModel, Field
+from tools.dataset_cache import get_dataset_cache
+from tools.column_projection import parse_column_list, query_columns, merge_columns
+from tools import streaming_ops
+from tools.result_renderer import page_bounds, render_page
+from tools.topk import top_k, stream_top_k
+from tools.stats_catalog import describe_from_profile, profile_frame, lookup_profile, store_profile
+from tools.file_probe import profile_file
+from tools.dtype_compaction import format_compaction_report
+from tools.csv_backend import default_backend, resolve_backend, to_numpy_dtypes
+
+
+# topk未指定limit时的默认k
+DEFAULT_TOP_K = 20
 
 
 class PandasInput(BaseModel):
     """Pandas工具输入参数"""
-    operation: str = Field(description="要执行的操作（read_csv, describe, filter, groupby等）")
+    operation: str = Field(description="要执行的操作（read_csv, describe, filter, groupby, sort, topk等）")
     file_path: str = Field(default="", description="CSV文件路径")
-    query: str = Field(default="", description="查询或操作的具体内容")
+    query: str = Field(default="", description="查询或操作的具体内容；sort/topk为'列1[,列2...][,true/false]'，最后的布尔值表示是否升序")
     output_format: str = Field(default="table", description="输出格式：table, csv, json")
+    columns: str = Field(default="", description="只使用这些列（逗号分隔）；groupby时为聚合列，为空时使用全部列")
+    page: int = Field(default=0, description="结果页码（从1开始），0表示使用offset")
+    limit: int = Field(default=0, description="每页行数，0表示默认50行；sort指定limit时只选出前若干行而不全量排序，topk时为k")
+    offset: int = Field(default=0, description="结果起始行")
 
 
 class PandasTool(BaseTool):
@@ -22,69 +41,242 @@ class PandasTool(BaseTool):
     description: str = (
         "使用pandas进行数据处理操作。"
         "支持的操作：read_csv（读取CSV文件）, describe（描述统计）, "
-        "filter（筛选数据）, groupby（分组聚合）, sort（排序）等。"
+        "filter（筛选数据）, groupby（分组聚合）, sort（排序）, topk（按列取前k行）等。"
+        "可通过'columns'参数指定只需要的列，大文件只加载这些列会快很多。"
+        "结果按页返回，可通过'page'/'limit'/'offset'参数翻页，完整结果会写入文件。"
         "输入应该是包含'operation'（操作类型）和相关参数的JSON字符串。"
     )
     args_schema: Type[BaseModel] = PandasInput
+    # 超过该大小（字节）的文件使用分块流式执行，None表示使用环境变量或默认值
+    streaming_threshold: Optional[int] = None
+    # 流式执行时每块的行数
+    chunksize: Optional[int] = None
+    # 完整结果写入的目录
+    result_dir: Optional[str] = None
+    # 单次输出的字节上限，None表示使用环境变量或默认值
+    max_output_bytes: Optional[int] = None
+    # 是否使用类型压缩的加载模式（低基数字符串转category、数值向下转换、解析日期）
+    compact: bool = Field(default_factory=lambda: os.getenv("PANDAS_COMPACT_LOAD", "").lower() in ("1", "true"))
+    # 解析和执行后端：pandas（C解析器，NumPy类型）或 pyarrow（多线程Arrow解析器，Arrow类型）
+    backend: str = Field(default_factory=default_backend)
+
+    def _load(self, file_path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """读取CSV文件，同一文件的重复读取命中进程内共享缓存"""
+        return get_dataset_cache().get(file_path, columns=columns, compact=self.compact,
+                                       backend=resolve_backend(self.backend))
+
+    def _header(self, file_path: str) -> List[str]:
+        """只读取表头获取列名"""
+        return pd.read_csv(file_path, nrows=0).columns.tolist()
+
+    def _use_streaming(self, file_path: str, columns: Optional[List[str]] = None) -> bool:
+        """文件超过阈值且尚未缓存在内存中时使用流式执行"""
+        threshold = self.streaming_threshold
+        if threshold is None:
+            threshold = streaming_ops.streaming_threshold()
+        if os.path.getsize(file_path) <= threshold:
+            return False
+        return not get_dataset_cache().contains(file_path, columns, self.compact, resolve_backend(self.backend))
+
+    def _render(self, title: str, df: pd.DataFrame, page: int, limit: int, offset: int,
+                output_format: str, key: Optional[str] = None) -> str:
+        """
+        分页渲染内存中的结果，输出没有显示全部结果（分页或字节截断）时把完整结果写入文件；
+        key相同的结果（见 _result_key）翻页时复用已写入的文件
+        """
+        start, end = page_bounds(len(df), page, limit, offset)
+        return render_page(title, df.iloc[start:end], len(df), start, output_format,
+                           self.max_output_bytes, full_result=df, result_dir=self.result_dir, result_key=key)
+
+    def _result_key(self, file_path: str, operation: str, *params) -> str:
+        """结果文件的键：源文件身份、操作、参数以及加载模式"""
+        return streaming_ops.result_key(file_path, operation, *params, self.compact, resolve_backend(self.backend))
+
+    def _parse_sort_query(self, query: str, default_ascending: bool) -> Tuple[List[str], bool]:
+        """解析 '列1[,列2...][,true/false]' 形式的排序参数"""
+        parts = parse_column_list(query)
+        ascending = default_ascending
+        if parts and parts[-1].lower() in ('true', 'false'):
+            ascending = parts.pop().lower() == 'true'
+        return parts, ascending
 
-    def _run(self, operation: str, file_path: str = "", query: str = "", output_format: str = "table") -> str:
+    def _select_top(self, file_path: str, by: List[str], k: int, ascending: bool,
+                    selected: List[str]) -> Tuple[int, pd.DataFrame]:
+        """用部分选择取前k行，返回(总行数, 前k行)"""
+        projection = self._projection(file_path, by, selected)
+        if self._use_streaming(file_path, projection):
+            total, result = stream_top_k(file_path, by, k, ascending, projection, self.chunksize)
+        else:
+            df = self._load(file_path, projection)
+            total, result = len(df), top_k(df, by, k, ascending)
+        return total, result[selected] if selected else result
+
+    def _projection(self, file_path: str, used: List[str], selected: List[str]) -> Optional[List[str]]:
+        """
+        计算需要加载的列
+
+        Args:
+            file_path: 文件路径
+            used: 操作本身用到的列
+            selected: 调用方通过columns参数指定输出的列
+
+        Returns:
+            需要加载的列，None表示全部列
+        """
+        if not selected:
+            return None
+        return merge_columns(self._header(file_path), used, selected)
+
+    def _run(self, operation: str, file_path: str = "", query: str = "", output_format: str = "table",
+             columns: str = "", page: int = 0, limit: int = 0, offset: int = 0) -> str:
         """执行pandas操作"""
         try:
+            selected = parse_column_list(columns)
+
             if operation == "read_csv":
                 if not file_path:
                     return "错误：需要提供file_path参数"
-                df = pd.read_csv(file_path)
-                return f"成功读取文件，共 {len(df)} 行, {len(df.columns)} 列\n列名: {', '.join(df.columns.tolist())}"
+                df = self._load(file_path)
+                result = f"成功读取文件，共 {len(df)} 行, {len(df.columns)} 列\n列名: {', '.join(df.columns.tolist())}"
+                if "compaction_report" in df.attrs:
+                    result += f"\n类型压缩:\n{format_compaction_report(df.attrs['compaction_report'])}"
+                return result
             
             elif operation == "describe":
                 if not file_path:
                     return "错误：需要提供file_path参数"
-                df = pd.read_csv(file_path)
-                return f"数据统计信息:\n{df.describe().to_string()}"
+                projection = self._projection(file_path, [], selected)
+                if not get_dataset_cache().contains(file_path, projection, self.compact,
+                                                    resolve_backend(self.backend)):
+                    # 内容未变的文件直接使用统计目录中的结果
+                    profile = lookup_profile(file_path)
+                    if profile is not None:
+                        stats = describe_from_profile(profile, projection)
+                        return f"数据统计信息（来自统计目录）:\n{stats.to_string()}"
+                if self._use_streaming(file_path, projection):
+                    if projection is None:
+                        # 扫描全文件的同时生成完整画像存入统计目录
+                        info = profile_file(file_path)
+                        if info.get("error"):
+                            return f"错误：计算统计信息失败: {info['error']}"
+                        stats = describe_from_profile(info)
+                    else:
+                        stats = streaming_ops.stream_describe(file_path, projection, self.chunksize)
+                    return f"数据统计信息（流式计算，分位数为近似值）:\n{stats.to_string()}"
+                df = self._load(file_path, projection)
+                if projection is None and lookup_profile(file_path) is None:
+                    # 只在目录中还没有画像时计算（KMV哈希需要遍历全部数据）
+                    store_profile(file_path, profile_frame(df))
+                return f"数据统计信息:\n{to_numpy_dtypes(df.describe()).to_string()}"
             
             elif operation == "head":
                 if not file_path:
                     return "错误：需要提供file_path参数"
-                df = pd.read_csv(file_path)
+                projection = self._projection(file_path, [], selected)
                 n = int(query) if query.isdigit() else 5
-                return f"前{n}行数据:\n{df.head(n).to_string()}"
+                if self._use_streaming(file_path, projection):
+                    df = pd.read_csv(file_path, usecols=projection, nrows=n)
+                else:
+                    df = self._load(file_path, projection).head(n)
+                return self._render(f"前{n}行数据", df, page, limit or n, offset, output_format,
+                                    self._result_key(file_path, "head", n, selected))
             
             elif operation == "filter":
                 if not file_path:
                     return "错误：需要提供file_path参数"
-                df = pd.read_csv(file_path)
+                used = query_columns(query, self._header(file_path)) if query and selected else []
+                # 表达式无法解析时加载全部列
+                projection = self._projection(file_path, used, selected) if used is not None else None
+                key = self._result_key(file_path, "filter", query, selected)
+                if self._use_streaming(file_path, projection):
+                    start, end = page_bounds(sys.maxsize, page, limit, offset)
+                    output_path = streaming_ops.result_path(self.result_dir, key=key)
+                    total, preview = streaming_ops.stream_to_result(
+                        output_path, end, lambda path: streaming_ops.stream_filter(
+                            file_path, query, path, projection, selected, self.chunksize, preview_rows=end))
+                    return render_page("筛选结果（流式执行）", preview.iloc[start:end], total, start,
+                                       output_format, self.max_output_bytes, output_path)
+                df = self._load(file_path, projection)
                 if query:
                     # 尝试执行查询
                     filtered_df = df.query(query)
-                    return f"筛选结果（共{len(filtered_df)}行）:\n{filtered_df.to_string()}"
-                return df.to_string()
+                    if selected:
+                        filtered_df = filtered_df[selected]
+                    return self._render("筛选结果", filtered_df, page, limit, offset, output_format, key)
+                return self._render("数据", df, page, limit, offset, output_format, key)
             
             elif operation == "groupby":
                 if not file_path:
                     return "错误：需要提供file_path参数"
-                df = pd.read_csv(file_path)
+                keys = parse_column_list(query)
+                projection = self._projection(file_path, keys, selected)
+                key = self._result_key(file_path, "groupby", keys, selected)
+                if self._use_streaming(file_path, projection):
+                    result = streaming_ops.stream_groupby_mean(file_path, keys, projection, self.chunksize)
+                    return self._render("分组聚合结果（流式计算）", result, page, limit, offset, output_format, key)
+                df = self._load(file_path, projection)
                 # 示例：按指定列分组并计算平均值
-                result = df.groupby(query).mean()
-                return f"分组聚合结果:\n{result.to_string()}"
+                result = df.groupby(keys[0] if len(keys) == 1 else keys).mean()
+                return self._render("分组聚合结果", result, page, limit, offset, output_format, key)
             
             elif operation == "sort":
                 if not file_path:
                     return "错误：需要提供file_path参数"
-                df = pd.read_csv(file_path)
-                parts = query.split(',')
-                column = parts[0].strip()
-                ascending = parts[1].strip().lower() == 'true' if len(parts) > 1 else True
-                sorted_df = df.sort_values(by=column, ascending=ascending)
-                return f"排序结果（按{column}）：\n{sorted_df.to_string()}"
+                by, ascending = self._parse_sort_query(query, default_ascending=True)
+                title = f"排序结果（按{','.join(by)}）"
+                if limit > 0:
+                    # 只需要前几页时用部分选择代替全量排序
+                    start, end = page_bounds(sys.maxsize, page, limit, offset)
+                    total, result = self._select_top(file_path, by, end, ascending, selected)
+                    # 部分选择只计算了前end行，输出不完整时把这些行写入文件
+                    return render_page(title, result.iloc[start:end], total, start,
+                                       output_format, self.max_output_bytes,
+                                       full_result=result, result_dir=self.result_dir,
+                                       result_key=self._result_key(file_path, "sort", by, ascending, selected, end))
+                projection = self._projection(file_path, by, selected)
+                key = self._result_key(file_path, "sort", by, ascending, selected)
+                if self._use_streaming(file_path, projection):
+                    if len(by) > 1:
+                        return "错误：流式排序只支持单列，多列排序请指定limit或使用topk操作"
+                    start, end = page_bounds(sys.maxsize, page, limit, offset)
+                    output_path = streaming_ops.result_path(self.result_dir, key=key)
+                    total, preview = streaming_ops.stream_to_result(
+                        output_path, end, lambda path: streaming_ops.external_sort(
+                            file_path, by[0], ascending, path, projection, selected, self.chunksize,
+                            preview_rows=end))
+                    return render_page(f"排序结果（按{by[0]}，外部排序）", preview.iloc[start:end], total, start,
+                                       output_format, self.max_output_bytes, output_path)
+                df = self._load(file_path, projection)
+                sorted_df = df.sort_values(by=by, ascending=ascending)
+                if selected:
+                    sorted_df = sorted_df[selected]
+                return self._render(title, sorted_df, page, limit, offset, output_format, key)
+            
+            elif operation == "topk":
+                if not file_path:
+                    return "错误：需要提供file_path参数"
+                by, ascending = self._parse_sort_query(query, default_ascending=False)
+                if not by:
+                    return "错误：topk操作需要在query中指定排序列"
+                k = limit if limit > 0 else DEFAULT_TOP_K
+                _, result = self._select_top(file_path, by, k, ascending, selected)
+                order = "升序" if ascending else "降序"
+                return render_page(f"Top {k}（按{','.join(by)}{order}）", result, len(result), 0,
+                                   output_format, self.max_output_bytes,
+                                   full_result=result, result_dir=self.result_dir,
+                                   result_key=self._result_key(file_path, "topk", by, ascending, selected, k))
             
             elif operation == "columns":
                 if not file_path:
                     return "错误：需要提供file_path参数"
-                df = pd.read_csv(file_path)
-                return f"列名列表:\n{', '.join(df.columns.tolist())}"
+                profile = lookup_profile(file_path)
+                if profile is None:
+                    return f"列名列表:\n{', '.join(self._header(file_path))}"
+                dtypes = ', '.join(f"{col}: {dtype}" for col, dtype in profile["dtypes"].items())
+                return f"列名列表:\n{', '.join(profile['columns'])}\n字段类型: {dtypes}"
             
             else:
-                return f"未知操作: {operation}. 支持的操作: read_csv, describe, head, filter, groupby, sort, columns"
+                return f"未知操作: {operation}. 支持的操作: read_csv, describe, head, filter, groupby, sort, topk, columns"
                 
         except Exception as e:
             return f"执行pandas操作时出错: {str(e)}"
@@ -0,0 +1,148 @@
+"""
+结果渲染
+对PandasTool的结果分页并限制输出字节数，完整结果写入文件供调用方获取
+"""
+import os
+import uuid
+from typing import Optional, Tuple
+import pandas as pd
+from tools.streaming_ops import prune_results, result_path, touch_result
+from tools.csv_backend import to_numpy_dtypes
+
+
+# 每页默认行数
+DEFAULT_PAGE_ROWS = 50
+
+# 单次输出的字节上限，可通过环境变量 PANDAS_TOOL_MAX_OUTPUT_BYTES 覆盖
+DEFAULT_MAX_OUTPUT_BYTES = 16 * 1024
+
+TRUNCATION_MARKER = "...（输出已截断）"
+
+
+def max_output_bytes() -> int:
+    """获取输出字节上限"""
+    return int(os.getenv("PANDAS_TOOL_MAX_OUTPUT_BYTES", DEFAULT_MAX_OUTPUT_BYTES))
+
+
+def page_bounds(total_rows: int, page: int = 0, limit: int = 0, offset: int = 0) -> Tuple[int, int]:
+    """
+    计算要显示的行范围
+
+    Args:
+        total_rows: 结果总行数
+        page: 页码（从1开始），大于0时覆盖offset
+        limit: 每页行数，0表示使用默认值
+        offset: 起始行
+
+    Returns:
+        (起始行, 结束行)，左闭右开
+    """
+    limit = limit if limit > 0 else DEFAULT_PAGE_ROWS
+    if page > 0:
+        offset = (page - 1) * limit
+    start = min(max(offset, 0), total_rows)
+    return start, min(start + limit, total_rows)
+
+
+def format_frame(df: pd.DataFrame, output_format: str = "table") -> str:
+    """按输出格式把DataFrame转换为文本"""
+    df = to_numpy_dtypes(df)
+    if output_format == "csv":
+        return df.to_csv()
+    if output_format == "json":
+        return df.to_json(orient="records", force_ascii=False)
+    return df.to_string()
+
+
+def truncate_to_bytes(text: str, max_bytes: int) -> Tuple[str, bool]:
+    """
+    把文本截断到不超过max_bytes字节（UTF-8），尽量在换行处截断
+
+    Returns:
+        (截断后的文本, 是否发生截断)
+    """
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text, False
+    cut = encoded[:max_bytes].decode('utf-8', errors='ignore')
+    newline = cut.rfind('\n')
+    if newline > 0:
+        cut = cut[:newline]
+    return cut, True
+
+
+def write_result(df: pd.DataFrame, result_dir: Optional[str] = None, key: Optional[str] = None) -> str:
+    """
+    把完整结果写入CSV文件并返回路径
+
+    Args:
+        df: 完整结果
+        result_dir: 结果目录
+        key: 结果的键（见 streaming_ops.result_key），同一键的文件已存在时不重复写入
+
+    Returns:
+        结果文件路径
+    """
+    path = result_path(result_dir, key=key)
+    if key is not None and os.path.exists(path):
+        touch_result(path)
+        return path
+    keep_index = df.index.name is not None or isinstance(df.index, pd.MultiIndex)
+    # 先写临时文件再改名，翻页时不会读到写了一半的文件
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        df.to_csv(tmp, index=keep_index)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    prune_results(os.path.dirname(path), keep=path)
+    return path
+
+
+def render_page(title: str, page_df: pd.DataFrame, total_rows: int, start: int,
+                output_format: str = "table", max_bytes: Optional[int] = None,
+                result_file: Optional[str] = None, full_result: Optional[pd.DataFrame] = None,
+                result_dir: Optional[str] = None, result_key: Optional[str] = None) -> str:
+    """
+    渲染一页结果
+
+    Args:
+        title: 结果标题，如"筛选结果"
+        page_df: 当前页的数据
+        total_rows: 结果总行数
+        start: 当前页的起始行
+        output_format: table, csv, json
+        max_bytes: 输出字节上限
+        result_file: 完整结果文件路径（已写好的，例如流式执行的结果）
+        full_result: 计算出的全部结果；输出没有完整显示它（分页或字节截断）时写入文件
+        result_dir: full_result写入的目录
+        result_key: full_result的键，同一结果翻页时复用已写入的文件
+
+    Returns:
+        带行数说明的结果文本
+    """
+    max_bytes = max_bytes or max_output_bytes()
+    end = start + len(page_df)
+    body, truncated = truncate_to_bytes(format_frame(page_df, output_format), max_bytes)
+    saved_rows = total_rows
+    if result_file is None and full_result is not None and (truncated or len(page_df) < len(full_result)):
+        result_file = write_result(full_result, result_dir, result_key)
+        saved_rows = len(full_result)
+
+    # 标题自带括号说明时合并到同一个括号里
+    header = f"{title[:-1]}，共{total_rows}行" if title.endswith("）") else f"{title}（共{total_rows}行"
+    if total_rows > 0 and (start > 0 or end < total_rows):
+        header += f"，显示第{start + 1}-{end}行"
+    header += "）"
+    if result_file:
+        if saved_rows < total_rows:
+            header += f"\n前{saved_rows}行结果已写入: {result_file}"
+        else:
+            header += f"\n完整结果已写入: {result_file}"
+
+    if truncated:
+        body += f"\n{TRUNCATION_MARKER}"
+    elif end < total_rows:
+        body += f"\n...（还有{total_rows - end}行，可通过page/offset参数查看）"
+    return f"{header}:\n{body}"
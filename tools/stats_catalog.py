@@ -0,0 +1,219 @@
+"""
+数据集统计目录
+把每个文件的画像（类型、行数、最值、空值数、去重数估计、样本值、describe统计）
+按内容指纹保存在SQLite中，同一份数据在不同会话中无需重复计算
+"""
+import io
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from tools.columnar_store import content_fingerprint
+from tools.streaming_ops import RunningStats, update_numeric_stats, describe_from_stats
+
+
+# 默认目录文件，可通过环境变量 PANDAS_STATS_CATALOG 覆盖
+DEFAULT_CATALOG_PATH = os.path.join(os.path.expanduser("~"), ".cache", "data_analyzer", "stats_catalog.sqlite")
+
+# 去重数估计（KMV）保留的最小哈希个数
+DISTINCT_SKETCH_SIZE = 1024
+
+# 每列保留的样本值个数
+SAMPLE_VALUES = 5
+
+
+class ProfileBuilder:
+    """逐块累积数据文件的画像，各项统计量都可以跨块合并"""
+
+    def __init__(self):
+        self.row_count = 0
+        self.columns: List[str] = []
+        self.dtypes: Dict[str, str] = {}
+        self.null_counts: Dict[str, int] = {}
+        self.samples: Dict[str, List[str]] = {}
+        self._stats: Dict[str, RunningStats] = {}
+        self._minmax: Dict[str, List[Any]] = {}
+        self._sketches: Dict[str, np.ndarray] = {}
+
+    def update(self, chunk: pd.DataFrame):
+        """合并一块数据"""
+        if not self.columns:
+            self.columns = [str(c) for c in chunk.columns]
+        self.row_count += len(chunk)
+        update_numeric_stats(self._stats, chunk)
+
+        for column in chunk.columns:
+            series = chunk[column]
+            self.dtypes[column] = _merge_dtype(self.dtypes.get(column), series.dtype)
+            values = series.dropna()
+            self.null_counts[column] = self.null_counts.get(column, 0) + len(series) - len(values)
+            if values.empty:
+                continue
+
+            samples = self.samples.setdefault(column, [])
+            if len(samples) < SAMPLE_VALUES:
+                for value in values.unique()[:SAMPLE_VALUES]:
+                    if str(value) not in samples and len(samples) < SAMPLE_VALUES:
+                        samples.append(str(value))
+
+            if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+                low, high = values.min(), values.max()
+                current = self._minmax.get(column)
+                self._minmax[column] = [low, high] if current is None else \
+                    [min(current[0], low), max(current[1], high)]
+
+            # KMV草图：保留最小的k个哈希值
+            hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+            sketch = self._sketches.get(column)
+            merged = np.unique(hashes if sketch is None else np.concatenate([sketch, hashes]))
+            self._sketches[column] = merged[:DISTINCT_SKETCH_SIZE]
+
+    def result(self) -> Dict[str, Any]:
+        """生成画像字典（可JSON序列化）"""
+        describe = describe_from_stats(self._stats)
+        return {
+            "columns": self.columns,
+            "dtypes": dict(self.dtypes),
+            "row_count": self.row_count,
+            "null_counts": {k: int(v) for k, v in self.null_counts.items()},
+            "min": {k: _to_json_value(v[0]) for k, v in self._minmax.items()},
+            "max": {k: _to_json_value(v[1]) for k, v in self._minmax.items()},
+            "distinct": {k: _estimate_distinct(v) for k, v in self._sketches.items()},
+            "samples": dict(self.samples),
+            "describe": json.loads(describe.to_json(orient="split", double_precision=15)),
+        }
+
+
+def describe_from_profile(profile: Dict[str, Any], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """从画像还原describe统计表"""
+    describe = pd.read_json(io.StringIO(json.dumps(profile["describe"])), orient="split", convert_axes=False)
+    if columns is not None:
+        describe = describe[[c for c in columns if c in describe.columns]]
+    return describe
+
+
+class StatsCatalog:
+    """按内容指纹保存文件画像的SQLite目录"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        初始化目录
+
+        Args:
+            db_path: SQLite文件路径
+        """
+        self.db_path = db_path or os.getenv("PANDAS_STATS_CATALOG", DEFAULT_CATALOG_PATH)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "fingerprint TEXT PRIMARY KEY, source TEXT, profile TEXT, created TEXT)"
+        )
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        # 每次操作使用独立连接，多个线程和进程（例如并行画像）都可以安全访问
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                rows = conn.execute(sql, params).fetchall()
+            return rows
+        finally:
+            conn.close()
+
+    def get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """按指纹获取画像"""
+        rows = self._execute("SELECT profile FROM profiles WHERE fingerprint = ?", (fingerprint,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def put(self, fingerprint: str, file_path: str, profile: Dict[str, Any]):
+        """保存画像"""
+        self._execute(
+            "INSERT OR REPLACE INTO profiles (fingerprint, source, profile, created) VALUES (?, ?, ?, ?)",
+            (fingerprint, os.path.realpath(file_path), json.dumps(profile, ensure_ascii=False),
+             datetime.now().isoformat()),
+        )
+
+    def lookup_file(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """按文件当前内容获取画像"""
+        return self.get(content_fingerprint(file_path))
+
+    def store_file(self, file_path: str, profile: Dict[str, Any]):
+        """按文件当前内容保存画像"""
+        self.put(content_fingerprint(file_path), file_path, profile)
+
+    def remove(self, fingerprint: str):
+        """删除画像"""
+        self._execute("DELETE FROM profiles WHERE fingerprint = ?", (fingerprint,))
+
+    def clear(self):
+        """清空目录"""
+        self._execute("DELETE FROM profiles")
+
+
+def profile_frame(df: pd.DataFrame) -> Dict[str, Any]:
+    """为内存中的完整DataFrame生成画像，describe统计直接用精确值"""
+    builder = ProfileBuilder()
+    builder.update(df)
+    profile = builder.result()
+    if not df.select_dtypes(include="number").empty:
+        profile["describe"] = json.loads(df.describe().to_json(orient="split", double_precision=15))
+    return profile
+
+
+def lookup_profile(file_path: str) -> Optional[Dict[str, Any]]:
+    """从共享统计目录获取文件画像，目录不可用时返回None"""
+    try:
+        return get_stats_catalog().lookup_file(file_path)
+    except Exception as e:
+        print(f"警告：读取统计目录失败: {e}")
+        return None
+
+
+def store_profile(file_path: str, profile: Dict[str, Any]):
+    """把文件画像写入共享统计目录，失败时只打印警告"""
+    try:
+        get_stats_catalog().store_file(file_path, profile)
+    except Exception as e:
+        print(f"警告：写入统计目录失败: {e}")
+
+
+def _merge_dtype(current: Optional[str], dtype) -> str:
+    """合并不同分块推断出的类型"""
+    name = str(dtype)
+    if current is None or current == name:
+        return name
+    if current in ("int64", "float64") and name in ("int64", "float64"):
+        return "float64"
+    return "object"
+
+
+def _estimate_distinct(sketch: np.ndarray) -> int:
+    """由KMV草图估计去重数，哈希数不足k个时是精确值"""
+    if len(sketch) < DISTINCT_SKETCH_SIZE:
+        return int(len(sketch))
+    kth = float(sketch[-1]) / 2.0 ** 64
+    return int(round((DISTINCT_SKETCH_SIZE - 1) / kth))
+
+
+def _to_json_value(value: Any) -> Any:
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return float(value)
+    return str(value)
+
+
+_shared_catalog: Optional[StatsCatalog] = None
+_shared_catalog_lock = threading.Lock()
+
+
+def get_stats_catalog() -> StatsCatalog:
+    """获取进程内共享的统计目录"""
+    global _shared_catalog
+    with _shared_catalog_lock:
+        if _shared_catalog is None:
+            _shared_catalog = StatsCatalog()
+        return _shared_catalog
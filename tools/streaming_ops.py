@@ -0,0 +1,459 @@
+"""
+分块流式执行
+基于 read_csv(chunksize=...) 处理大于内存的CSV文件：
+筛选结果逐块写出，describe/groupby使用可合并的统计量，sort使用外部归并排序
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+# 超过该大小的文件自动使用流式执行，可通过环境变量 PANDAS_STREAMING_THRESHOLD 覆盖
+DEFAULT_STREAMING_THRESHOLD = 1024 ** 3
+
+# 每块行数，可通过环境变量 PANDAS_STREAMING_CHUNKSIZE 覆盖
+DEFAULT_CHUNKSIZE = 500_000
+
+# 近似分位数使用的样本容量
+QUANTILE_SAMPLE_SIZE = 100_000
+
+# 流式结果默认写入的目录，可通过环境变量 PANDAS_RESULT_DIR 覆盖
+DEFAULT_RESULT_DIR = os.path.join(tempfile.gettempdir(), "pandas_tool_results")
+
+# 结果目录最多保留的文件数和总字节数，超出时删除最久未使用的结果，
+# 可通过环境变量 PANDAS_RESULT_MAX_FILES / PANDAS_RESULT_MAX_BYTES 覆盖
+DEFAULT_RESULT_MAX_FILES = 200
+DEFAULT_RESULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def streaming_threshold() -> int:
+    """获取自动启用流式执行的文件大小阈值"""
+    return int(os.getenv("PANDAS_STREAMING_THRESHOLD", DEFAULT_STREAMING_THRESHOLD))
+
+
+def default_chunksize() -> int:
+    """获取默认的分块行数"""
+    return int(os.getenv("PANDAS_STREAMING_CHUNKSIZE", DEFAULT_CHUNKSIZE))
+
+
+def iter_chunks(file_path: str, columns: Optional[List[str]] = None,
+                chunksize: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    分块读取CSV
+
+    Args:
+        file_path: 文件路径
+        columns: 只读取这些列
+        chunksize: 每块行数
+
+    Yields:
+        DataFrame块
+    """
+    with pd.read_csv(file_path, usecols=columns, chunksize=chunksize or default_chunksize()) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def result_key(file_path: str, operation: str, *params) -> str:
+    """
+    结果文件的键：源文件身份（真实路径、大小、修改时间）+ 操作 + 参数，
+    同一结果翻页时复用同一个文件，源文件修改后生成新文件
+
+    Args:
+        file_path: 源文件路径
+        operation: 操作名
+        *params: 影响结果的参数（查询、列、排序方向等），必须可以转为字符串
+
+    Returns:
+        十六进制键
+    """
+    path = os.path.realpath(file_path)
+    stat = os.stat(path)
+    payload = json.dumps([path, stat.st_size, stat.st_mtime_ns, operation, *params],
+                         default=str, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def result_path(result_dir: Optional[str] = None, suffix: str = ".csv", key: Optional[str] = None) -> str:
+    """结果文件路径：给出key时路径固定（见 result_key），否则生成一个新路径"""
+    directory = result_dir or os.getenv("PANDAS_RESULT_DIR") or DEFAULT_RESULT_DIR
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"result_{key or uuid.uuid4().hex[:12]}{suffix}")
+
+
+def prune_results(result_dir: Optional[str] = None, keep: Optional[str] = None):
+    """
+    结果目录超过文件数或总字节数上限时，按最近使用时间删除最旧的结果
+
+    Args:
+        result_dir: 结果目录
+        keep: 不删除的文件（刚写入或正在返回的结果）
+    """
+    directory = result_dir or os.getenv("PANDAS_RESULT_DIR") or DEFAULT_RESULT_DIR
+    max_files = int(os.getenv("PANDAS_RESULT_MAX_FILES", DEFAULT_RESULT_MAX_FILES))
+    max_bytes = int(os.getenv("PANDAS_RESULT_MAX_BYTES", DEFAULT_RESULT_MAX_BYTES))
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.startswith("result_") and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    count = len(entries)
+    for _, size, path in entries:
+        if count <= max_files and total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        _result_rows.pop(path, None)
+        count -= 1
+        total -= size
+
+
+def touch_result(path: str):
+    """标记结果刚被使用，清理时最后删除"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+# 本进程写出的流式结果文件的总行数，同一结果翻页时不重新扫描源文件
+_result_rows: Dict[str, int] = {}
+_result_lock = threading.Lock()
+
+
+def stream_to_result(output_path: str, preview_rows: int,
+                     run: Callable[[str], Tuple[int, pd.DataFrame]]) -> Tuple[int, pd.DataFrame]:
+    """
+    流式计算结果并写入固定路径；本进程已写过同一结果时直接读取文件开头作为预览
+
+    Args:
+        output_path: 结果文件路径（见 result_path 的key参数）
+        preview_rows: 预览行数
+        run: 流式计算函数，签名为 run(输出路径)，返回(总行数, 预览)
+
+    Returns:
+        (总行数, 预览DataFrame)
+    """
+    with _result_lock:
+        total = _result_rows.get(output_path)
+    if total is not None and os.path.exists(output_path):
+        touch_result(output_path)
+        preview = pd.read_csv(output_path, nrows=preview_rows) if total else pd.DataFrame()
+        return total, preview
+    # 先写临时文件再改名，中断的计算不会留下不完整的结果
+    tmp = os.path.join(os.path.dirname(output_path), f".{os.path.basename(output_path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        total, preview = run(tmp)
+        if os.path.exists(tmp):
+            os.replace(tmp, output_path)
+        else:
+            pd.DataFrame().to_csv(output_path, index=False)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    with _result_lock:
+        _result_rows[output_path] = total
+    prune_results(os.path.dirname(output_path), keep=output_path)
+    return total, preview
+
+
+class _ResultWriter:
+    """把结果块追加写入CSV，同时保留前若干行作为预览"""
+
+    def __init__(self, output_path: str, preview_rows: int):
+        self.output_path = output_path
+        self.preview_rows = preview_rows
+        self.total_rows = 0
+        self._preview: List[pd.DataFrame] = []
+        self._preview_count = 0
+        self._header_written = False
+
+    def write(self, block: pd.DataFrame):
+        if block.empty and self._header_written:
+            return
+        block.to_csv(self.output_path, mode='a' if self._header_written else 'w',
+                     header=not self._header_written, index=False)
+        self._header_written = True
+        self.total_rows += len(block)
+        if self._preview_count < self.preview_rows:
+            part = block.iloc[:self.preview_rows - self._preview_count]
+            self._preview.append(part)
+            self._preview_count += len(part)
+
+    def preview(self) -> pd.DataFrame:
+        return pd.concat(self._preview) if self._preview else pd.DataFrame()
+
+
+def stream_filter(file_path: str, query: str, output_path: str,
+                  columns: Optional[List[str]] = None, selected: Optional[List[str]] = None,
+                  chunksize: Optional[int] = None, preview_rows: int = 100) -> Tuple[int, pd.DataFrame]:
+    """
+    流式筛选：逐块执行query，把匹配行写入输出文件
+
+    Args:
+        file_path: 文件路径
+        query: df.query表达式
+        output_path: 完整结果写入的CSV路径
+        columns: 需要读取的列
+        selected: 输出的列（为空时输出全部读取的列）
+        chunksize: 每块行数
+        preview_rows: 返回的预览行数
+
+    Returns:
+        (匹配总行数, 预览DataFrame)
+    """
+    writer = _ResultWriter(output_path, preview_rows)
+    for chunk in iter_chunks(file_path, columns, chunksize):
+        matched = chunk.query(query) if query else chunk
+        writer.write(matched[selected] if selected else matched)
+    return writer.total_rows, writer.preview()
+
+
+class RunningStats:
+    """
+    可合并的单列统计量：count/mean/方差（Chan并行算法）/min/max，
+    以及基于bottom-k随机采样的近似分位数
+    """
+
+    def __init__(self, sample_size: int = QUANTILE_SAMPLE_SIZE, seed: int = 0):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.nan
+        self.max = np.nan
+        self.sample_size = sample_size
+        self._rng = np.random.default_rng(seed)
+        self._sample = np.empty(0)
+        self._priorities = np.empty(0)
+
+    def update(self, values: np.ndarray):
+        """合并一批数值（NaN会被忽略）"""
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if n == 0:
+            return
+        other = RunningStats(self.sample_size)
+        other.count = n
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        other._sample = values
+        other._priorities = self._rng.random(n)
+        self.merge(other)
+
+    def merge(self, other: "RunningStats"):
+        """合并另一个统计量"""
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        self.min = other.min if np.isnan(self.min) else min(self.min, other.min)
+        self.max = other.max if np.isnan(self.max) else max(self.max, other.max)
+
+        # 保留随机优先级最小的k个值，得到全部数据的均匀样本
+        sample = np.concatenate([self._sample, other._sample])
+        priorities = np.concatenate([self._priorities, other._priorities])
+        if len(sample) > self.sample_size:
+            keep = np.argpartition(priorities, self.sample_size)[:self.sample_size]
+            sample, priorities = sample[keep], priorities[keep]
+        self._sample, self._priorities = sample, priorities
+
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan
+
+    def quantile(self, q: float) -> float:
+        """近似分位数；数据量不超过样本容量时是精确值"""
+        return float(np.quantile(self._sample, q)) if len(self._sample) else np.nan
+
+
+def stream_describe(file_path: str, columns: Optional[List[str]] = None,
+                    chunksize: Optional[int] = None) -> pd.DataFrame:
+    """
+    单遍流式计算describe，输出格式与 DataFrame.describe() 一致（数值列）
+
+    Args:
+        file_path: 文件路径
+        columns: 需要读取的列
+        chunksize: 每块行数
+
+    Returns:
+        统计信息DataFrame
+    """
+    stats: Dict[str, RunningStats] = {}
+    for chunk in iter_chunks(file_path, columns, chunksize):
+        update_numeric_stats(stats, chunk)
+    return describe_from_stats(stats)
+
+
+def update_numeric_stats(stats: Dict[str, RunningStats], chunk: pd.DataFrame):
+    """用一块数据更新各数值列的统计量"""
+    numeric = chunk.select_dtypes(include="number")
+    for column in numeric.columns:
+        stats.setdefault(column, RunningStats()).update(numeric[column].to_numpy(dtype=float))
+
+
+def describe_from_stats(stats: Dict[str, RunningStats]) -> pd.DataFrame:
+    """把各列的统计量整理成 DataFrame.describe() 的格式"""
+    percentiles = [0.25, 0.5, 0.75]
+    index = ["count", "mean", "std", "min"] + [f"{int(p * 100)}%" for p in percentiles] + ["max"]
+    data = {}
+    for column, s in stats.items():
+        data[column] = [float(s.count), s.mean if s.count else np.nan, s.std(), s.min] \
+            + [s.quantile(p) for p in percentiles] + [s.max]
+    return pd.DataFrame(data, index=index)
+
+
+def stream_groupby_mean(file_path: str, keys: List[str], columns: Optional[List[str]] = None,
+                        chunksize: Optional[int] = None) -> pd.DataFrame:
+    """
+    流式分组求均值：每块计算部分和与计数，合并后再相除
+
+    Args:
+        file_path: 文件路径
+        keys: 分组列
+        columns: 需要读取的列
+        chunksize: 每块行数
+
+    Returns:
+        与 df.groupby(keys).mean() 一致的结果
+    """
+    sums: Optional[pd.DataFrame] = None
+    counts: Optional[pd.DataFrame] = None
+    for chunk in iter_chunks(file_path, columns, chunksize):
+        values = [c for c in chunk.columns if c not in keys]
+        non_numeric = [c for c in values if not pd.api.types.is_numeric_dtype(chunk[c])]
+        if non_numeric:
+            raise TypeError(f"无法对非数值列求均值: {', '.join(non_numeric)}")
+        grouped = chunk.groupby(keys)[values]
+        chunk_sums, chunk_counts = grouped.sum(), grouped.count()
+        if sums is None:
+            sums, counts = chunk_sums, chunk_counts
+        else:
+            sums = sums.add(chunk_sums, fill_value=0)
+            counts = counts.add(chunk_counts, fill_value=0)
+    if sums is None:
+        return pd.DataFrame()
+    result = sums / counts.where(counts > 0)
+    result = result.sort_index()
+    if len(keys) == 1:
+        result.index.name = keys[0]
+    return result
+
+
+def external_sort(file_path: str, by: str, ascending: bool, output_path: str,
+                  columns: Optional[List[str]] = None, selected: Optional[List[str]] = None,
+                  chunksize: Optional[int] = None, preview_rows: int = 100,
+                  spill_dir: Optional[str] = None) -> Tuple[int, pd.DataFrame]:
+    """
+    外部归并排序：每块排序后写成有序段落盘，再按块做多路归并写出结果
+
+    Args:
+        file_path: 文件路径
+        by: 排序列
+        ascending: 是否升序
+        output_path: 完整结果写入的CSV路径
+        columns: 需要读取的列
+        selected: 输出的列
+        chunksize: 每块行数
+        preview_rows: 返回的预览行数
+        spill_dir: 有序段的临时目录
+
+    Returns:
+        (总行数, 预览DataFrame)
+    """
+    chunksize = chunksize or default_chunksize()
+    # 归并时每个有序段一次只读入一小块
+    block_rows = max(1, chunksize // 8)
+    work_dir = tempfile.mkdtemp(prefix="external_sort_", dir=spill_dir)
+    try:
+        runs = []
+        null_run = _SpillRun(os.path.join(work_dir, "nulls.pkl"))
+        for i, chunk in enumerate(iter_chunks(file_path, columns, chunksize)):
+            nulls = chunk[by].isna()
+            if nulls.any():
+                null_run.append(chunk[nulls])
+            ordered = chunk[~nulls].sort_values(by=by, ascending=ascending, kind="mergesort")
+            run = _SpillRun(os.path.join(work_dir, f"run_{i}.pkl"))
+            for start in range(0, len(ordered), block_rows):
+                run.append(ordered.iloc[start:start + block_rows])
+            runs.append(run)
+
+        writer = _ResultWriter(output_path, preview_rows)
+        for block in _merge_runs(runs, by, ascending):
+            writer.write(block[selected] if selected else block)
+        # 与sort_values一致，空值排在最后
+        for block in null_run.blocks():
+            writer.write(block[selected] if selected else block)
+        return writer.total_rows, writer.preview()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class _SpillRun:
+    """落盘的有序段，由若干个连续pickle的小块组成"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+
+    def append(self, block: pd.DataFrame):
+        with open(self.path, 'ab') as f:
+            pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.count += 1
+
+    def blocks(self) -> Iterator[pd.DataFrame]:
+        if self.count == 0:
+            return
+        with open(self.path, 'rb') as f:
+            for _ in range(self.count):
+                yield pickle.load(f)
+
+
+def _merge_runs(runs: List[_SpillRun], by: str, ascending: bool) -> Iterator[pd.DataFrame]:
+    """
+    按块多路归并
+
+    每个有序段保留当前块；所有当前块末尾值中最靠前的一个是安全边界，
+    各块中不越过边界的行都可以输出，随后补充耗尽的段。
+    """
+    iterators = [run.blocks() for run in runs]
+    current: List[Optional[pd.DataFrame]] = [next(it, None) for it in iterators]
+
+    while True:
+        active = [i for i, block in enumerate(current) if block is not None]
+        if not active:
+            return
+        lasts = [current[i][by].iloc[-1] for i in active]
+        frontier = min(lasts) if ascending else max(lasts)
+
+        ready = []
+        for i in active:
+            block = current[i]
+            within = block[by] <= frontier if ascending else block[by] >= frontier
+            ready.append(block[within])
+            rest = block[~within]
+            current[i] = rest if not rest.empty else next(iterators[i], None)
+        merged = pd.concat(ready)
+        yield merged.sort_values(by=by, ascending=ascending, kind="mergesort")
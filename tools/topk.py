@@ -0,0 +1,74 @@
+"""
+Top-k选择
+用部分选择（nlargest/nsmallest）代替全量排序，只取排序后的前k行，
+分块读取时在各块之间只保留k行候选，内存为O(k)
+"""
+from typing import List, Optional, Tuple
+import pandas as pd
+from tools.streaming_ops import iter_chunks
+
+
+def top_k(df: pd.DataFrame, by: List[str], k: int, ascending: bool = False) -> pd.DataFrame:
+    """
+    取按by排序后的前k行，结果与 df.sort_values(by, ascending).head(k) 一致
+
+    数值列使用nlargest/nsmallest做部分选择，后面的列用于打破并列；
+    含非数值列时退化为全量排序。
+
+    Args:
+        df: 数据
+        by: 排序列，多列时依次打破并列
+        k: 行数
+        ascending: True取最小的k行，False取最大的k行
+
+    Returns:
+        前k行，已按顺序排列
+    """
+    if k <= 0:
+        return df.iloc[:0]
+    if not all(pd.api.types.is_numeric_dtype(df[column]) for column in by) or \
+            any(pd.api.types.is_bool_dtype(df[column]) for column in by):
+        return df.sort_values(by=by, ascending=ascending, kind="mergesort").head(k)
+
+    nulls = df[by].isna()
+    if nulls[by[1:]].any().any():
+        # 后面的列有空值时，这些行可能排在前k行中间，退化为全量排序
+        return df.sort_values(by=by, ascending=ascending, kind="mergesort").head(k)
+
+    # 多列的nlargest/nsmallest在k超过非空行数时会混入空值行，只在非空行上做部分选择
+    missing = nulls[by[0]]
+    present = df[~missing]
+    result = present.nsmallest(k, by) if ascending else present.nlargest(k, by)
+    if len(result) < k and missing.any():
+        # 按sort_values的规则把空值行排在最后补足
+        rest = df[missing].sort_values(by=by, ascending=ascending, kind="mergesort")
+        result = pd.concat([result, rest.head(k - len(result))])
+    return result
+
+
+def stream_top_k(file_path: str, by: List[str], k: int, ascending: bool = False,
+                 columns: Optional[List[str]] = None,
+                 chunksize: Optional[int] = None) -> Tuple[int, pd.DataFrame]:
+    """
+    分块读取文件并取前k行
+
+    每块先取块内前k行，再与已有的k行候选合并重新选择，相当于容量为k的有界堆。
+
+    Args:
+        file_path: 文件路径
+        by: 排序列
+        k: 行数
+        ascending: True取最小的k行，False取最大的k行
+        columns: 需要读取的列
+        chunksize: 每块行数
+
+    Returns:
+        (扫描的总行数, 前k行)
+    """
+    total_rows = 0
+    candidates: Optional[pd.DataFrame] = None
+    for chunk in iter_chunks(file_path, columns, chunksize):
+        total_rows += len(chunk)
+        best = top_k(chunk, by, k, ascending)
+        candidates = best if candidates is None else top_k(pd.concat([candidates, best]), by, k, ascending)
+    return total_rows, candidates if candidates is not None else pd.DataFrame(columns=columns)